@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+from pytest import fixture
+
+from benchmarks import payloads
+from custom_components.trakt_tv.configuration import Configuration
+from custom_components.trakt_tv.const import DOMAIN
+from custom_components.trakt_tv.models.media import Medias, Movie, Show
+
+# The sizes of the collections, from a small calendar to a huge watched history
+SIZES = [10, 100, 1000, 10000]
+
+
+def rounds(size: int) -> int:
+    """The number of rounds of a benchmark, fewer for the largest collections."""
+    return max(5, 20000 // size)
+
+
+@fixture(params=SIZES, ids=lambda size: f"{size}")
+def size(request):
+    return request.param
+
+
+@fixture
+def movie_items(size):
+    return payloads.many(payloads.list_item, size, "movie")
+
+
+@fixture
+def show_items(size):
+    return payloads.many(payloads.calendar_episode, size)
+
+
+def completed_movies(size: int):
+    """Build the movies of a list, completed by TMDB like the sensors display them."""
+    movies = []
+    for index, item in enumerate(payloads.many(payloads.list_item, size, "movie")):
+        movie = Movie.from_trakt(item)
+        movie.complete(payloads.tmdb_movie(index), movie.missing_fields("en"))
+        movies.append(movie)
+    return movies
+
+
+def completed_shows(size: int):
+    shows = []
+    for index, item in enumerate(payloads.many(payloads.list_item, size, "show")):
+        show = Show.from_trakt(item)
+        show.complete(payloads.tmdb_show(index), show.missing_fields("en"))
+        shows.append(show)
+    return shows
+
+
+@fixture
+def movies(size):
+    return completed_movies(size)
+
+
+@fixture
+def shows(size):
+    return completed_shows(size)
+
+
+@fixture
+def hass():
+    configuration = Configuration.compile(
+        {
+            "sensors": {
+                "watchlist": {
+                    "movie": {
+                        "max_medias": 20,
+                        "sort_by": "rating",
+                        "sort_order": "desc",
+                    }
+                }
+            }
+        }
+    )
+    # The account of the sensors, not traced
+    account = {"instances": {"api": SimpleNamespace(tracer=None)}}
+    return SimpleNamespace(
+        data={DOMAIN: {"configuration": configuration, "benchmark": account}}
+    )
+
+
+def fresh(medias):
+    """A new collection of the same medias, without any sort already computed."""
+    return Medias(list(medias.items))
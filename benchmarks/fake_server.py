@@ -0,0 +1,402 @@
+"""
+A fake Trakt and TMDB server, to run whole refreshes offline.
+
+The server answers the endpoints used by the integration with the payloads of a
+synthetic library, after a configurable latency. It enforces the rate limits of the
+APIs with real 429 responses and can inject faults, so the retries, the cache and the
+scheduling behave like against the real APIs.
+"""
+
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from aiohttp import ClientSession, web
+
+from benchmarks import payloads
+from custom_components.trakt_tv.apis.middlewares import (
+    HttpRequest,
+    HttpResponse,
+    SessionTransport,
+)
+from custom_components.trakt_tv.const import API_HOST, TMDB_HOST
+from custom_components.trakt_tv.models.cache import endpoint_family
+
+# The documented limits: 1000 GET calls every 5 minutes per Trakt account, TMDB
+# allows around 50 calls per second.
+TRAKT_RATE_LIMIT = (1000, 300)
+TMDB_RATE_LIMIT = (50, 1)
+
+# The status codes of the injected errors
+FAULT_STATUSES = (500, 502, 503, 504)
+
+
+@dataclass
+class Library:
+    """The size of a synthetic account."""
+
+    shows: int = 100
+    movies: int = 100
+    list_items: int = 100
+    watchlist: int = 50
+    # The medias airing each day, in the calendars
+    calendar_per_day: int = 3
+
+
+@dataclass
+class Faults:
+    """
+    The faults injected in the responses.
+
+    :param rate: The probability of a request to fail
+    :param kinds: The faults drawn, "error" for a 5xx and "disconnect" for a
+                  connection closed without response
+    """
+
+    rate: float = 0.0
+    kinds: Tuple[str, ...] = ("error", "disconnect")
+
+
+class RateLimiter:
+    """A sliding window of the requests of each client."""
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.requests: Dict[str, Deque[float]] = defaultdict(deque)
+
+    def acquire(self, client: str) -> Optional[int]:
+        """
+        Count a request of a client.
+
+        :return: None if the request is allowed, the seconds to wait if not
+        """
+        now = time.monotonic()
+        requests = self.requests[client]
+        while requests and requests[0] <= now - self.period:
+            requests.popleft()
+
+        if len(requests) >= self.limit:
+            return max(1, math.ceil(requests[0] + self.period - now))
+
+        requests.append(now)
+        return None
+
+
+class FakeServer:
+    """
+    Serve the Trakt API under /trakt and the TMDB API under /tmdb.
+
+    :param library: The account the payloads are generated from
+    :param latency: The mean time to answer a request, in seconds
+    :param jitter: The maximum deviation of the latency, in seconds
+    :param faults: The faults injected in the responses
+    :param trakt_rate_limit: The number of Trakt requests allowed over a period
+    :param tmdb_rate_limit: The number of TMDB requests allowed over a period
+    :param seed: The seed of the latencies and faults, for reproducible runs
+    """
+
+    def __init__(
+        self,
+        library: Optional[Library] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        faults: Optional[Faults] = None,
+        trakt_rate_limit: Tuple[int, float] = TRAKT_RATE_LIMIT,
+        tmdb_rate_limit: Tuple[int, float] = TMDB_RATE_LIMIT,
+        seed: int = 0,
+    ):
+        self.library = library or Library()
+        self.latency = latency
+        self.jitter = jitter
+        self.faults = faults or Faults()
+        self.limiters = {
+            "trakt": RateLimiter(*trakt_rate_limit),
+            "tmdb": RateLimiter(*tmdb_rate_limit),
+        }
+        self.random = random.Random(seed)
+        self.requests: Counter = Counter()
+        self.statuses: Counter = Counter()
+        self.runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start to serve, on a free port by default, and return the url."""
+        app = web.Application()
+        app.router.add_get("/trakt/{path:.*}", self.trakt)
+        app.router.add_get("/tmdb/{path:.*}", self.tmdb)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        port = self.runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def __aenter__(self) -> "FakeServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+    @property
+    def hosts(self) -> Dict[str, str]:
+        """The real hosts and the urls serving them."""
+        return {API_HOST: f"{self.url}/trakt", TMDB_HOST: f"{self.url}/tmdb"}
+
+    def reset(self):
+        """Forget the counted requests, between two runs."""
+        self.requests.clear()
+        self.statuses.clear()
+
+    async def trakt(self, request: web.Request) -> web.StreamResponse:
+        path = request.match_info["path"]
+        client = request.headers.get("Authorization", request.remote)
+        return await self.answer(
+            request, "trakt", endpoint_family(path), client, self.trakt_payload
+        )
+
+    async def tmdb(self, request: web.Request) -> web.StreamResponse:
+        path = request.match_info["path"]
+        family = "tmdb_find" if path.startswith("3/find/") else "tmdb"
+        client = request.query.get("api_key", request.remote)
+        return await self.answer(request, "tmdb", family, client, self.tmdb_payload)
+
+    async def answer(self, request, api, family, client, payload):
+        self.requests[f"{api}.{family}"] += 1
+
+        if self.latency or self.jitter:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            await asyncio.sleep(max(0.0, delay))
+
+        limiter = self.limiters[api]
+        if (wait_time := limiter.acquire(client)) is not None:
+            return self.respond(
+                429, {"error": "rate limited"}, self.limit_headers(limiter, wait_time)
+            )
+
+        if self.faults.rate and self.random.random() < self.faults.rate:
+            if self.random.choice(self.faults.kinds) == "disconnect":
+                self.statuses["disconnect"] += 1
+                request.transport.close()
+                return web.Response()
+            status = self.random.choice(FAULT_STATUSES)
+            return self.respond(status, {"error": "injected fault"})
+
+        data = payload(request.match_info["path"], request.query)
+        if data is None:
+            return self.respond(404, {"error": "not found"})
+        return self.respond(200, data)
+
+    def respond(self, status: int, data: Any, headers=None) -> web.Response:
+        self.statuses[status] += 1
+        return web.Response(
+            status=status,
+            body=json.dumps(data).encode(),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    @staticmethod
+    def limit_headers(limiter: RateLimiter, wait_time: int) -> Dict[str, str]:
+        until = datetime.now(timezone.utc) + timedelta(seconds=wait_time)
+        limit = {
+            "name": "AUTHED_API_GET_LIMIT",
+            "period": limiter.period,
+            "limit": limiter.limit,
+            "remaining": 0,
+            "until": until.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        return {"Retry-After": str(wait_time), "X-Ratelimit": json.dumps(limit)}
+
+    def trakt_payload(self, path: str, query) -> Any:
+        library = self.library
+        parts = path.split("/")
+        limit = int(query.get("limit", 10))
+
+        if parts[0] == "calendars":
+            return self.calendar(parts)
+        if parts[0] == "users" and parts[1] == "hidden":
+            return []
+        if path == "sync/watched/shows":
+            return payloads.many(payloads.watched_show, library.shows)
+        if path == "sync/watched/movies":
+            return payloads.many(payloads.watched_movie, library.movies)
+        if path == "sync/collection/shows":
+            return payloads.many(payloads.watched_show, library.shows // 2)
+        if path == "sync/collection/movies":
+            return payloads.many(payloads.watched_movie, library.movies // 2)
+        if parts[0] == "shows" and parts[2:] == ["progress", "watched"]:
+            return payloads.progress(int(parts[1]) - 1)
+        if parts[0] == "shows" and len(parts) == 6 and parts[2] == "seasons":
+            return payloads.episode(int(parts[1]) - 1, int(parts[3]), int(parts[5]))
+        if path == "users/me/stats":
+            return self.stats()
+        if parts[1:2] == ["anticipated"]:
+            kind = "movie" if parts[0] == "movies" else "show"
+            return [
+                {"list_count": 1000 - index, kind: getattr(payloads, kind)(index)}
+                for index in range(limit)
+            ]
+        if parts[0] == "recommendations":
+            generator = payloads.movie if parts[1] == "movies" else payloads.show
+            return payloads.many(generator, limit)
+        if parts[:3] == ["users", "me", "watchlist"] and len(parts) == 5:
+            kind = "movie" if parts[3] == "movies" else "show"
+            return payloads.many(payloads.list_item, library.watchlist, kind)
+        if "lists" in parts or parts[:3] in (
+            ["users", "me", "watchlist"],
+            ["users", "me", "favorites"],
+        ):
+            return self.list_items(parts[-1])
+        return None
+
+    def calendar(self, parts) -> Any:
+        # calendars/{my,all}/{path}/{from_date}/{days}, the path can have two parts
+        days = int(parts[-1])
+        start = datetime.strptime(parts[-2], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        is_movie = parts[2] in ("movies", "dvd")
+        offset = (start - payloads.START).days * self.library.calendar_per_day
+
+        items = []
+        for day in range(days):
+            for number in range(self.library.calendar_per_day):
+                index = offset + day * self.library.calendar_per_day + number
+                aired = start + timedelta(days=day, hours=number)
+                if is_movie:
+                    item = payloads.calendar_movie(index)
+                    item["released"] = aired.strftime("%Y-%m-%d")
+                else:
+                    item = payloads.calendar_episode(index)
+                    item["first_aired"] = aired.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                items.append(item)
+
+        # The new shows and the premieres are filtered on the type of their episode
+        if parts[3:4] == ["new"]:
+            return [
+                i for i in items if i["episode"]["episode_type"] == "series_premiere"
+            ]
+        if parts[3:4] == ["premieres"]:
+            return [
+                i for i in items if i["episode"]["episode_type"].endswith("premiere")
+            ]
+        return items
+
+    def list_items(self, media_type: str) -> Any:
+        # The lists are filtered by media type, or mix the movies and the shows
+        if media_type in ("movie", "show", "episode"):
+            kinds = (media_type,)
+        else:
+            kinds = ("movie", "show")
+        return [
+            payloads.list_item(index, kinds[index % len(kinds)])
+            for index in range(self.library.list_items)
+        ]
+
+    def stats(self) -> Any:
+        library = self.library
+        return {
+            "movies": {"plays": library.movies * 2, "watched": library.movies},
+            "shows": {"watched": library.shows, "collected": library.shows // 2},
+            "episodes": {"plays": library.shows * 30, "watched": library.shows * 28},
+            "ratings": {"total": 10, "distribution": {"10": 5, "9": 5}},
+        }
+
+    def tmdb_payload(self, path: str, query) -> Any:
+        parts = path.split("/")
+        if parts[1] == "find":
+            # The external ids are the ones of the payloads, see payloads.ids
+            if query.get("external_source") == "imdb_id":
+                index = int(parts[2][2:]) - 1000000
+            else:
+                index = int(parts[2]) - 70000
+            result = [{"id": 50000 + index}]
+            return {"movie_results": result, "tv_results": result}
+
+        index = int(parts[2]) - 50000
+        if parts[3:] == ["videos"]:
+            return payloads.tmdb_videos(index)
+        data = (
+            payloads.tmdb_movie(index)
+            if parts[1] == "movie"
+            else (payloads.tmdb_show(index))
+        )
+        if "videos" not in query.get("append_to_response", ""):
+            data.pop("videos")
+        return data
+
+
+class RedirectTransport(SessionTransport):
+    """Send the requests to the fake server instead of the real hosts."""
+
+    def __init__(self, session: ClientSession, hosts: Dict[str, str]):
+        super().__init__(session)
+        self.hosts = hosts
+
+    async def __call__(self, request: HttpRequest):
+        host = self.hosts.get(request.host, request.host)
+        return await super().__call__(replace(request, host=host))
+
+
+class RecordingTransport:
+    """
+    Answer the requests with the payloads of a fake server without any socket, and
+    record the urls requested.
+
+    The latency, the rate limits and the faults of the server aren't applied.
+    """
+
+    def __init__(self, server: Optional[FakeServer] = None):
+        self.server = server or FakeServer()
+        self.requests: List[Tuple[str, str]] = []
+
+    def count(self, api: Optional[str] = None, family: Optional[str] = None) -> int:
+        """Count the requests recorded, of an api ("trakt" or "tmdb") and a family."""
+        return sum(
+            1
+            for host, url in self.requests
+            if (api is None or api == self.api(host))
+            and (family is None or family == self.family(host, url))
+        )
+
+    def reset(self):
+        self.requests.clear()
+
+    @staticmethod
+    def api(host: str) -> str:
+        return "tmdb" if host == TMDB_HOST else "trakt"
+
+    @staticmethod
+    def family(host: str, url: str) -> str:
+        if host == TMDB_HOST:
+            return "tmdb_find" if url.startswith("3/find/") else "tmdb"
+        return endpoint_family(url)
+
+    async def __call__(self, request: HttpRequest) -> HttpResponse:
+        self.requests.append((request.host, request.url))
+
+        url = urlsplit(request.url)
+        query = {**dict(parse_qsl(url.query)), **request.params}
+        if self.api(request.host) == "tmdb":
+            data = self.server.tmdb_payload(url.path, query)
+        else:
+            data = self.server.trakt_payload(url.path, query)
+
+        if data is None:
+            return HttpResponse(status=404, headers={}, body=b"{}")
+        return HttpResponse(status=200, headers={}, body=json.dumps(data).encode())
@@ -0,0 +1,271 @@
+"""
+Generate realistic Trakt and TMDB payloads, shaped like the responses of the API with
+the extended information.
+
+The payloads are deterministic: the same index always gives the same payload.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+GENRES = [
+    "action",
+    "adventure",
+    "comedy",
+    "crime",
+    "drama",
+    "fantasy",
+    "horror",
+    "science-fiction",
+    "thriller",
+]
+NETWORKS = ["HBO", "Netflix", "AMC", "BBC One", "Apple TV+", "Disney+"]
+LANGUAGES = ["en", "fr", "de", "es", "it", "ja", "ko", "pt"]
+START = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+
+def date(index: int, days: int = 0) -> datetime:
+    return START + timedelta(days=(index * 37) % 3650 + days, hours=index % 24)
+
+
+def timestamp(index: int, days: int = 0) -> str:
+    return date(index, days).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def ids(index: int) -> Dict[str, Any]:
+    return {
+        "trakt": index + 1,
+        "slug": f"media-{index + 1}",
+        "tvdb": 70000 + index,
+        "imdb": f"tt{1000000 + index}",
+        "tmdb": 50000 + index,
+        "tvrage": None,
+    }
+
+
+def images(index: int, kind: str) -> Dict[str, List[str]]:
+    path = f"media.trakt.tv/images/{kind}/{index:09d}"
+    return {
+        "poster": [f"{path}/posters/medium/{index:x}.jpg.webp"],
+        "fanart": [f"{path}/fanarts/medium/{index:x}.jpg.webp"],
+        "logo": [f"{path}/logos/medium/{index:x}.png.webp"],
+        "thumb": [f"{path}/thumbs/medium/{index:x}.jpg.webp"],
+    }
+
+
+def movie(index: int) -> Dict[str, Any]:
+    return {
+        "title": f"Movie {index}",
+        "year": date(index).year,
+        "ids": ids(index),
+        "tagline": "A tagline long enough to look like a real one.",
+        "overview": f"The overview of the movie {index}. " * 6,
+        "released": date(index).strftime("%Y-%m-%d"),
+        "runtime": 80 + index % 90,
+        "country": "us",
+        "trailer": f"https://youtube.com/watch?v=trailer{index}",
+        "homepage": f"https://example.com/movie-{index}",
+        "status": "released",
+        "rating": round(5 + (index % 50) / 10, 1),
+        "votes": index * 13 % 10000,
+        "comment_count": index % 40,
+        "updated_at": timestamp(index, 30),
+        "language": LANGUAGES[index % len(LANGUAGES)],
+        "available_translations": LANGUAGES[: 2 + index % 6],
+        "genres": GENRES[index % 4 : index % 4 + 1 + index % 3],
+        "certification": "PG-13",
+        "images": images(index, "movies"),
+    }
+
+
+def show(index: int) -> Dict[str, Any]:
+    return {
+        "title": f"Show {index}",
+        "year": date(index).year,
+        "ids": ids(index),
+        "overview": f"The overview of the show {index}. " * 6,
+        "first_aired": timestamp(index),
+        "airs": {"day": "Sunday", "time": "21:00", "timezone": "America/New_York"},
+        "runtime": 20 + index % 40,
+        "certification": "TV-MA",
+        "network": NETWORKS[index % len(NETWORKS)],
+        "country": "us",
+        "trailer": f"https://youtube.com/watch?v=trailer{index}",
+        "homepage": f"https://example.com/show-{index}",
+        "status": "returning series",
+        "rating": round(5 + (index % 50) / 10, 1),
+        "votes": index * 13 % 10000,
+        "comment_count": index % 40,
+        "updated_at": timestamp(index, 30),
+        "language": LANGUAGES[index % len(LANGUAGES)],
+        "available_translations": LANGUAGES[: 2 + index % 6],
+        "genres": GENRES[index % 4 : index % 4 + 1 + index % 3],
+        "aired_episodes": 10 + index % 90,
+        "images": images(index, "shows"),
+    }
+
+
+def episode(index: int, season: int = 1, number: int = 1) -> Dict[str, Any]:
+    return {
+        "season": season,
+        "number": number,
+        "title": f"Episode {number}",
+        "ids": {
+            "trakt": (index + 1) * 1000 + season * 100 + number,
+            "tvdb": None,
+            "imdb": None,
+            "tmdb": None,
+        },
+        "number_abs": None,
+        "overview": f"The overview of the episode {number}. " * 4,
+        "rating": 7.5,
+        "votes": 100,
+        "comment_count": 0,
+        "first_aired": timestamp(index, season * 70 + number * 7),
+        "updated_at": timestamp(index, 400),
+        "available_translations": LANGUAGES[:3],
+        "runtime": 45,
+        "episode_type": episode_type(season, number),
+    }
+
+
+def episode_type(season: int, number: int) -> str:
+    if number != 1:
+        return "standard"
+    return "series_premiere" if season == 1 else "season_premiere"
+
+
+def calendar_movie(index: int) -> Dict[str, Any]:
+    return {"released": date(index).strftime("%Y-%m-%d"), "movie": movie(index)}
+
+
+def calendar_episode(index: int) -> Dict[str, Any]:
+    season, number = 1 + index % 3, 1 + index % 10
+    return {
+        "first_aired": timestamp(index),
+        "episode": episode(index, season, number),
+        "show": show(index),
+    }
+
+
+def list_item(index: int, kind: str = "movie") -> Dict[str, Any]:
+    item = {
+        "rank": index + 1,
+        "id": 100000 + index,
+        "listed_at": timestamp(index, 10),
+        "notes": None,
+        "type": kind,
+    }
+    if kind == "movie":
+        item["movie"] = movie(index)
+    elif kind == "episode":
+        item["episode"] = episode(index, 1 + index % 3, 1 + index % 10)
+        item["show"] = show(index)
+    else:
+        item["show"] = show(index)
+    return item
+
+
+def watched_show(index: int) -> Dict[str, Any]:
+    return {
+        "plays": 1 + index % 300,
+        "last_watched_at": timestamp(index, 200),
+        "last_updated_at": timestamp(index, 200),
+        "reset_at": None,
+        "show": {key: show(index)[key] for key in ("title", "year", "ids")},
+    }
+
+
+def watched_movie(index: int) -> Dict[str, Any]:
+    return {
+        "plays": 1 + index % 3,
+        "last_watched_at": timestamp(index, 200),
+        "last_updated_at": timestamp(index, 200),
+        "movie": {key: movie(index)[key] for key in ("title", "year", "ids")},
+    }
+
+
+def progress(index: int, seasons: int = 3, episodes: int = 10) -> Dict[str, Any]:
+    """The watched progress of a show, finished for one show out of four."""
+    aired = seasons * episodes
+    completed = aired if index % 4 == 0 else aired - 1 - index % episodes
+    next_number = completed % episodes + 1
+    next_season = completed // episodes + 1
+    return {
+        "aired": aired,
+        "completed": completed,
+        "last_watched_at": timestamp(index, 200),
+        "reset_at": None,
+        "seasons": [
+            {
+                "number": season,
+                "title": None,
+                "aired": episodes,
+                "completed": min(episodes, max(0, completed - (season - 1) * episodes)),
+                "episodes": [
+                    {
+                        "number": number,
+                        "completed": (season - 1) * episodes + number <= completed,
+                        "last_watched_at": timestamp(index, 200),
+                    }
+                    for number in range(1, episodes + 1)
+                ],
+            }
+            for season in range(1, seasons + 1)
+        ],
+        "hidden_seasons": [],
+        "next_episode": (
+            None if completed == aired else episode(index, next_season, next_number)
+        ),
+        "last_episode": episode(index, seasons, episodes),
+    }
+
+
+def tmdb_movie(index: int) -> Dict[str, Any]:
+    return {
+        "id": 50000 + index,
+        "title": f"Movie {index}",
+        "overview": f"The TMDB overview of the movie {index}. " * 6,
+        "poster_path": f"/poster{index}.jpg",
+        "backdrop_path": f"/backdrop{index}.jpg",
+        "vote_average": round(5 + (index % 50) / 10, 1),
+        "vote_count": index * 7 % 10000,
+        "runtime": 80 + index % 90,
+        "release_date": date(index).strftime("%Y-%m-%d"),
+        "genres": [{"id": 18, "name": "Drama"}, {"id": 878, "name": "Science Fiction"}],
+        "production_companies": [
+            {"id": 1, "name": NETWORKS[index % len(NETWORKS)], "logo_path": None}
+        ],
+        "spoken_languages": [{"iso_639_1": "en", "name": "English"}],
+        "videos": {"results": tmdb_videos(index)["results"]},
+    }
+
+
+def tmdb_show(index: int) -> Dict[str, Any]:
+    return {
+        "id": 50000 + index,
+        "name": f"Show {index}",
+        "overview": f"The TMDB overview of the show {index}. " * 6,
+        "poster_path": f"/poster{index}.jpg",
+        "backdrop_path": f"/backdrop{index}.jpg",
+        "vote_average": round(5 + (index % 50) / 10, 1),
+        "first_air_date": date(index).strftime("%Y-%m-%d"),
+        "genres": [{"id": 18, "name": "Drama"}],
+        "networks": [{"id": 1, "name": NETWORKS[index % len(NETWORKS)]}],
+        "seasons": [{"season_number": season} for season in range(1, 4)],
+        "videos": {"results": tmdb_videos(index)["results"]},
+    }
+
+
+def tmdb_videos(index: int) -> Dict[str, Any]:
+    return {
+        "id": 50000 + index,
+        "results": [
+            {"site": "YouTube", "type": "Teaser", "key": f"teaser{index}"},
+            {"site": "YouTube", "type": "Trailer", "key": f"trailer{index}"},
+        ],
+    }
+
+
+def many(generator, number: int, *args) -> List[Dict[str, Any]]:
+    return [generator(index, *args) for index in range(number)]
@@ -0,0 +1,277 @@
+"""
+Run whole refreshes of the integration against the fake Trakt and TMDB server.
+
+Each refresh calls TraktApi.retrieve_data like the coordinator does, the first one
+with cold caches and the next ones with the caches filled by the previous ones. The
+wall time, the requests sent and the peak memory are reported, as JSON with --json so
+the runs can be compared between commits.
+
+The exchanges of the last refresh can be recorded in a cassette with --record, and a
+cassette, such as one recorded from a real account, can be replayed instead of
+the fake server with --replay.
+
+Usage: python -m benchmarks.refresh --shows 1000 --movies 1000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import ClientSession
+from homeassistant.core import HomeAssistant
+
+from benchmarks.fake_server import (
+    FakeServer,
+    Faults,
+    Library,
+    RecordingTransport,
+    RedirectTransport,
+)
+from custom_components.trakt_tv.apis.cassette import CassettePlayer, CassetteRecorder
+from custom_components.trakt_tv.apis.middlewares import (
+    Handler,
+    HttpRequest,
+    HttpResponse,
+    build_chain,
+)
+from custom_components.trakt_tv.apis.trakt import TraktApi
+from custom_components.trakt_tv.configuration import set_configuration
+from custom_components.trakt_tv.const import DOMAIN
+
+ENTRY_ID = "benchmark"
+
+# Every source of the integration, with the sizes of a typical setup
+CONFIGURATION = {
+    "language": "en",
+    "timezone": "UTC",
+    "sensors": {
+        "upcoming": {"show": {"days_to_fetch": 90}, "movie": {"days_to_fetch": 90}},
+        "all_upcoming": {"premiere": {"days_to_fetch": 30}},
+        "recommendation": {"movie": {"max_medias": 10}, "show": {"max_medias": 10}},
+        "anticipated": {"movie": {"max_medias": 10}, "show": {"max_medias": 10}},
+        "next_to_watch": {"all": {}, "only_aired": {}, "only_upcoming": {}},
+        "watchlist": {
+            "movie": {"sort_by": "rating", "sort_order": "desc"},
+            "show": {},
+        },
+        "lists": [
+            {
+                "list_id": "123",
+                "friendly_name": "Benchmark",
+                "max_medias": 10,
+                "private_list": False,
+                "media_type": "",
+                "sort_by": "rank",
+                "sort_order": "asc",
+            }
+        ],
+        "stats": ["all"],
+    },
+}
+
+
+class CountingTransport:
+    """Count the requests sent through a transport, by endpoint family and status."""
+
+    def __init__(self, transport: Handler):
+        self.transport = transport
+        self.requests: Counter = Counter()
+        self.statuses: Counter = Counter()
+
+    def reset(self):
+        self.requests.clear()
+        self.statuses.clear()
+
+    async def __call__(self, request: HttpRequest) -> HttpResponse:
+        api = RecordingTransport.api(request.host)
+        family = RecordingTransport.family(request.host, request.url)
+        self.requests[f"{api}.{family}"] += 1
+        try:
+            response = await self.transport(request)
+        except Exception:
+            self.statuses["error"] += 1
+            raise
+        self.statuses[str(response.status)] += 1
+        return response
+
+
+class OAuthSession:
+    """An OAuth session whose token never expires."""
+
+    valid_token = True
+    token = {"access_token": "benchmark"}
+
+
+def build_api(
+    hass: HomeAssistant, transport: Handler, configuration: Dict[str, Any]
+) -> TraktApi:
+    """Build the api of an account, sending its requests through the transport."""
+    set_configuration(hass.data, configuration)
+    domain_data = hass.data[DOMAIN]
+    domain_data["shared"] = {"cache": {}, "pending": {}}
+    domain_data[ENTRY_ID] = {"cache": {}, "pending": {}, "consumers": set()}
+
+    api = TraktApi(None, OAuthSession(), hass, ENTRY_ID, "benchmark")
+    api.transport = transport
+    api.http = build_chain(api.middlewares, transport)
+    return api
+
+
+async def run(
+    server: FakeServer,
+    configuration: Optional[Dict[str, Any]] = None,
+    refreshes: int = 2,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    latency: bool = False,
+) -> Dict[str, Any]:
+    """
+    Refresh an account several times against a fake server.
+
+    :param server: The fake server, it is started and stopped by the run
+    :param configuration: The configuration of the integration
+    :param refreshes: The number of refreshes, the first one with cold caches
+    :param record: The path of the cassette recording the last refresh
+    :param replay: The path of the cassette answering instead of the server
+    :param latency: True to replay the cassette with its recorded latencies
+    :return: The report of each refresh
+    """
+    hass = HomeAssistant("/tmp")
+    reports = []
+
+    async with server, ClientSession() as session:
+        if replay is not None:
+            counter = CountingTransport(CassettePlayer(replay, latency))
+            transport = counter
+        else:
+            counter = CountingTransport(RedirectTransport(session, server.hosts))
+            transport = counter if record is None else CassetteRecorder(counter, record)
+        api = build_api(hass, transport, configuration or CONFIGURATION)
+
+        for refresh in range(refreshes):
+            counter.reset()
+            tracemalloc.start()
+            start = time.perf_counter()
+            error = None
+            try:
+                await api.retrieve_data()
+            except Exception as e:
+                error = repr(e)
+            wall_time = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            reports.append(
+                {
+                    "refresh": refresh,
+                    "cache": "cold" if refresh == 0 else "warm",
+                    "wall_time": round(wall_time, 4),
+                    "peak_memory": peak,
+                    "requests": dict(sorted(counter.requests.items())),
+                    "total_requests": sum(counter.requests.values()),
+                    "statuses": dict(sorted(counter.statuses.items())),
+                    "error": error,
+                }
+            )
+
+    await hass.async_stop(force=True)
+    return {
+        "reports": reports,
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--shows", type=int, default=100)
+    parser.add_argument("--movies", type=int, default=100)
+    parser.add_argument("--list-items", type=int, default=100)
+    parser.add_argument("--watchlist", type=int, default=50)
+    parser.add_argument("--calendar-per-day", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="in seconds")
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--trakt-rate-limit",
+        type=int,
+        nargs=2,
+        default=[1000, 300],
+        metavar=("REQUESTS", "SECONDS"),
+    )
+    parser.add_argument(
+        "--tmdb-rate-limit",
+        type=int,
+        nargs=2,
+        default=[50, 1],
+        metavar=("REQUESTS", "SECONDS"),
+    )
+    parser.add_argument("--refreshes", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--record", help="record the last refresh in this cassette")
+    parser.add_argument("--replay", help="replay this cassette instead of the server")
+    parser.add_argument(
+        "--replay-latency",
+        action="store_true",
+        help="wait the recorded latencies when replaying",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="log the retries and failures"
+    )
+    return parser.parse_args()
+
+
+def print_report(result: Dict[str, Any]):
+    for report in result["reports"]:
+        print(
+            f"refresh {report['refresh']} ({report['cache']}): "
+            f"{report['wall_time'] * 1000:.0f} ms, "
+            f"{report['total_requests']} requests, "
+            f"peak memory {report['peak_memory'] / 2**20:.1f} MiB"
+        )
+        for family, count in report["requests"].items():
+            print(f"  {family:<24} {count:>6}")
+        print(f"  statuses {report['statuses']}")
+        if report["error"]:
+            print(f"  failed: {report['error']}")
+    print(f"max rss {result['max_rss'] / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    logging.basicConfig(level=logging.WARNING if arguments.verbose else logging.ERROR)
+    server = FakeServer(
+        library=Library(
+            shows=arguments.shows,
+            movies=arguments.movies,
+            list_items=arguments.list_items,
+            watchlist=arguments.watchlist,
+            calendar_per_day=arguments.calendar_per_day,
+        ),
+        latency=arguments.latency,
+        jitter=arguments.jitter,
+        faults=Faults(rate=arguments.fault_rate),
+        trakt_rate_limit=tuple(arguments.trakt_rate_limit),
+        tmdb_rate_limit=tuple(arguments.tmdb_rate_limit),
+        seed=arguments.seed,
+    )
+    result = asyncio.run(
+        run(
+            server,
+            refreshes=arguments.refreshes,
+            record=arguments.record,
+            replay=arguments.replay,
+            latency=arguments.replay_latency,
+        )
+    )
+
+    print_report(result)
+    if arguments.json:
+        with open(arguments.json, "w") as file:
+            json.dump(result, file, indent=2)
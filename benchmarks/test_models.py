@@ -0,0 +1,25 @@
+from benchmarks import payloads
+from benchmarks.conftest import rounds
+from custom_components.trakt_tv.models.media import Movie, Show
+from custom_components.trakt_tv.utils import parse_utc_date
+
+
+class TestModels:
+    def test_movie_from_trakt(self, benchmark, size, movie_items):
+        benchmark.pedantic(
+            lambda: [Movie.from_trakt(item) for item in movie_items],
+            rounds=rounds(size),
+        )
+
+    def test_show_from_trakt(self, benchmark, size, show_items):
+        benchmark.pedantic(
+            lambda: [Show.from_trakt(item) for item in show_items],
+            rounds=rounds(size),
+        )
+
+    def test_parse_utc_date(self, benchmark, size):
+        dates = [payloads.timestamp(index) for index in range(size)]
+        benchmark.pedantic(
+            lambda: [parse_utc_date(date) for date in dates],
+            rounds=rounds(size),
+        )
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from pytest import mark
+
+from benchmarks.conftest import fresh, rounds
+from custom_components.trakt_tv.const import SORT_BY_OPTIONS
+from custom_components.trakt_tv.models.kind import TraktKind
+from custom_components.trakt_tv.models.media import Medias
+from custom_components.trakt_tv.sensor import TraktSensor
+
+
+class TestRendering:
+    @mark.parametrize("sort_by", SORT_BY_OPTIONS)
+    def test_movies_to_homeassistant(self, benchmark, size, movies, sort_by):
+        medias = Medias(movies)
+        benchmark.pedantic(
+            lambda medias: medias.to_homeassistant(sort_by, "desc"),
+            setup=lambda: ((fresh(medias),), {}),
+            rounds=rounds(size),
+        )
+
+    def test_shows_to_homeassistant(self, benchmark, size, shows):
+        medias = Medias(shows)
+        benchmark.pedantic(
+            lambda medias: medias.to_homeassistant("released", "asc"),
+            setup=lambda: ((fresh(medias),), {}),
+            rounds=rounds(size),
+        )
+
+    def sensor(self, hass, medias):
+        return TraktSensor(
+            hass=hass,
+            config_entry=SimpleNamespace(entry_id="benchmark"),
+            coordinator=SimpleNamespace(data={"watchlist": {TraktKind.MOVIE: medias}}),
+            trakt_kind=TraktKind.MOVIE,
+            source="watchlist",
+            prefix="Trakt Watchlist",
+            mdi_icon="mdi:movie",
+        )
+
+    def test_sensor_data(self, benchmark, size, hass, movies):
+        """The first rendering of the sensor, once the coordinator refreshed."""
+        medias = Medias(movies)
+        benchmark.pedantic(
+            lambda sensor: sensor.data,
+            setup=lambda: ((self.sensor(hass, fresh(medias)),), {}),
+            rounds=rounds(size),
+        )
+
+    def test_sensor_data_rendered(self, benchmark, size, hass, movies):
+        """The next renderings of the sensor, until the coordinator refreshes."""
+        sensor = self.sensor(hass, Medias(movies))
+        sensor.data
+        benchmark.pedantic(lambda: sensor.data, rounds=rounds(size))
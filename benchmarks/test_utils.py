@@ -0,0 +1,35 @@
+from pytest import mark
+
+from benchmarks.conftest import rounds
+from custom_components.trakt_tv.utils import (
+    cache_insert,
+    cache_retrieve,
+    compute_calendar_args,
+)
+
+
+class TestUtils:
+    @mark.parametrize("days_to_fetch", [7, 90, 365, 3650])
+    def test_compute_calendar_args(self, benchmark, days_to_fetch):
+        benchmark(compute_calendar_args, days_to_fetch, 33)
+
+    def test_cache_insert(self, benchmark, size):
+        keys = [f"calendars:https://api.trakt.tv/{index}" for index in range(size)]
+
+        def insert():
+            cache = {}
+            for key in keys:
+                cache_insert(cache, key, key)
+
+        benchmark.pedantic(insert, rounds=rounds(size))
+
+    def test_cache_retrieve(self, benchmark, size):
+        keys = [f"calendars:https://api.trakt.tv/{index}" for index in range(size)]
+        cache = {}
+        for key in keys:
+            cache_insert(cache, key, key)
+
+        benchmark.pedantic(
+            lambda: [cache_retrieve(cache, key) for key in keys],
+            rounds=rounds(size),
+        )
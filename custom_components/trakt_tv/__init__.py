@@ -4,75 +4,137 @@ import asyncio
 import logging
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_CLIENT_ID, CONF_CLIENT_SECRET
-from homeassistant.core import HomeAssistant
+from homeassistant.const import CONF_CLIENT_ID, CONF_CLIENT_SECRET, SERVICE_RELOAD
+from homeassistant.core import HomeAssistant, ServiceCall
 from homeassistant.helpers import config_entry_oauth2_flow
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
-from homeassistant.helpers.config_entry_oauth2_flow import (
-    OAuth2Session,
-    async_get_config_entry_implementation,
-)
+from homeassistant.helpers.config_entry_oauth2_flow import OAuth2Session
+from homeassistant.helpers.reload import async_integration_yaml_config
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
+from .apis.projection import project_entries
 from .apis.trakt import TraktApi
 from .config_flow import OAuth2FlowHandler
+from .configuration import get_configuration, set_configuration
 from .const import DOMAIN, OAUTH2_AUTHORIZE, OAUTH2_TOKEN
 from .exception import TraktException
 from .schema import configuration_schema
-from .utils import update_domain_data
+from .services import async_setup_services
+from .utils import cache_snapshot
 
 LOGGER = logging.getLogger(__name__)
 
 CONFIG_SCHEMA = configuration_schema
 PLATFORMS = ["sensor"]
 
+STORAGE_VERSION = 1
+CACHE_SAVE_DELAY = 60
+
+
+def cache_layer(hass: HomeAssistant, key: str) -> dict:
+    """Create a cache layer persisted in the given storage key."""
+    return {
+        "cache": {},
+        "pending": {},
+        "store": Store(hass, STORAGE_VERSION, key),
+    }
+
+
+async def async_restore_cache_layer(layer: dict):
+    """Restore the persisted entries of a cache layer, projected like new responses."""
+    layer["cache"].update(project_entries(await layer["store"].async_load() or {}))
+
+
+def save_cache_layer(layer: dict, policies: dict):
+    """Persist the entries of a cache layer following the cache policies."""
+    layer["store"].async_delay_save(
+        lambda: cache_snapshot(layer["cache"], policies), CACHE_SAVE_DELAY
+    )
+
 
 async def async_setup(hass: HomeAssistant, config: dict):
     """Set up the TraktTV component from a yaml (not supported)."""
-    update_domain_data(hass, "configuration", CONFIG_SCHEMA(config).get(DOMAIN, {}))
+    set_configuration(hass.data, CONFIG_SCHEMA(config).get(DOMAIN, {}))
+
+    async def async_reload(call: ServiceCall):
+        """Reload the yaml configuration, then the accounts to apply it."""
+        config = await async_integration_yaml_config(hass, DOMAIN)
+        if config is None:
+            return
+
+        # The sensors and the refreshes in progress keep the previous snapshot until
+        # they read the configuration again
+        set_configuration(hass.data, config.get(DOMAIN, {}))
+        for entry in hass.config_entries.async_entries(DOMAIN):
+            await hass.config_entries.async_reload(entry.entry_id)
+
+    hass.services.async_register(DOMAIN, SERVICE_RELOAD, async_reload)
+    async_setup_services(hass)
     return True
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Set up TraktTV from a config entry."""
-    OAuth2FlowHandler.async_register_implementation(
+    implementation = config_entry_oauth2_flow.LocalOAuth2Implementation(
         hass,
-        config_entry_oauth2_flow.LocalOAuth2Implementation(
-            hass,
-            DOMAIN,
-            entry.data[CONF_CLIENT_ID],
-            entry.data[CONF_CLIENT_SECRET],
-            OAUTH2_AUTHORIZE,
-            OAUTH2_TOKEN,
-        ),
+        DOMAIN,
+        entry.data[CONF_CLIENT_ID],
+        entry.data[CONF_CLIENT_SECRET],
+        OAUTH2_AUTHORIZE,
+        OAUTH2_TOKEN,
     )
+    OAuth2FlowHandler.async_register_implementation(hass, implementation)
 
-    implementation = await async_get_config_entry_implementation(hass, entry)
+    # Each account keeps its own implementation, the registered one is overwritten
+    # by the last account set up.
     session = OAuth2Session(hass, entry, implementation)
 
-    configuration = {"client_id": entry.data[CONF_CLIENT_ID]}
-    update_domain_data(hass, "configuration", configuration)
+    # Public data is shared between all the accounts, the rest is isolated per entry.
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    policies = get_configuration(hass.data).get_cache_policies()
 
-    api = TraktApi(async_get_clientsession(hass), session, hass)
+    if "shared" not in domain_data:
+        domain_data["shared"] = cache_layer(hass, f"{DOMAIN}.shared_cache")
+        await async_restore_cache_layer(domain_data["shared"])
+
+    account = cache_layer(hass, f"{DOMAIN}.{entry.entry_id}.cache")
+    # The refresh plan consumers displayed by an enabled sensor, filled by the sensors
+    account["consumers"] = set()
+    domain_data[entry.entry_id] = account
+    await async_restore_cache_layer(account)
+
+    api = TraktApi(
+        async_get_clientsession(hass),
+        session,
+        hass,
+        entry.entry_id,
+        entry.data[CONF_CLIENT_ID],
+    )
 
     # Implementing Fail Fast for the Coordinator
     async def async_update_data():
         try:
-            return await api.retrieve_data()
+            data = await api.retrieve_data()
         except TraktException as err:
             raise UpdateFailed(f"Communication error with Trakt API: {err}")
 
+        save_cache_layer(domain_data["shared"], policies)
+        save_cache_layer(account, policies)
+
+        return data
+
     coordinator = DataUpdateCoordinator(
         hass=hass,
         logger=LOGGER,
-        name="trakt",
+        name=f"trakt_{entry.entry_id}",
         update_method=async_update_data,
     )
 
     await coordinator.async_config_entry_first_refresh()
 
     instances = {"coordinator": coordinator, "api": api}
-    update_domain_data(hass, "instances", instances)
+    account["instances"] = instances
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
@@ -93,3 +155,9 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
         hass.data[DOMAIN].pop(entry.entry_id, None)
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry):
+    """Remove the persisted cache of a config entry."""
+    store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.cache")
+    await store.async_remove()
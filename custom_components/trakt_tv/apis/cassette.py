@@ -0,0 +1,314 @@
+"""Record the exchanges of a refresh with Trakt and TMDB, or replay them offline."""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+
+from aiohttp import ClientError
+
+from ..utils import Executor
+from .middlewares import Handler, HttpRequest, HttpResponse
+
+LOGGER = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+
+# The bytes of the bodies recorded at most, the next exchanges aren't recorded
+MAX_BYTES = 32 * 1024 * 1024
+
+# The response headers worth replaying, the other ones may identify the account
+KEPT_HEADERS = {
+    "content-type",
+    "retry-after",
+    "x-ratelimit",
+    "x-pagination-page",
+    "x-pagination-limit",
+    "x-pagination-page-count",
+    "x-pagination-item-count",
+}
+
+# The request headers identifying the account or the application
+SECRET_HEADERS = {"authorization", "trakt-api-key"}
+
+ANONYMOUS_USER = {
+    "username": "anonymous",
+    "private": True,
+    "name": "Anonymous",
+    "vip": False,
+    "ids": {"slug": "anonymous"},
+}
+
+
+@dataclass
+class Exchange:
+    method: str
+    host: str
+    url: str
+    # The status of the response, None if the request failed without response
+    status: Optional[int]
+    headers: Dict[str, str] = field(default_factory=dict)
+    request_headers: Dict[str, str] = field(default_factory=dict)
+    # The deserialized body, its text if it isn't JSON
+    body: Any = None
+    # The error of a request failed without response
+    error: Optional[str] = None
+    # The seconds between the start of the recording and the request
+    offset: float = 0
+    # The seconds the response took
+    elapsed: float = 0
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return self.method.lower(), self.host, self.url
+
+
+def anonymize(data: Any) -> Any:
+    """
+    Replace the Trakt users of a response, such as the owners of the lists, by an
+    anonymous one.
+    """
+    if isinstance(data, dict):
+        return {
+            key: ANONYMOUS_USER if key == "user" else anonymize(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [anonymize(item) for item in data]
+    return data
+
+
+def decode_body(body: Any) -> Any:
+    """
+    Deserialize and anonymize a recorded body, kept as received.
+
+    :param body: The bytes of the body, or its data if it was streamed
+    :return: The anonymized data, the text of the body if it isn't JSON
+    """
+    if not isinstance(body, bytes):
+        return anonymize(body)
+    try:
+        return anonymize(json.loads(body))
+    except ValueError:
+        return body.decode("utf-8", errors="replace")
+
+
+def load_cassette(path: str) -> List[Exchange]:
+    """
+    Load the exchanges of a cassette.
+
+    :param path: The path of the cassette
+    :return: The exchanges, in the order they were recorded
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        cassette = json.load(file)
+    return [Exchange(**exchange) for exchange in cassette["exchanges"]]
+
+
+def save_cassette(path: str, exchanges: List[Tuple[Exchange, Any]]):
+    """
+    Save exchanges as a compressed cassette, replacing the previous one at once.
+
+    :param path: The path of the cassette
+    :param exchanges: The exchanges with their bodies as received, see decode_body
+    """
+    temporary = f"{path}.tmp"
+    with gzip.open(temporary, "wt", encoding="utf-8") as file:
+        json.dump(
+            {
+                "version": CASSETTE_VERSION,
+                "exchanges": [
+                    asdict(replace(exchange, body=decode_body(body)))
+                    for exchange, body in exchanges
+                ],
+            },
+            file,
+            separators=(",", ":"),
+        )
+    os.replace(temporary, path)
+
+
+class CassetteRecorder:
+    """
+    Send the requests through a transport and record the exchanges, anonymized.
+
+    The exchanges of the successive refreshes are recorded until their bodies reach
+    the maximum size, they are saved after each refresh. The bodies are kept as
+    received, they are deserialized and anonymized when saved, off the event loop.
+    """
+
+    def __init__(
+        self,
+        transport: Handler,
+        path: str,
+        max_bytes: int = MAX_BYTES,
+        executor: Optional[Executor] = None,
+    ):
+        self.transport = transport
+        self.path = path
+        self.max_bytes = max_bytes
+        self.executor = executor
+        self.exchanges: List[Tuple[Exchange, Any]] = []
+        self.size = 0
+        self.start = time.monotonic()
+        self.unsaved = False
+
+    async def save(self):
+        """Save the cassette if exchanges were recorded since the last save."""
+        if not self.unsaved:
+            return
+
+        # The exchanges recorded during the save are saved by the next one
+        exchanges = list(self.exchanges)
+        self.unsaved = False
+        try:
+            if self.executor is not None:
+                await self.executor(save_cassette, self.path, exchanges)
+            else:
+                save_cassette(self.path, exchanges)
+        except BaseException:
+            self.unsaved = True
+            raise
+
+    def record(self, exchange: Exchange, body: Any = None, size: int = 0):
+        if self.size >= self.max_bytes:
+            return
+        self.exchanges.append((exchange, body))
+        self.size += size
+        self.unsaved = True
+
+    async def __call__(self, request: HttpRequest) -> HttpResponse:
+        start = time.monotonic()
+        exchange = Exchange(
+            method=request.method,
+            host=request.host,
+            url=request.url,
+            status=None,
+            request_headers={
+                key: value
+                for key, value in request.headers.items()
+                if key.lower() not in SECRET_HEADERS
+            },
+            offset=round(start - self.start, 4),
+        )
+
+        try:
+            response = await self.transport(request)
+        except (ClientError, asyncio.TimeoutError) as e:
+            exchange.error = repr(e)
+            exchange.elapsed = round(time.monotonic() - start, 4)
+            self.record(exchange)
+            raise
+
+        exchange.elapsed = round(time.monotonic() - start, 4)
+        exchange.status = response.status
+        exchange.headers = {
+            key: value
+            for key, value in response.headers.items()
+            if key.lower() in KEPT_HEADERS
+        }
+        # A streamed body is only kept deserialized, it isn't modified afterwards
+        body = response.data if response.decoded else response.body
+        self.record(exchange, body, response.size)
+        return response
+
+
+class CassettePlayer:
+    """
+    Answer the requests with the exchanges of a cassette, without any network.
+
+    The exchanges of a request are replayed in the order they were recorded, the last
+    one is then repeated. The requests missing from the cassette are answered with a
+    404 response.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        latency: bool = False,
+        executor: Optional[Executor] = None,
+    ):
+        self.path = path
+        self.latency = latency
+        self.executor = executor
+        self.exchanges: Optional[Dict[Tuple[str, str, str], Deque[Exchange]]] = None
+        self.lock = asyncio.Lock()
+
+    async def load(self) -> Dict[Tuple[str, str, str], Deque[Exchange]]:
+        async with self.lock:
+            if self.exchanges is None:
+                if self.executor is not None:
+                    exchanges = await self.executor(load_cassette, self.path)
+                else:
+                    exchanges = load_cassette(self.path)
+
+                self.exchanges = defaultdict(deque)
+                for exchange in exchanges:
+                    self.exchanges[exchange.key].append(exchange)
+        return self.exchanges
+
+    async def __call__(self, request: HttpRequest) -> HttpResponse:
+        exchanges = (await self.load()).get(
+            (request.method.lower(), request.host, request.url)
+        )
+        if not exchanges:
+            LOGGER.warning(f"{request.url} is missing from the cassette {self.path}")
+            return HttpResponse(status=404, headers={}, body=b"{}")
+
+        exchange = exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+        if self.latency:
+            await asyncio.sleep(exchange.elapsed)
+
+        if exchange.status is None:
+            raise ClientError(exchange.error)
+
+        body = exchange.body
+        return HttpResponse(
+            status=exchange.status,
+            headers=dict(exchange.headers),
+            body=(body if isinstance(body, str) else json.dumps(body)).encode(),
+        )
+
+
+def entry_path(path: str, entry_id: str) -> str:
+    """
+    Give the cassette of an account, the configured path suffixed by its config entry
+    such as trakt_tv_cassette_<entry_id>.json.gz.
+    """
+    directory, filename = os.path.split(path)
+    name, dot, extension = filename.partition(".")
+    return os.path.join(directory, f"{name}_{entry_id}{dot}{extension}")
+
+
+def cassette_transport(
+    settings: Optional[Mapping[str, Any]],
+    transport: Handler,
+    resolve_path: Callable[[str], str],
+    entry_id: str,
+    executor: Optional[Executor] = None,
+) -> Handler:
+    """
+    Wrap the transport with the cassette of the configuration.
+
+    The settings are shared by all the accounts, each of them records and replays
+    its own cassette.
+
+    :param settings: The cassette configuration, the transport is kept if missing
+    :param transport: The transport sending the requests
+    :param resolve_path: Give the absolute path of the cassette from the configured one
+    :param entry_id: The config entry of the account
+    :param executor: Run the blocking file operations
+    :return: The transport recording or replaying the exchanges
+    """
+    if not settings:
+        return transport
+
+    path = entry_path(resolve_path(settings["path"]), entry_id)
+    if settings["mode"] == "record":
+        return CassetteRecorder(transport, path, executor=executor)
+    return CassettePlayer(path, settings["latency"], executor)
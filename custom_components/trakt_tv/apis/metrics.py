@@ -0,0 +1,230 @@
+"""Measure the requests sent to Trakt and TMDB, and the refreshes sending them."""
+
+import bisect
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+# The upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+@dataclass
+class FamilyMetrics:
+    """The metrics of an endpoint family since the account was set up."""
+
+    # The requests missing from the cache, sent with their retries
+    requests: int = 0
+    errors: int = 0
+    duration: float = 0.0
+    # The exchanges with the API, a request is sent several times if it is retried
+    exchanges: int = 0
+    rate_limited: int = 0
+    bytes: int = 0
+    statuses: Dict[str, int] = field(default_factory=dict)
+    # The number of exchanges by duration, the last bucket has no upper bound
+    latency: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    # The lookups of the cache: fresh values, values known as missing and misses.
+    # The stale values used when the fetch of a miss fails are counted apart.
+    cache: Dict[str, int] = field(
+        default_factory=lambda: {"hit": 0, "negative": 0, "miss": 0, "stale": 0}
+    )
+
+    def observe(self, status: str, duration: float, size: int = 0):
+        """Count an exchange with the API."""
+        self.exchanges += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latency[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+        self.bytes += size
+        if status == "429":
+            self.rate_limited += 1
+
+    @property
+    def retries(self) -> int:
+        return max(self.exchanges - self.requests, 0)
+
+    @property
+    def lookups(self) -> int:
+        return self.cache["hit"] + self.cache["negative"] + self.cache["miss"]
+
+    @property
+    def hit_ratio(self) -> float:
+        """The part of the lookups answered by the cache without any request."""
+        hits = self.cache["hit"] + self.cache["negative"]
+        return hits / self.lookups if self.lookups else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        bounds = [f"<={bound}s" for bound in LATENCY_BUCKETS] + [
+            f">{LATENCY_BUCKETS[-1]}s"
+        ]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "duration": round(self.duration, 3),
+            "exchanges": self.exchanges,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "bytes": self.bytes,
+            "statuses": dict(self.statuses),
+            "latency": dict(zip(bounds, self.latency)),
+            "cache": dict(self.cache),
+            "cache_hit_ratio": round(self.hit_ratio, 3),
+        }
+
+
+@dataclass
+class RateLimit:
+    """The quota of the Trakt API, as told by the X-Ratelimit header of a response."""
+
+    name: str
+    limit: int
+    remaining: int
+    # When the quota is restored, unknown if Trakt doesn't tell
+    until: Optional[datetime] = None
+
+    def remaining_at(self, now: datetime) -> int:
+        """The remaining requests, the whole quota once the period is over."""
+        if self.until is not None and now >= self.until:
+            return self.limit
+        return self.remaining
+
+
+def parse_rate_limit(headers: Mapping[str, str]) -> Optional[RateLimit]:
+    """
+    Parse the quota of the X-Ratelimit header, such as {"name": "AUTHED_API_GET_LIMIT",
+    "period": 300, "limit": 1000, "remaining": 0, "until": "2020-10-10T00:24:00Z"}.
+
+    :param headers: The headers of a response
+    :return: The quota, None if the header is missing or malformed
+    """
+    header = next(
+        (value for key, value in headers.items() if key.lower() == "x-ratelimit"),
+        None,
+    )
+    if header is None:
+        return None
+
+    try:
+        limit = json.loads(header)
+        until = limit.get("until")
+        return RateLimit(
+            name=limit.get("name", ""),
+            limit=int(limit["limit"]),
+            remaining=int(limit["remaining"]),
+            until=(
+                datetime.fromisoformat(until.replace("Z", "+00:00")) if until else None
+            ),
+        )
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+@dataclass
+class Cycle:
+    """The counters of a refresh, from the totals at its start and at its end."""
+
+    started: datetime
+    duration: float = 0.0
+    exchanges: int = 0
+    hits: int = 0
+    lookups: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "started": self.started.isoformat(),
+            "duration": round(self.duration, 3),
+            "exchanges": self.exchanges,
+            "cache_hit_ratio": round(self.hit_ratio, 3),
+        }
+
+
+class Metrics:
+    """
+    The metrics of the requests of an account by endpoint family, and of its
+    refreshes by source.
+    """
+
+    def __init__(self):
+        self.families: Dict[str, FamilyMetrics] = {}
+        # The duration of the last refresh of each source, in seconds
+        self.sources: Dict[str, float] = {}
+        # The last quota told by Trakt
+        self.rate_limit: Optional[RateLimit] = None
+        # The last finished refresh, and the start of the one in progress
+        self.last_cycle: Optional[Cycle] = None
+        self._cycle_start: Optional[Tuple[float, datetime, Tuple[int, int, int]]] = None
+
+    def family(self, name: str) -> FamilyMetrics:
+        if name not in self.families:
+            self.families[name] = FamilyMetrics()
+        return self.families[name]
+
+    def cache_lookup(self, family: str, result: str):
+        """Count a lookup of the cache, its result is hit, negative, miss or stale."""
+        self.family(family).cache[result] += 1
+
+    def source_refreshed(self, source: str, start: float):
+        """
+        Record the duration of the refresh of a source.
+
+        :param start: The monotonic time the refresh of the source started at
+        """
+        self.sources[source] = time.monotonic() - start
+
+    def totals(self) -> Tuple[int, int, int]:
+        """The exchanges, the cache hits and the cache lookups of all the families."""
+        exchanges = hits = lookups = 0
+        for family in self.families.values():
+            exchanges += family.exchanges
+            hits += family.cache["hit"] + family.cache["negative"]
+            lookups += family.lookups
+        return exchanges, hits, lookups
+
+    def cycle_started(self):
+        self._cycle_start = (
+            time.monotonic(),
+            datetime.now(timezone.utc),
+            self.totals(),
+        )
+
+    def cycle_finished(self):
+        """Record the counters of the refresh started last."""
+        if self._cycle_start is None:
+            return
+
+        start, started, (exchanges, hits, lookups) = self._cycle_start
+        end_exchanges, end_hits, end_lookups = self.totals()
+        self.last_cycle = Cycle(
+            started=started,
+            duration=time.monotonic() - start,
+            exchanges=end_exchanges - exchanges,
+            hits=end_hits - hits,
+            lookups=end_lookups - lookups,
+        )
+        self._cycle_start = None
+
+    def observe_rate_limit(self, headers: Mapping[str, str]):
+        """Keep the quota told by the headers of a response, if any."""
+        if (rate_limit := parse_rate_limit(headers)) is not None:
+            self.rate_limit = rate_limit
+
+    def as_dict(self) -> Dict[str, Any]:
+        rate_limit = asdict(self.rate_limit) if self.rate_limit else None
+        if rate_limit and rate_limit["until"]:
+            rate_limit["until"] = rate_limit["until"].isoformat()
+        return {
+            "families": {
+                name: family.as_dict() for name, family in sorted(self.families.items())
+            },
+            "sources": {
+                source: round(duration, 3) for source, duration in self.sources.items()
+            },
+            "last_cycle": self.last_cycle.as_dict() if self.last_cycle else None,
+            "rate_limit": rate_limit,
+        }
@@ -0,0 +1,726 @@
+"""Middlewares composing the HTTP pipeline shared by the Trakt and TMDB clients."""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import ClientError, ClientSession, ClientTimeout
+
+from ..const import API_HOST, TMDB_HOST, TMDB_TOKEN
+from ..exception import (
+    TraktCircuitOpenException,
+    TraktException,
+    TraktNotFoundException,
+)
+from ..models.cache import CachePolicy
+from ..tracing import span, traced
+from ..utils import (
+    OFFLOAD_THRESHOLD_BYTES,
+    OFFLOAD_THRESHOLD_ITEMS,
+    Executor,
+    JsonArrayDecoder,
+    cache_fetch,
+    deserialize_json,
+)
+from .metrics import Metrics
+from .projection import project
+
+LOGGER = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class Priority(IntEnum):
+    """The priority of a request, the lowest value is sent first."""
+
+    CRITICAL = 0
+    HIGH = 1
+    NORMAL = 2
+    LOW = 3
+    BACKGROUND = 4
+
+
+@dataclass
+class HttpRequest:
+    method: str
+    host: str
+    url: str
+    family: str = "default"
+    shared: bool = False
+    retries: int = 10
+    headers: Dict[str, str] = field(default_factory=dict)
+    params: Dict[str, str] = field(default_factory=dict)
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    # Tell if a successful response actually describes a missing resource
+    not_found: Optional[Callable[[Any], bool]] = None
+    priority: int = Priority.NORMAL
+    # Deserialize the body while it is received, to lower the peak memory of large
+    # arrays at the cost of a slower deserialization
+    stream: bool = False
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.family}:{self.url}"
+
+
+@dataclass
+class HttpResponse:
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    # The deserialized body if it was streamed, the body is then empty
+    data: Any = None
+    decoded: bool = False
+    # The bytes received for a streamed body
+    streamed_size: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    @property
+    def size(self) -> int:
+        return self.streamed_size if self.decoded else len(self.body)
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+Handler = Callable[[HttpRequest], Awaitable[Any]]
+Middleware = Callable[[HttpRequest, Handler], Awaitable[Any]]
+
+
+def build_chain(middlewares: List[Middleware], transport: Handler) -> Handler:
+    """
+    Compose the middlewares around the transport, the first one being the outermost.
+
+    :param middlewares: The middlewares, called with the request and the next handler
+    :param transport: The handler sending the request
+    :return: The handler of the whole chain
+    """
+    handler = transport
+    for middleware in reversed(middlewares):
+        handler = partial(middleware, call_next=handler)
+    return handler
+
+
+class SessionTransport:
+    """Send the request using an aiohttp session."""
+
+    def __init__(
+        self,
+        session: Optional[ClientSession] = None,
+        timeout: int = 30,
+        executor: Optional[Executor] = None,
+    ):
+        """
+        :param session: The session sending the requests, a new one per request if
+                        missing
+        :param timeout: The seconds a request may take
+        :param executor: Deserialize the streamed bodies off the event loop
+        """
+        self.session = session
+        self.timeout = ClientTimeout(total=timeout)
+        self.executor = executor
+
+    async def __call__(self, request: HttpRequest) -> HttpResponse:
+        url = f"{request.host}/{request.url}"
+        kwargs = {"timeout": self.timeout, **request.kwargs, "headers": request.headers}
+        if request.params:
+            kwargs["params"] = request.params
+
+        if self.session is None:
+            async with ClientSession() as session:
+                return await self.send(session, request, url, kwargs)
+
+        return await self.send(self.session, request, url, kwargs)
+
+    async def send(
+        self, session: ClientSession, request: HttpRequest, url: str, kwargs
+    ) -> HttpResponse:
+        async with session.request(request.method, url, **kwargs) as response:
+            if request.stream and response.status < 400:
+                decoder, size = JsonArrayDecoder(), 0
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    size += len(chunk)
+                    if self.executor is not None:
+                        await self.executor(decoder.feed, chunk)
+                    else:
+                        decoder.feed(chunk)
+                data = (
+                    await self.executor(decoder.close)
+                    if self.executor is not None
+                    else decoder.close()
+                )
+                return HttpResponse(
+                    status=response.status,
+                    headers=dict(response.headers),
+                    body=b"",
+                    data=data,
+                    decoded=True,
+                    streamed_size=size,
+                )
+
+            return HttpResponse(
+                status=response.status,
+                headers=dict(response.headers),
+                body=await response.read(),
+            )
+
+
+class TracingMiddleware:
+    """Log every request with its duration, and trace it in the refresh."""
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        start = time.monotonic()
+        try:
+            return await traced(
+                "http", call_next(request), method=request.method, url=request.url
+            )
+        finally:
+            duration = (time.monotonic() - start) * 1000
+            LOGGER.debug(
+                f"{request.method.upper()} {request.url} took {duration:.0f}ms"
+            )
+
+
+class MetricsMiddleware:
+    """Count the requests sent, errors and time spent by endpoint family."""
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        family = self.metrics.family(request.family)
+        family.requests += 1
+        start = time.monotonic()
+        try:
+            return await call_next(request)
+        except Exception:
+            family.errors += 1
+            raise
+        finally:
+            family.duration += time.monotonic() - start
+
+
+class ExchangeMetricsMiddleware:
+    """
+    Count each exchange with the API by endpoint family: its status, latency and
+    size. A retried request makes several exchanges. The quota told by Trakt is kept
+    from the headers of the responses.
+    """
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        family = self.metrics.family(request.family)
+        start = time.monotonic()
+        try:
+            response = await call_next(request)
+        except Exception:
+            family.observe("error", time.monotonic() - start)
+            raise
+
+        family.observe(str(response.status), time.monotonic() - start, response.size)
+        self.metrics.observe_rate_limit(response.headers)
+        return response
+
+
+class CacheMiddleware:
+    """Cache GET responses following the policy of their endpoint family."""
+
+    def __init__(
+        self,
+        layers: Callable[[bool], Dict[str, Any]],
+        policies: Callable[[str], CachePolicy],
+        metrics: Optional[Metrics] = None,
+    ):
+        """
+        :param layers: Return the shared layer if called with True, else the account one
+        :param policies: Return the cache policy of an endpoint family
+        :param metrics: Count the cache lookups by endpoint family
+        """
+        self.layers = layers
+        self.policies = policies
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        if request.method.lower() != "get":
+            return await call_next(request)
+
+        return await cache_fetch(
+            self.layers(request.shared)["cache"],
+            request.cache_key,
+            lambda: call_next(request),
+            policy=self.policies(request.family),
+            record=lambda result: self.metrics.cache_lookup(request.family, result),
+        )
+
+
+@dataclass
+class Flight:
+    """A request in flight, with the number of callers waiting for it."""
+
+    task: asyncio.Future
+    waiters: int = 0
+
+
+class SingleFlightMiddleware:
+    """
+    Share a single request between concurrent identical GET requests.
+
+    The request is cancelled once all its callers are cancelled, such as when a
+    refresh is cancelled.
+    """
+
+    def __init__(self, layers: Callable[[bool], Dict[str, Any]]):
+        """
+        :param layers: Return the shared layer if called with True, else the account one
+        """
+        self.layers = layers
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        if request.method.lower() != "get":
+            return await call_next(request)
+
+        pending = self.layers(request.shared)["pending"]
+        key = request.cache_key
+
+        def land(flight: Flight):
+            # A cancelled flight may already be replaced by a new one
+            if pending.get(key) is flight:
+                del pending[key]
+
+        if key not in pending:
+            flight = Flight(asyncio.ensure_future(call_next(request)))
+            flight.task.add_done_callback(lambda _, flight=flight: land(flight))
+            pending[key] = flight
+
+        flight = pending[key]
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+                land(flight)
+
+
+class JsonMiddleware:
+    """
+    Deserialize the body of successful responses, raise on the other ones.
+
+    Large bodies are deserialized by the executor to keep the event loop responsive.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        threshold: int = OFFLOAD_THRESHOLD_BYTES,
+    ):
+        self.executor = executor
+        self.threshold = threshold
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        response = await call_next(request)
+
+        if response.status == 404:
+            raise TraktNotFoundException(f"HTTP 404 API Error on {request.url}.")
+
+        if response.ok:
+            if response.decoded:
+                data = response.data
+            elif self.executor is not None and len(response.body) >= self.threshold:
+                data = await self.executor(decode, response.body)
+            else:
+                data = decode(response.body)
+            if request.not_found is not None and request.not_found(data):
+                raise TraktNotFoundException(f"No result found on {request.url}.")
+            return data
+
+        raise TraktException(
+            f"HTTP {response.status} API Error on {request.url}. Content: {response.text}"
+        )
+
+
+def decode(body: bytes) -> Any:
+    with span("decode", bytes=len(body)):
+        return deserialize_json(body)
+
+
+class ProjectionMiddleware:
+    """
+    Project the deserialized responses onto the fields read by the models, before
+    they are cached.
+
+    Large arrays are projected by the executor to keep the event loop responsive.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        threshold: int = OFFLOAD_THRESHOLD_ITEMS,
+    ):
+        self.executor = executor
+        self.threshold = threshold
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        data = await call_next(request)
+
+        if (
+            self.executor is not None
+            and isinstance(data, list)
+            and len(data) >= self.threshold
+        ):
+            return await self.executor(project, request.family, data)
+        return project(request.family, data)
+
+
+class RetryBudget:
+    """The number of retries allowed to all the requests of a refresh."""
+
+    def __init__(self, retries: int = 30):
+        self.retries = retries
+        self.remaining = retries
+
+    def reset(self):
+        """Restore the whole budget, at the start of a refresh."""
+        self.remaining = self.retries
+
+    def consume(self) -> bool:
+        """Use a retry, return False if the budget is exhausted."""
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+class RetryMiddleware:
+    """
+    Retry rate limited (429), failing (5xx) and unreachable requests.
+
+    Rate limited requests wait the time asked by the server, the other ones use an
+    exponential backoff. A random jitter is added so the retries don't happen all at
+    once, and every retry consumes the budget of the refresh.
+    """
+
+    def __init__(
+        self,
+        max_wait_time: int = 30,
+        extra_wait_time: int = 2,
+        base_wait_time: float = 1,
+        max_backoff_time: float = 8,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.max_wait_time = max_wait_time
+        self.extra_wait_time = extra_wait_time
+        self.base_wait_time = base_wait_time
+        self.max_backoff_time = max_backoff_time
+        self.budget = budget or RetryBudget()
+
+    def backoff(self, attempt: int) -> float:
+        """Return the time to wait before a retry, using an exponential backoff."""
+        wait_time = min(self.base_wait_time * 2**attempt, self.max_backoff_time)
+        return random.uniform(wait_time / 2, wait_time)
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        retry = request.retries
+        attempt = 0
+
+        while True:
+            try:
+                response = await call_next(request)
+            except (ClientError, asyncio.TimeoutError) as e:
+                response = None
+                error = (
+                    f"Can't request {request.url} with {request.method} because: {e!r}."
+                )
+                wait_time = self.backoff(attempt)
+            else:
+                if response.status == 429:
+                    wait_time = int(response.headers.get("Retry-After", 60))
+
+                    if wait_time > self.max_wait_time:
+                        raise TraktException(
+                            f"Rate limit (429) reached on {request.url}. "
+                            f"Requested wait time of {wait_time}s is too long for initialization."
+                        )
+
+                    wait_time += random.uniform(0, self.extra_wait_time)
+                elif response.status >= 500:
+                    wait_time = self.backoff(attempt)
+                else:
+                    return response
+
+                error = f"Can't request {request.url} with {request.method} because it returns a {response.status} status code with content {response.text}."
+
+            if retry <= 0:
+                guidance = f"Too many retries, if you find this error, please raise an issue at https://github.com/dylandoamaral/trakt-integration/issues."
+                raise TraktException(f"{error} {guidance}")
+
+            if not self.budget.consume():
+                raise TraktException(
+                    f"{error} The retry budget of the refresh is exhausted."
+                )
+
+            retry = retry - 1
+            attempt = attempt + 1
+            guidance = f"Retrying at least {retry} time(s)."
+            LOGGER.warning(f"{error} {guidance}")
+            await asyncio.sleep(wait_time)
+
+
+class CircuitBreaker:
+    """
+    The state of the requests to a host.
+
+    The breaker opens after several consecutive failures and rejects the requests
+    until the reset timeout is over. It then lets a single probe through, closing again
+    if the probe succeeds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        """Tell if a request can be sent, starting a probe if the timeout is over."""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class CircuitBreakerMiddleware:
+    """Fail fast the requests to a host that keeps failing."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        """Return the breaker of a host."""
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(
+                self.failure_threshold, self.reset_timeout
+            )
+        return self.breakers[host]
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        breaker = self.breaker(request.host)
+
+        if not breaker.allow():
+            raise TraktCircuitOpenException(
+                f"Requests to {request.host} are suspended after repeated failures, "
+                f"{request.url} is not requested."
+            )
+
+        probe = breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            response = await call_next(request)
+        except TraktException:
+            # Raised by the retries, after failures the breaker should know about
+            breaker.record_failure()
+            raise
+        except (ClientError, asyncio.TimeoutError):
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled or failed without telling anything about the host, the next
+            # request is let through as a new probe
+            if probe:
+                breaker.probing = False
+            raise
+
+        if response.status == 429 or response.status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+
+class PriorityMiddleware:
+    """
+    Limit the number of requests in flight, sending the most important ones first.
+
+    When the API rate limits the requests, the background ones are deferred until the
+    requested wait time is over.
+    """
+
+    def __init__(self, limit: int = 4):
+        self.limit = limit
+        self.running = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.pressure_until = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def is_deferred(self, priority: int) -> bool:
+        return (
+            priority >= Priority.BACKGROUND and time.monotonic() < self.pressure_until
+        )
+
+    async def acquire(self, priority: int):
+        """Wait for a slot, in priority order then in arrival order."""
+        if self.running < self.limit and not self.waiters:
+            if not self.is_deferred(priority):
+                self.running += 1
+                return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        self.wake()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been given right before the cancellation
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.running -= 1
+        self.wake()
+
+    def wake(self):
+        """Give the free slots to the waiting requests."""
+        while self.running < self.limit and self.waiters:
+            priority, _, future = self.waiters[0]
+
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+
+            # The waiters are sorted, all the next ones are deferred too
+            if self.is_deferred(priority):
+                self.schedule_wake()
+                return
+
+            heapq.heappop(self.waiters)
+            self.running += 1
+            future.set_result(None)
+
+    def schedule_wake(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        delay = max(self.pressure_until - time.monotonic(), 0)
+        self.timer = asyncio.get_running_loop().call_later(delay, self.wake)
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        await self.acquire(request.priority)
+        try:
+            response = await call_next(request)
+        finally:
+            self.release()
+
+        if response.status == 429:
+            wait_time = int(response.headers.get("Retry-After", 60))
+            self.pressure_until = max(self.pressure_until, time.monotonic() + wait_time)
+
+        return response
+
+
+class AuthMiddleware:
+    """Authenticate the requests depending on their host."""
+
+    def __init__(
+        self,
+        get_access_token: Optional[Callable[[], Awaitable[str]]] = None,
+        client_id: Optional[str] = None,
+    ):
+        self.get_access_token = get_access_token
+        self.client_id = client_id
+
+    async def __call__(self, request: HttpRequest, call_next: Handler) -> Any:
+        if request.host == API_HOST and self.get_access_token is not None:
+            access_token = await self.get_access_token()
+            request.headers = {
+                **request.headers,
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {access_token}",
+                "trakt-api-version": "2",
+                "trakt-api-key": self.client_id,
+            }
+        elif request.host == TMDB_HOST:
+            request.params = {**request.params, "api_key": TMDB_TOKEN}
+
+        return await call_next(request)
+
+
+def default_middlewares(
+    layers: Optional[Callable[[bool], Dict[str, Any]]] = None,
+    policies: Optional[Callable[[str], CachePolicy]] = None,
+    get_access_token: Optional[Callable[[], Awaitable[str]]] = None,
+    client_id: Optional[str] = None,
+    metrics: Optional[Metrics] = None,
+    budget: Optional[RetryBudget] = None,
+    executor: Optional[Executor] = None,
+) -> List[Middleware]:
+    """
+    Build the default middlewares, from the outermost to the innermost.
+
+    The cache and single flight middlewares are only added when the cache layers are
+    provided. The responses are projected under the cache so only the fields read by
+    the models are kept. The circuit breaker sits under the cache so an open circuit falls back to
+    the stale responses. The exchanges are measured under the retries, so every
+    retry is counted.
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    middlewares = [TracingMiddleware()]
+
+    if layers is not None:
+        middlewares.append(
+            CacheMiddleware(layers, policies or (lambda _: CachePolicy(ttl=0)), metrics)
+        )
+        middlewares.append(SingleFlightMiddleware(layers))
+
+    return middlewares + [
+        MetricsMiddleware(metrics),
+        ProjectionMiddleware(executor),
+        JsonMiddleware(executor),
+        CircuitBreakerMiddleware(),
+        RetryMiddleware(budget=budget),
+        PriorityMiddleware(),
+        AuthMiddleware(get_access_token, client_id),
+        ExchangeMetricsMiddleware(metrics),
+    ]
@@ -0,0 +1,377 @@
+"""Refresh plan compiled from the configuration, one node per unique endpoint."""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..configuration import Configuration
+from ..models.kind import (
+    ANTICIPATED_KINDS,
+    BASIC_KINDS,
+    NEXT_TO_WATCH_KINDS,
+    SHOW_CALENDAR_FILTERS,
+    UPCOMING_KINDS,
+    TraktKind,
+)
+from ..models.media import Medias
+from ..utils import compute_calendar_args
+from .middlewares import Priority
+
+HIDDEN_SECTIONS = [
+    "calendar",
+    "progress_watched",
+    "progress_watched_reset",
+    "progress_collected",
+    "dropped",
+]
+
+# The priority of the requests of each source, the sensors the most looked at first
+SOURCE_PRIORITIES = {
+    "next_to_watch": Priority.CRITICAL,
+    "upcoming": Priority.HIGH,
+    "all_upcoming": Priority.HIGH,
+    "watchlist": Priority.HIGH,
+    "lists": Priority.NORMAL,
+    "recommendation": Priority.NORMAL,
+    "anticipated": Priority.NORMAL,
+    "stats": Priority.BACKGROUND,
+}
+
+WATCHED_SHOWS_URL = "sync/watched/shows?extended=noseasons"
+WATCHED_MOVIES_URL = "sync/watched/movies"
+COLLECTED_SHOWS_URL = "sync/collection/shows"
+COLLECTED_MOVIES_URL = "sync/collection/movies"
+STATS_URL = "users/me/stats"
+SHOW_PROGRESS_URL = "shows/{id}/progress/watched"
+EPISODE_URL = "shows/{id}/seasons/{season}/episodes/{number}?extended=full"
+# The medias are built from the extended data and the images, TMDB only completes them
+MEDIA_EXTENDED = "extended=full,images"
+
+
+def hidden_url(section: str) -> str:
+    return f"users/hidden/{section}?type=show"
+
+
+def calendar_url(path: str, from_date: str, nb_days: int, all_medias: bool) -> str:
+    root = "all" if all_medias else "my"
+    return f"calendars/{root}/{path}/{from_date}/{nb_days}?{MEDIA_EXTENDED}"
+
+
+def calendar_urls(path: str, days_to_fetch: int, all_medias: bool) -> List[str]:
+    """
+    Urls of a calendar over several days.
+
+    Since the maximum number of days to fetch using trakt API is 33 days, we have to
+    make multiple API calls if we want to retrieve a larger amount of time.
+    """
+    return [
+        calendar_url(path, from_date, nb_days, all_medias)
+        for from_date, nb_days in compute_calendar_args(days_to_fetch, 33)
+    ]
+
+
+def recommendation_url(path: str, max_items: int) -> str:
+    return (
+        f"recommendations/{path}?limit={max_items}&ignore_collected=false"
+        f"&{MEDIA_EXTENDED}"
+    )
+
+
+def anticipated_url(path: str, limit: int, ignore_collected: bool) -> str:
+    return (
+        f"{path}/anticipated?limit={limit}&ignore_collected={ignore_collected}"
+        f"&{MEDIA_EXTENDED}"
+    )
+
+
+def watchlist_url(path: str, sort_by: str) -> str:
+    # The API does not support sorting by rating, so it is handled manually later
+    api_sort_by = sort_by if sort_by != "rating" else "released"
+    return f"users/me/watchlist/{path}/{api_sort_by}?{MEDIA_EXTENDED}"
+
+
+def list_url(path: str, list_id: str, is_user_path: bool, media_type: str) -> str:
+    """
+    Url of a list. If is_user_path is True, the list is fetched from the user end-point.
+
+    :raises ValueError: If the list can't be fetched
+    """
+    # Add the user path if needed
+    if is_user_path:
+        path = f"users/me/{path}"
+
+        # Drop /lists and /items from the path if fetching watchlist or favorites, Trakt API has a different path for these
+        if list_id in ["watchlist", "favorites"]:
+            path = path.replace("/lists", "").replace("/items", "")
+    else:
+        # Check that the list_id is numeric for public lists
+        if not list_id.isnumeric():
+            raise ValueError(
+                f"Public lists only support numeric list_id, {list_id} is not valid"
+            )
+
+    # Replace the list_id in the path
+    path = path.replace("{list_id}", list_id)
+
+    # Add media type filter to the path
+    if media_type:
+        # Check if the media type is supported
+        if not Medias.trakt_to_class(media_type):
+            raise ValueError(f"Filtering list on {media_type} is not supported")
+        path = f"{path}/{media_type}"
+
+    # Add extended info used for sorting, and the images
+    return f"{path}?{MEDIA_EXTENDED}"
+
+
+def derived_show_kinds(
+    configuration: Configuration, kinds: List[TraktKind], all_medias: bool
+) -> Tuple[List[TraktKind], int]:
+    """
+    Find the upcoming kinds derived from a single shows calendar.
+
+    The shows calendar is larger than the new shows and the premieres ones, it only
+    replaces them if it is fetched anyway or if it replaces both of them.
+
+    :return: The derived kinds and the number of days the shows calendar should cover
+    """
+    if not configuration.derive_show_calendars():
+        return [], 0
+
+    derived_kinds = [
+        kind
+        for kind in kinds
+        if kind in SHOW_CALENDAR_FILTERS
+        and configuration.upcoming_identifier_exists(kind.value.identifier, all_medias)
+    ]
+
+    if TraktKind.SHOW not in derived_kinds and len(derived_kinds) < 2:
+        return [], 0
+
+    days_to_fetch = max(
+        configuration.get_upcoming_days_to_fetch(kind.value.identifier, all_medias)
+        for kind in derived_kinds
+    )
+
+    return derived_kinds, days_to_fetch
+
+
+@dataclass
+class PlanNode:
+    """An endpoint fetched once per refresh and fanned out to its consumers."""
+
+    url: str
+    shared: bool = False
+    dynamic: bool = False
+    consumers: List[str] = field(default_factory=list)
+    depends_on: List[str] = field(default_factory=list)
+    runs: int = 0
+    priority: int = Priority.BACKGROUND
+
+
+@dataclass
+class RefreshPlan:
+    """The DAG of the endpoints fetched during a refresh."""
+
+    nodes: Dict[str, PlanNode] = field(default_factory=dict)
+    # The consumers displayed by an enabled sensor, all of them if unknown
+    active_consumers: Optional[Set[str]] = None
+
+    def add(
+        self,
+        url: str,
+        consumer: str,
+        shared: bool = False,
+        dynamic: bool = False,
+        depends_on: Optional[List[str]] = None,
+        background: bool = False,
+    ) -> PlanNode:
+        """
+        Add an endpoint to the plan, merging it with the node of the same url.
+
+        :param url: The url of the endpoint, a template if dynamic
+        :param consumer: The name of the sensor using the endpoint
+        :param shared: True if the endpoint is account independent
+        :param dynamic: True if the url depends on the response of another node
+        :param depends_on: The urls of the nodes needed to expand this one
+        :param background: True if the consumer can wait for the endpoint
+        """
+        node = self.nodes.setdefault(url, PlanNode(url, shared, dynamic))
+        if consumer not in node.consumers:
+            node.consumers.append(consumer)
+        if not background:
+            node.priority = min(node.priority, self.consumer_priority(consumer))
+        for dependency in depends_on or []:
+            if dependency not in node.depends_on:
+                node.depends_on.append(dependency)
+        return node
+
+    def consumer_priority(self, consumer: str) -> int:
+        """Return the priority of a consumer, from its source and its sensor state."""
+        if self.active_consumers and consumer not in self.active_consumers:
+            return Priority.BACKGROUND
+        return SOURCE_PRIORITIES.get(consumer.split(".")[0], Priority.NORMAL)
+
+    def priority(self, url: str) -> int:
+        """Return the priority of an endpoint, normal if it isn't part of the plan."""
+        node = self.find(url)
+        return node.priority if node is not None else Priority.NORMAL
+
+    def find(self, url: str) -> Optional[PlanNode]:
+        """Find the node of an url, dynamic urls are found using their template."""
+        if url in self.nodes:
+            return self.nodes[url]
+        for node in self.nodes.values():
+            if node.dynamic and _matches(node.url, url):
+                return node
+        return None
+
+    def static_nodes(self) -> List[PlanNode]:
+        """Return the nodes that can be fetched at the start of the refresh."""
+        return [node for node in self.nodes.values() if not node.dynamic]
+
+    def record_run(self, url: str):
+        """Count a fetch of an endpoint, dynamic endpoints are counted together."""
+        if (node := self.find(url)) is not None:
+            node.runs += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return a representation of the plan for debugging purposes."""
+        return {
+            url: {
+                "shared": node.shared,
+                "dynamic": node.dynamic,
+                "consumers": node.consumers,
+                "depends_on": node.depends_on,
+                "runs": node.runs,
+                "priority": node.priority.name,
+            }
+            for url, node in self.nodes.items()
+        }
+
+
+def _matches(template: str, url: str) -> bool:
+    """Check if an url is an expansion of a template such as shows/{id}/..."""
+    template_parts = template.split("?")[0].split("/")
+    url_parts = url.split("?")[0].split("/")
+
+    return len(template_parts) == len(url_parts) and all(
+        expected.startswith("{") or expected == actual
+        for expected, actual in zip(template_parts, url_parts)
+    )
+
+
+def compile_refresh_plan(
+    configuration: Configuration, active_consumers: Optional[Set[str]] = None
+) -> RefreshPlan:
+    """
+    Compile the configuration into the plan of the endpoints to fetch.
+
+    Each endpoint appears once whatever the number of sensors using it, with the
+    priority of its most important consumer. The calendar shards after the first 33
+    days are background work.
+
+    :param configuration: The validated configuration
+    :param active_consumers: The consumers displayed by an enabled sensor
+    :return: The refresh plan
+    """
+    plan = RefreshPlan(active_consumers=active_consumers)
+
+    for source in ["upcoming", "all_upcoming"]:
+        if not configuration.source_exists(source):
+            continue
+
+        all_medias = source == "all_upcoming"
+        kinds = [
+            kind for kind in configuration.get_kinds(source) if kind in UPCOMING_KINDS
+        ]
+        derived_kinds, days_to_fetch = derived_show_kinds(
+            configuration, kinds, all_medias
+        )
+
+        urls = calendar_urls(TraktKind.SHOW.value.path, days_to_fetch, all_medias)
+        for index, url in enumerate(urls):
+            for kind in derived_kinds:
+                consumer = f"{source}.{kind.value.identifier}"
+                plan.add(url, consumer, all_medias, background=index > 0)
+
+        for kind in kinds:
+            if kind in derived_kinds:
+                continue
+            identifier = kind.value.identifier
+            days = configuration.get_upcoming_days_to_fetch(identifier, all_medias)
+            urls = calendar_urls(kind.value.path, days, all_medias)
+            for index, url in enumerate(urls):
+                consumer = f"{source}.{identifier}"
+                plan.add(url, consumer, all_medias, background=index > 0)
+
+    if configuration.source_exists("recommendation"):
+        for kind in configuration.get_kinds("recommendation"):
+            if kind not in BASIC_KINDS:
+                continue
+            identifier = kind.value.identifier
+            max_medias = configuration.get_recommendation_max_medias(identifier)
+            url = recommendation_url(kind.value.path, max_medias)
+            plan.add(url, f"recommendation.{identifier}")
+
+    if configuration.source_exists("anticipated"):
+        for kind in configuration.get_kinds("anticipated"):
+            if kind not in ANTICIPATED_KINDS:
+                continue
+            identifier = kind.value.identifier
+            ignore_collected = configuration.anticipated_exclude_collected(identifier)
+            url = anticipated_url(
+                kind.value.path,
+                configuration.get_anticipated_max_medias(identifier),
+                ignore_collected,
+            )
+            plan.add(url, f"anticipated.{identifier}", not ignore_collected)
+
+    for identifier, path in [("movie", "movies"), ("show", "shows")]:
+        if not configuration.watchlist_identifier_exists(identifier):
+            continue
+        consumer = f"watchlist.{identifier}"
+        sort_by = configuration.get_watchlist_sort_by(identifier)
+        plan.add(watchlist_url(path, sort_by), consumer)
+        if configuration.is_watchlist_only_unwatched(identifier):
+            watched = WATCHED_MOVIES_URL if path == "movies" else WATCHED_SHOWS_URL
+            collected = (
+                COLLECTED_MOVIES_URL if path == "movies" else COLLECTED_SHOWS_URL
+            )
+            plan.add(watched, consumer)
+            plan.add(collected, consumer)
+
+    for kind in NEXT_TO_WATCH_KINDS:
+        identifier = kind.value.identifier
+        if not configuration.next_to_watch_identifier_exists(identifier):
+            continue
+        consumer = f"next_to_watch.{identifier}"
+        hidden_urls = [hidden_url(section) for section in HIDDEN_SECTIONS]
+        for url in hidden_urls:
+            plan.add(url, consumer)
+        plan.add(WATCHED_SHOWS_URL, consumer)
+        plan.add(
+            SHOW_PROGRESS_URL,
+            consumer,
+            dynamic=True,
+            depends_on=[WATCHED_SHOWS_URL, *hidden_urls],
+        )
+        plan.add(EPISODE_URL, consumer, dynamic=True, depends_on=[SHOW_PROGRESS_URL])
+
+    if configuration.source_exists("lists"):
+        for list_config in configuration.get_sensor_config("lists"):
+            try:
+                url = list_url(
+                    TraktKind.LIST.value.path,
+                    list_config["list_id"],
+                    list_config["private_list"],
+                    list_config["media_type"],
+                )
+            except ValueError:
+                continue
+            consumer = f"lists.{list_config['friendly_name']}"
+            plan.add(url, consumer, not list_config["private_list"])
+
+    if configuration.source_exists("stats"):
+        plan.add(STATS_URL, "stats")
+
+    return plan
@@ -0,0 +1,197 @@
+"""Project the decoded responses onto the fields the models and filters read."""
+
+from typing import Any, Callable, Dict, Optional
+
+from ..models.cache import NEGATIVE_ENTRY
+
+# The fields of a movie or a show read by the models
+MEDIA_FIELDS = (
+    "title",
+    "ids",
+    "released",
+    "first_aired",
+    "overview",
+    "genres",
+    "trailer",
+    "runtime",
+    "rating",
+    "network",
+)
+
+# The kinds of trakt images read by the models, only the first of each is kept
+IMAGE_KINDS = ("poster", "fanart")
+
+# The fields of an episode read by the models and the calendar filters
+EPISODE_FIELDS = ("season", "number", "title", "ids", "first_aired", "episode_type")
+
+# The fields of the items wrapping a media, in lists, calendars and syncs
+ITEM_FIELDS = (
+    "type",
+    "rank",
+    "listed_at",
+    "released",
+    "first_aired",
+    "last_watched_at",
+)
+
+# The fields of a TMDB movie or tv show read by the models
+TMDB_FIELDS = (
+    "title",
+    "name",
+    "overview",
+    "poster_path",
+    "backdrop_path",
+    "vote_average",
+    "runtime",
+    "release_date",
+    "first_air_date",
+    "success",
+)
+
+
+def pick(data: Dict[str, Any], fields) -> Dict[str, Any]:
+    return {key: data[key] for key in fields if key in data}
+
+
+def project_media(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not isinstance(data, dict):
+        return data
+
+    projected = pick(data, MEDIA_FIELDS)
+    if isinstance(images := data.get("images"), dict):
+        projected["images"] = {
+            kind: images[kind][:1] for kind in IMAGE_KINDS if images.get(kind)
+        }
+    return projected
+
+
+def project_episode(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not isinstance(data, dict):
+        return data
+    return pick(data, EPISODE_FIELDS)
+
+
+def project_item(item: Any) -> Any:
+    """
+    Project an item of a Trakt array, either a bare media or a media wrapped with
+    the fields of the list it belongs to.
+    """
+    if not isinstance(item, dict):
+        return item
+
+    projected = pick(item, ITEM_FIELDS)
+    if "title" in item and "ids" in item:
+        projected.update(project_media(item))
+    for key in ("movie", "show"):
+        if key in item:
+            projected[key] = project_media(item[key])
+    if "episode" in item:
+        projected["episode"] = project_episode(item["episode"])
+    return projected
+
+
+def project_items(data: Any) -> Any:
+    if not isinstance(data, list):
+        return data
+    return [project_item(item) for item in data]
+
+
+def project_progress(data: Any) -> Any:
+    """Keep the counters and the next episode, drop the seasons and episodes trees."""
+    if not isinstance(data, dict):
+        return data
+
+    projected = pick(data, ("aired", "completed"))
+    if "next_episode" in data:
+        projected["next_episode"] = project_episode(data["next_episode"])
+    return projected
+
+
+def project_videos(data: Any) -> Any:
+    """Keep the YouTube trailers only, the ones the trailer urls are built from."""
+    if not isinstance(data, dict):
+        return data
+
+    return {
+        "results": [
+            pick(video, ("site", "type", "key"))
+            for video in data.get("results") or []
+            if video.get("site") == "YouTube" and video.get("type") == "Trailer"
+        ]
+    }
+
+
+def project_tmdb(data: Any) -> Any:
+    if not isinstance(data, dict):
+        return data
+
+    if "results" in data:
+        return project_videos(data)
+
+    projected = pick(data, TMDB_FIELDS)
+    for key in ("genres", "production_companies", "networks"):
+        if key in data:
+            projected[key] = [{"name": item.get("name")} for item in data[key] or []]
+    if "videos" in data:
+        projected["videos"] = project_videos(data["videos"])
+    return projected
+
+
+def project_tmdb_find(data: Any) -> Any:
+    if not isinstance(data, dict):
+        return data
+
+    return {
+        key: [{"id": result.get("id")} for result in results or []]
+        for key, results in data.items()
+        if key.endswith("_results")
+    }
+
+
+# The projection of each endpoint family, the responses of the other families are
+# kept as they are
+PROJECTIONS: Dict[str, Callable[[Any], Any]] = {
+    "calendars": project_items,
+    "progress": project_progress,
+    "episode_info": project_episode,
+    "hidden": project_items,
+    "sync": project_items,
+    "recommendations": project_items,
+    "anticipated": project_items,
+    "watchlist": project_items,
+    "lists": project_items,
+    "tmdb": project_tmdb,
+    "tmdb_find": project_tmdb_find,
+}
+
+
+def project(family: str, data: Any) -> Any:
+    """
+    Project a decoded response onto the fields read by the models and the filters.
+
+    A projection applied to a projected response gives the same response, so the
+    responses persisted before the projections existed are still valid.
+
+    :param family: The endpoint family of the response
+    :param data: The decoded response
+    :return: The projected response
+    """
+    projection = PROJECTIONS.get(family)
+    return data if projection is None else projection(data)
+
+
+def project_entries(entries: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Project the entries of a cache, persisted before the projections existed.
+
+    :param entries: The cache entries, keyed by "family:key"
+    :return: The entries with their responses projected
+    """
+    return {
+        key: (
+            value
+            if key.endswith("_time") or value == NEGATIVE_ENTRY
+            else project(key.split(":", 1)[0], value)
+        )
+        for key, value in entries.items()
+    }
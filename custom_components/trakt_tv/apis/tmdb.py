@@ -1,12 +1,27 @@
+import logging
 from typing import Any, Dict, Optional
 
-import aiohttp
+from custom_components.trakt_tv.const import TMDB_HOST
+from custom_components.trakt_tv.exception import TraktException
 
-from custom_components.trakt_tv.const import TMDB_HOST, TMDB_TOKEN
+from .middlewares import (
+    Handler,
+    HttpRequest,
+    SessionTransport,
+    build_chain,
+    default_middlewares,
+)
+
+LOGGER = logging.getLogger(__name__)
 
 
 async def get_media_data(
-    kind: str, prefix: str, tmbd_id: int, language: str
+    kind: str,
+    prefix: str,
+    tmbd_id: int,
+    language: str,
+    http: Optional[Handler] = None,
+    append_to_response: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Get information from TMDB about a kind of media.
@@ -15,30 +30,120 @@ async def get_media_data(
     :param prefix: The route prefix
     :param tmbd_id: The ID of the media
     :param language: The favorite language of the user
+    :param http: The middleware chain sending the request, a bare one if missing
+    :param append_to_response: The sub requests to merge into the response
+    """
+    url = f"3/{kind}/{tmbd_id}{prefix}?language={language}"
+    if append_to_response:
+        url = f"{url}&append_to_response={append_to_response}"
+
+    request = HttpRequest(
+        method="get",
+        host=TMDB_HOST,
+        url=url,
+        family="tmdb",
+        shared=True,
+        # The enrichment is optional, a failing TMDB must not slow down the refresh
+        retries=2,
+        # TMDB sometimes answers errors such as unknown ids with a status payload
+        not_found=lambda data: data.get("success") is False,
+    )
+    http = http or build_chain(default_middlewares(), SessionTransport())
+
+    try:
+        return await http(request)
+    except TraktException as e:
+        LOGGER.debug(f"TMDB data of {kind} {tmbd_id} can't be retrieved because: {e}")
+        return {}
+
+
+async def find_tmdb_id(
+    kind: str,
+    imdb: Optional[str] = None,
+    tvdb: Optional[int] = None,
+    http: Optional[Handler] = None,
+) -> Optional[int]:
+    """
+    Find the TMDB ID of a media from its other IDs.
+
+    The responses, including the ones without any result, are cached in the tmdb_find
+    family so the mapping is only requested once.
+
+    :param kind: The kind of media, movie or tv
+    :param imdb: The IMDB ID of the media
+    :param tvdb: The TVDB ID of the media
+    :param http: The middleware chain sending the request, a bare one if missing
+    :return: The TMDB ID, None if it can't be found
     """
-    url = f"{TMDB_HOST}/3/{kind}/{tmbd_id}{prefix}?api_key={TMDB_TOKEN}&language={language}"
-    async with aiohttp.request("GET", url) as response:
-        return await response.json()
+    http = http or build_chain(default_middlewares(), SessionTransport())
+    results_key = f"{kind}_results"
+
+    for source, external_id in [("imdb_id", imdb), ("tvdb_id", tvdb)]:
+        if not external_id:
+            continue
+
+        request = HttpRequest(
+            method="get",
+            host=TMDB_HOST,
+            url=f"3/find/{external_id}?external_source={source}",
+            family="tmdb_find",
+            shared=True,
+            retries=2,
+            not_found=lambda data: not data.get(results_key),
+        )
+
+        try:
+            data = await http(request)
+        except TraktException as e:
+            LOGGER.debug(f"TMDB ID of {kind} {external_id} can't be found because: {e}")
+            continue
+
+        if tmdb_id := data[results_key][0].get("id"):
+            return tmdb_id
+
+    return None
 
 
-async def get_movie_data(tmbd_id: int, language: str) -> Dict[str, Any]:
+async def get_movie_data(
+    tmbd_id: int,
+    language: str,
+    http: Optional[Handler] = None,
+    with_trailer: bool = False,
+) -> Dict[str, Any]:
     """
     Get information from TMDB about a movie.
 
     :param tmbd_id: The ID of the movie
     :param language: The favorite language of the user
+    :param http: The middleware chain sending the request, a bare one if missing
+    :param with_trailer: Add the trailer url to the data, in the same request
     """
-    return await get_media_data("movie", "", tmbd_id, language)
+    if not with_trailer:
+        return await get_media_data("movie", "", tmbd_id, language, http)
 
+    data = await get_media_data("movie", "", tmbd_id, language, http, "videos")
+    return _with_trailer(data)
 
-async def get_show_data(tmbd_id: int, language: str) -> Dict[str, Any]:
+
+async def get_show_data(
+    tmbd_id: int,
+    language: str,
+    http: Optional[Handler] = None,
+    with_trailer: bool = False,
+) -> Dict[str, Any]:
     """
     Get information from TMDB about a show.
 
     :param tmbd_id: The ID of the show
     :param language: The favorite language of the user
+    :param http: The middleware chain sending the request, a bare one if missing
+    :param with_trailer: Add the trailer url to the data, in the same request
     """
-    return await get_media_data("tv", "", tmbd_id, language)
+    if not with_trailer:
+        return await get_media_data("tv", "", tmbd_id, language, http)
+
+    data = await get_media_data("tv", "", tmbd_id, language, http, "videos")
+    return _with_trailer(data)
 
 
 def _extract_trailer_from_data(data: Dict[str, Any]) -> Optional[str]:
@@ -58,23 +163,10 @@ def _extract_trailer_from_data(data: Dict[str, Any]) -> Optional[str]:
     return None
 
 
-async def get_movie_trailer(tmbd_id: int, language: str) -> Optional[str]:
-    """
-    Get trailer url from TMDB about a movie.
-
-    :param tmbd_id: The ID of the movie
-    :param language: The favorite language of the user
-    """
-    data = await get_media_data("movie", "/videos", tmbd_id, language)
-    return _extract_trailer_from_data(data)
-
-
-async def get_show_trailer(tmbd_id: int, language: str) -> Optional[str]:
+def _with_trailer(data: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Get trailer url from TMDB about a show.
+    Add the trailer url to data fetched with the appended videos.
 
-    :param tmbd_id: The ID of the show
-    :param language: The favorite language of the user
+    The data is copied since it may come from the cache.
     """
-    data = await get_media_data("tv", "/videos", tmbd_id, language)
-    return _extract_trailer_from_data(data)
+    return {**data, "trailer": _extract_trailer_from_data(data.get("videos") or {})}
@@ -2,24 +2,55 @@
 
 import asyncio
 import logging
-from asyncio import gather, sleep
-from datetime import datetime
-from typing import Any, Dict
+import time
+from asyncio import gather
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from zoneinfo import ZoneInfo
 
-from aiohttp import ClientResponse, ClientSession
+from aiohttp import ClientSession
 from async_timeout import timeout
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.config_entry_oauth2_flow import OAuth2Session
 
-from custom_components.trakt_tv.utils import compute_calendar_args
-
-from ..configuration import Configuration
+from ..configuration import Configuration, get_configuration
 from ..const import API_HOST, DOMAIN
 from ..exception import TraktException
-from ..models.kind import BASIC_KINDS, UPCOMING_KINDS, TraktKind
-from ..models.media import Medias
-from ..utils import cache_insert, cache_retrieve, deserialize_json, extract_value_from
+from ..models.cache import endpoint_family
+from ..models.kind import BASIC_KINDS, SHOW_CALENDAR_FILTERS, UPCOMING_KINDS, TraktKind
+from ..models.media import Media, Medias
+from ..tracing import traced, traced_coroutine, tracer_from_settings, with_context
+from ..utils import extract_value_from, map_offloaded, parse_utc_date
+from .cassette import CassetteRecorder, cassette_transport
+from .metrics import Metrics
+from .middlewares import (
+    Handler,
+    HttpRequest,
+    Priority,
+    RetryBudget,
+    SessionTransport,
+    build_chain,
+    default_middlewares,
+)
+from .plan import (
+    COLLECTED_MOVIES_URL,
+    COLLECTED_SHOWS_URL,
+    EPISODE_URL,
+    HIDDEN_SECTIONS,
+    SHOW_PROGRESS_URL,
+    STATS_URL,
+    WATCHED_MOVIES_URL,
+    WATCHED_SHOWS_URL,
+    RefreshPlan,
+    anticipated_url,
+    calendar_urls,
+    compile_refresh_plan,
+    derived_show_kinds,
+    hidden_url,
+    list_url,
+    recommendation_url,
+    watchlist_url,
+)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -32,16 +63,63 @@ class TraktApi:
         websession: ClientSession,
         oauth_session: OAuth2Session,
         hass: HomeAssistant,
+        entry_id: str,
+        client_id: str,
     ):
         """Initialize TraktTV auth."""
         self.web_session = websession
         self.host = API_HOST
         self.oauth_session = oauth_session
         self.hass = hass
+        self.entry_id = entry_id
+        self.client_id = client_id
+        self.plan: Optional[RefreshPlan] = None
+        self._cycle: Optional[Dict[str, asyncio.Future]] = None
+        self._configuration: Optional[Configuration] = None
         self._semaphore = asyncio.Semaphore(4)
+        self.metrics = Metrics()
+        self.retry_budget = RetryBudget()
+        self.tracer = tracer_from_settings(
+            self.configuration.get_tracing(),
+            hass.config.path,
+            hass.async_add_executor_job,
+        )
+        # The jobs traced by the executor are part of the span sending them
+        self.executor = with_context(hass.async_add_executor_job)
+        self.middlewares = default_middlewares(
+            layers=lambda shared: self.shared() if shared else self.account(),
+            policies=lambda family: self.configuration.get_cache_policy(family),
+            get_access_token=self.async_get_access_token,
+            client_id=client_id,
+            metrics=self.metrics,
+            budget=self.retry_budget,
+            executor=self.executor,
+        )
+        # A cassette records the exchanges of the refreshes, or replays them offline
+        self.transport = cassette_transport(
+            self.configuration.get_cassette(),
+            SessionTransport(websession, executor=self.executor),
+            hass.config.path,
+            entry_id,
+            hass.async_add_executor_job,
+        )
+        self.http = build_chain(self.middlewares, self.transport)
 
-    def cache(self) -> Dict[str, Any]:
-        return self.hass.data[DOMAIN].get("cache", {})
+    @property
+    def configuration(self) -> Configuration:
+        """
+        Return the configuration snapshot, replaced as a whole on reload. A refresh
+        keeps the snapshot it started with.
+        """
+        return self._configuration or get_configuration(self.hass.data)
+
+    def account(self) -> Dict[str, Any]:
+        """Return the layer of the account, isolated from the other accounts."""
+        return self.hass.data[DOMAIN][self.entry_id]
+
+    def shared(self) -> Dict[str, Any]:
+        """Return the layer sharing public data between all the accounts."""
+        return self.hass.data[DOMAIN]["shared"]
 
     async def async_get_access_token(self) -> str:
         """Return a valid access token."""
@@ -50,81 +128,136 @@ class TraktApi:
 
         return self.oauth_session.token["access_token"]
 
-    async def retry_request(self, wait_time, response, method, url, retry, **kwargs):
-        """Retry a request {retry} times before logging an error and raising an exception."""
-        content = await response.text()
-        error = f"Can't request {url} with {method} because it returns a {response.status} status code with content {content}."
-
-        if retry > 0:
-            retry = retry - 1
-            guidance = f"Retrying at least {retry} time(s)."
-            LOGGER.warn(f"{error} {guidance}")
-            await sleep(wait_time)
-            return await self.request(method, url, retry, **kwargs)
-        else:
-            guidance = f"Too many retries, if you find this error, please raise an issue at https://github.com/dylandoamaral/trakt-integration/issues."
-            raise TraktException(f"{error} {guidance}")
-
-    async def request(self, method, url, retry=10, **kwargs) -> dict[str, Any]:
-        """Make a request."""
-        access_token = await self.async_get_access_token()
-        client_id = self.hass.data[DOMAIN]["configuration"]["client_id"]
-        headers = {
-            **kwargs.get("headers", {}),
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}",
-            "trakt-api-version": "2",
-            "trakt-api-key": client_id,
-        }
+    async def request(
+        self, method, url, retry=10, shared=False, priority=None, **kwargs
+    ) -> dict[str, Any]:
+        """
+        Make a request through the middleware chain.
 
-        response = await self.web_session.request(
-            method,
-            f"{self.host}/{url}",
-            **kwargs,
-            headers=headers,
+        :param retry: The number of retries when the request is rate limited
+        :param shared: True if the endpoint is account independent, the response is
+                       then shared between all the accounts
+        :param priority: The priority of the request, the one of its endpoint in the
+                         refresh plan if missing
+        """
+        if priority is None:
+            priority = self.plan.priority(url) if self.plan else Priority.NORMAL
+
+        family = endpoint_family(url)
+        request = HttpRequest(
+            method=method,
+            host=self.host,
+            url=url,
+            family=family,
+            shared=shared,
+            retries=retry,
+            priority=priority,
+            stream=family in self.configuration.get_stream_families(),
+            headers=kwargs.pop("headers", {}),
+            kwargs=kwargs,
         )
 
-        async with response:
-            if response.ok:
-                text = await response.text()
-                return deserialize_json(text)
-
-            elif response.status == 429:
-                wait_time = int(response.headers.get("Retry-After", 60))
+        if method.lower() != "get" or self._cycle is None:
+            return await self.http(request)
+
+        # During a refresh, each endpoint is fetched once and fanned out to its callers
+        key = f"{'shared' if shared else 'account'}:{url}"
+        if key not in self._cycle:
+            if self.plan is not None:
+                self.plan.record_run(url)
+            self._cycle[key] = asyncio.ensure_future(self.http(request))
+        return await asyncio.shield(self._cycle[key])
+
+    async def fetch_calendar_medias(
+        self, path: str, days_to_fetch: int, all_medias: bool
+    ) -> List[Dict[str, Any]]:
+        """Fetch a calendar over several days, using one request per 33 days."""
+        data = await gather(
+            *[
+                self.request("get", url, shared=all_medias)
+                for url in calendar_urls(path, days_to_fetch, all_medias)
+            ]
+        )
+        return [media for medias in data for media in medias]
 
-                if wait_time > 30:
-                    raise TraktException(
-                        f"Rate limit (429) reached on {url}. "
-                        f"Requested wait time of {wait_time}s is too long for initialization."
-                    )
+    def derive_show_calendar(
+        self, trakt_kind: TraktKind, calendar: list, days_to_fetch: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Extract the calendar of a kind from an already fetched shows calendar.
 
-                return await self.retry_request(
-                    wait_time + 2, response, method, url, retry, **kwargs
-                )
+        :param trakt_kind: The TraktKind to derive, one of SHOW_CALENDAR_FILTERS
+        :param calendar: The shows calendar, covering at least days_to_fetch
+        :param days_to_fetch: The number of days the kind is configured to fetch
+        """
+        keep = SHOW_CALENDAR_FILTERS[trakt_kind]
+        timezone = ZoneInfo(self.configuration.get_timezone())
+        end = (datetime.now(timezone) - timedelta(1) + timedelta(days_to_fetch)).date()
 
-            else:
-                content = await response.text()
-                raise TraktException(
-                    f"HTTP {response.status} API Error on {url}. Content: {content}"
-                )
+        def before_end(media: Dict[str, Any]) -> bool:
+            # The episodes air in UTC, the calendars end on a day of the timezone
+            aired = parse_utc_date(media.get("first_aired"))
+            return aired is None or aired.astimezone(timezone).date() < end
 
-    async def fetch_calendar(
-        self, path: str, from_date: str, nb_days: int, all_medias: bool
-    ):
-        cache_key = f"user_calendar_{path}_{from_date}_{nb_days}"
+        return [media for media in calendar if keep(media) and before_end(media)]
 
-        maybe_answer = cache_retrieve(self.cache(), cache_key)
-        if maybe_answer is not None:
-            return maybe_answer
+    async def build_medias(
+        self, build: Callable[[Any], Optional[Media]], raw_medias: List[Any]
+    ) -> List[Media]:
+        """
+        Build the medias from the raw trakt data without blocking the event loop.
 
-        root = "all" if all_medias else "my"
-        response = await self.request(
-            "get", f"calendars/{root}/{path}/{from_date}/{nb_days}"
+        :param build: Build a media from a raw one, None if it can't be built
+        :param raw_medias: The raw medias
+        """
+        medias = await traced(
+            "from_trakt",
+            map_offloaded(build, raw_medias, self.executor),
+            medias=len(raw_medias),
         )
+        return [media for media in medias if media is not None]
+
+    def with_priority(self, priority: int) -> Handler:
+        """Return the middleware chain sending the requests with the given priority."""
+
+        async def http(request: HttpRequest):
+            request.priority = priority
+            return await self.http(request)
+
+        return http
 
-        cache_insert(self.cache(), cache_key, response)
+    async def enrich(
+        self,
+        medias: List[Media],
+        language: str,
+        consumer: str,
+        shown: Optional[List[Media]] = None,
+    ):
+        """
+        Complete the medias with TMDB data, sent through the same middlewares.
 
-        return response
+        :param consumer: The refresh plan consumer of the medias, giving the priority
+                         of the requests
+        :param shown: The medias displayed by the sensor, the other ones are completed
+                      with a lower priority, all of them are displayed if missing
+        """
+        plan = self.plan or RefreshPlan()
+        priority = plan.consumer_priority(consumer)
+        shown_ids = None if shown is None else {id(media) for media in shown}
+        high, low = self.with_priority(priority), self.with_priority(Priority.LOW)
+
+        async def complete():
+            await gather(
+                *[
+                    media.get_more_information(
+                        language,
+                        high if shown_ids is None or id(media) in shown_ids else low,
+                    )
+                    for media in medias
+                ]
+            )
+
+        await traced("get_more_information", complete(), medias=len(medias))
 
     def is_show_excluded(self, show, excluded_shows: list, hidden_shows: list) -> bool:
         """Check if a show should be excluded or not."""
@@ -141,41 +274,27 @@ class TraktApi:
         except KeyError:
             return False
 
+    @traced_coroutine
     async def fetch_watched(
         self, excluded_shows: list, excluded_finished: bool = False
     ):
         """First, let's retrieve hidden items from user as a workaround for a potential bug in show progress_watch API"""
-        cache_key = f"user_hidden_shows"
-
-        maybe_answer = cache_retrieve(self.cache(), cache_key)
-        if maybe_answer is not None:
-            hidden_shows = maybe_answer
-        else:
-            hidden_shows = []
-            for section in [
-                "calendar",
-                "progress_watched",
-                "progress_watched_reset",
-                "progress_collected",
-                "dropped",
-            ]:
-                hidden_items = await self.request(
-                    "get", f"users/hidden/{section}?type=show"
-                )
-                if hidden_items is not None:
-                    for hidden_item in hidden_items:
-                        try:
-                            trakt_id = hidden_item["show"]["ids"]["trakt"]
-                            hidden_shows.append(trakt_id)
-                        except IndexError:
-                            LOGGER.error(
-                                "Error while trying to retrieve hidden items in section %s",
-                                section,
-                            )
-            cache_insert(self.cache(), cache_key, hidden_shows)
+        hidden_shows = []
+        for section in HIDDEN_SECTIONS:
+            hidden_items = await self.request("get", hidden_url(section))
+            if hidden_items is not None:
+                for hidden_item in hidden_items:
+                    try:
+                        trakt_id = hidden_item["show"]["ids"]["trakt"]
+                        hidden_shows.append(trakt_id)
+                    except IndexError:
+                        LOGGER.error(
+                            "Error while trying to retrieve hidden items in section %s",
+                            section,
+                        )
 
         """Then, let's retrieve progress for current user by removing hidden or excluded shows"""
-        raw_shows = await self.request("get", f"sync/watched/shows?extended=noseasons")
+        raw_shows = await self.request("get", WATCHED_SHOWS_URL)
         raw_medias = []
 
         # Semaphore to avoid hammering Trakt API and triggering 429s.
@@ -218,7 +337,8 @@ class TraktApi:
                         ),
                     )
 
-                    show["episode"] = raw_next_episode
+                    # The raw show is cached, it must not be altered
+                    show = {**show, "episode": raw_next_episode}
 
                     if (
                         raw_next_episode
@@ -251,38 +371,15 @@ class TraktApi:
         return raw_medias
 
     async def fetch_show_progress(self, id: str):
-        cache_key = f"show_progress_{id}"
-
-        maybe_answer = cache_retrieve(self.cache(), cache_key)
-
-        if maybe_answer is not None:
-            return maybe_answer
-
-        response = await self.request("get", f"shows/{id}/progress/watched")
-
-        cache_insert(self.cache(), cache_key, response)
-
-        return response
+        return await self.request("get", SHOW_PROGRESS_URL.format(id=id))
 
     async def fetch_show_informations(
         self, show_id: str, season_nbr: str, episode_nbr: str
     ):
-        cache_key = f"show_info_{show_id}_{season_nbr}_{episode_nbr}"
-
-        maybe_answer = cache_retrieve(self.cache(), cache_key)
-        if maybe_answer is not None:
-            return maybe_answer
-
-        response = await self.request(
-            "get",
-            f"shows/{show_id}/seasons/{season_nbr}/episodes/{episode_nbr}?extended=full",
-        )
-
-        if response is not None:
-            cache_insert(self.cache(), cache_key, response)
-
-        return response
+        url = EPISODE_URL.format(id=show_id, season=season_nbr, number=episode_nbr)
+        return await self.request("get", url)
 
+    @traced_coroutine
     async def fetch_upcoming(
         self,
         trakt_kind: TraktKind,
@@ -290,17 +387,16 @@ class TraktApi:
         next_to_watch: bool,
         only_aired: bool,
         only_upcoming: bool,
+        calendar: Optional[list] = None,
     ):
         """
         Fetch the calendar of the user trakt account based on the trak_type containing
         the calendar type.
 
-        Since the maximum number of days to fetch using trakt API is 33 days, we have to
-        make multiple API calls if we want to retrieve a larger amount of time.
-
         :param trak_type: The TraktKind describing which calendar we should request
+        :param calendar: An already fetched shows calendar to derive the medias from
         """
-        configuration = Configuration(data=self.hass.data)
+        configuration = self.configuration
         path = trakt_kind.value.path
         identifier = trakt_kind.value.identifier
 
@@ -316,8 +412,6 @@ class TraktApi:
         ):
             return None
 
-        configuration = Configuration(data=self.hass.data)
-
         max_medias = configuration.get_upcoming_max_medias(identifier, all_medias)
         language = configuration.get_language()
 
@@ -328,43 +422,48 @@ class TraktApi:
             days_to_fetch = configuration.get_upcoming_days_to_fetch(
                 identifier, all_medias
             )
-            calendar_args = compute_calendar_args(days_to_fetch, 33)
-            data = await gather(
-                *[
-                    self.fetch_calendar(path, args[0], args[1], all_medias)
-                    for args in calendar_args
-                ]
-            )
-            raw_medias = [media for medias in data for media in medias]
+            if calendar is None:
+                raw_medias = await self.fetch_calendar_medias(
+                    path, days_to_fetch, all_medias
+                )
+            else:
+                raw_medias = self.derive_show_calendar(
+                    trakt_kind, calendar, days_to_fetch
+                )
             raw_medias = raw_medias[0:max_medias]
 
-        medias = [trakt_kind.value.model.from_trakt(media) for media in raw_medias]
+        medias = await self.build_medias(trakt_kind.value.model.from_trakt, raw_medias)
 
         timezone = ZoneInfo(configuration.get_timezone())
         now = datetime.now(timezone)
 
+        kept = Medias(medias)
         if next_to_watch:
             if only_aired:
-                new_medias = [
-                    media
-                    for media in medias
-                    if media.released and media.released <= now
-                ]
+                kept = kept.released_before(now)
             elif only_upcoming:
-                new_medias = [
-                    media for media in medias if media.released and media.released > now
-                ]
-            else:
-                new_medias = medias
+                kept = kept.released_after(now)
         else:
-            new_medias = [
-                media for media in medias if media.released and media.released >= now
-            ]
+            kept = kept.released_after(now, inclusive=True)
+        new_medias = kept.items
 
-        await gather(*[media.get_more_information(language) for media in new_medias])
+        if next_to_watch:
+            # Only the first shows are displayed once sorted, the columns of the large
+            # collections are reused
+            shown = kept.top(
+                configuration.get_max_medias(identifier, "next_to_watch"),
+                configuration.get_sort_by(identifier, "next_to_watch"),
+                configuration.get_sort_order(identifier, "next_to_watch"),
+            )
+            consumer = f"next_to_watch.{identifier}"
+            await self.enrich(new_medias, language, consumer, shown)
+        else:
+            source = "all_upcoming" if all_medias else "upcoming"
+            await self.enrich(new_medias, language, f"{source}.{identifier}")
 
         return trakt_kind, Medias(new_medias)
 
+    @traced_coroutine
     async def fetch_next_to_watch(
         self,
         configured_kind: TraktKind,
@@ -384,6 +483,7 @@ class TraktApi:
 
         return dict([data])
 
+    @traced_coroutine
     async def fetch_upcomings(
         self, configured_kinds: list[TraktKind], all_medias: bool
     ):
@@ -397,9 +497,29 @@ class TraktApi:
                     f"Upcomings doesn't support {kind}, you should remove it from the configuration."
                 )
 
+        """Fetch the shows calendar once for the kinds that can be derived from it"""
+        configuration = self.configuration
+        calendar = None
+
+        derived_kinds, days_to_fetch = derived_show_kinds(
+            configuration, kinds, all_medias
+        )
+
+        if derived_kinds:
+            calendar = await self.fetch_calendar_medias(
+                TraktKind.SHOW.value.path, days_to_fetch, all_medias
+            )
+
         data = await gather(
             *[
-                self.fetch_upcoming(kind, all_medias, False, False, False)
+                self.fetch_upcoming(
+                    kind,
+                    all_medias,
+                    False,
+                    False,
+                    False,
+                    calendar if kind in derived_kinds else None,
+                )
                 for kind in kinds
             ]
         )
@@ -407,10 +527,9 @@ class TraktApi:
         return {trakt_kind: medias for trakt_kind, medias in data}
 
     async def fetch_recommendation(self, path: str, max_items: int):
-        return await self.request(
-            "get", f"recommendations/{path}?limit={max_items}&ignore_collected=false"
-        )
+        return await self.request("get", recommendation_url(path, max_items))
 
+    @traced_coroutine
     async def fetch_recommendations(self, configured_kinds: list[TraktKind]):
         kinds = []
 
@@ -422,7 +541,7 @@ class TraktApi:
                     f"Recommendation doesn't support {kind}, you should remove it from the configuration."
                 )
 
-        configuration = Configuration(data=self.hass.data)
+        configuration = self.configuration
         language = configuration.get_language()
         data = await gather(
             *[
@@ -438,12 +557,11 @@ class TraktApi:
 
         for trakt_kind, raw_medias in zip(kinds, data):
             if raw_medias is not None:
-                medias = [
-                    trakt_kind.value.model.from_trakt(media) for media in raw_medias
-                ]
-                await gather(
-                    *[media.get_more_information(language) for media in medias]
+                medias = await self.build_medias(
+                    trakt_kind.value.model.from_trakt, raw_medias
                 )
+                consumer = f"recommendation.{trakt_kind.value.identifier}"
+                await self.enrich(medias, language, consumer)
                 res[trakt_kind] = Medias(medias)
 
         return res
@@ -457,42 +575,19 @@ class TraktApi:
         media_type: str,
     ):
         """Fetch the list. If is_user_path is True, the list will be fetched from the user end-point"""
-        # Add the user path if needed
-        if is_user_path:
-            path = f"users/me/{path}"
-
-            # Drop /lists and /items from the path if fetching watchlist or favorites, Trakt API has a different path for these
-            if list_id in ["watchlist", "favorites"]:
-                path = path.replace("/lists", "").replace("/items", "")
-        else:
-            # Check that the list_id is numeric for public lists
-            if not list_id.isnumeric():
-                LOGGER.warn(
-                    f"Public lists only support numeric list_id, {list_id} is not valid"
-                )
-                return None
-
-        # Replace the list_id in the path
-        path = path.replace("{list_id}", list_id)
-
-        # Add media type filter to the path
-        if media_type:
-            # Check if the media type is supported
-            if Medias.trakt_to_class(media_type):
-                path = f"{path}/{media_type}"
-            else:
-                LOGGER.warn(f"Filtering list on {media_type} is not supported")
-                return None
-
-        # Add extended info used for sorting
-        path = f"{path}?extended=full"
+        try:
+            url = list_url(path, list_id, is_user_path, media_type)
+        except ValueError as e:
+            LOGGER.warn(e)
+            return None
 
-        return await self.request("get", path)
+        return await self.request("get", url, shared=not is_user_path)
 
+    @traced_coroutine
     async def fetch_lists(self, configured_kind: TraktKind):
 
         # Get config for all lists
-        configuration = Configuration(data=self.hass.data)
+        configuration = self.configuration
         lists = configuration.get_sensor_config(configured_kind.value.identifier)
 
         # Fetch the lists
@@ -515,18 +610,21 @@ class TraktApi:
         res = {}
         for list_config, raw_medias in zip(lists, data):
             if raw_medias is not None:
-                medias = []
-                for media in raw_medias:
+
+                def build(media, list_config=list_config):
                     # Get model based on media type in data
                     media_type = media.get("type")
                     model = Medias.trakt_to_class(media_type)
 
                     if model:
-                        medias.append(model.from_trakt(media))
-                    else:
-                        LOGGER.warn(
-                            f"Media type {media_type} in {list_config['friendly_name']} is not supported"
-                        )
+                        return model.from_trakt(media)
+
+                    LOGGER.warn(
+                        f"Media type {media_type} in {list_config['friendly_name']} is not supported"
+                    )
+                    return None
+
+                medias = await self.build_medias(build, raw_medias)
 
                 if not medias:
                     LOGGER.warn(
@@ -534,16 +632,21 @@ class TraktApi:
                     )
                     continue
 
-                await gather(
-                    *[media.get_more_information(language) for media in medias]
+                shown = Medias(medias).top(
+                    list_config["max_medias"],
+                    list_config["sort_by"],
+                    list_config["sort_order"],
                 )
+                consumer = f"lists.{list_config['friendly_name']}"
+                await self.enrich(medias, language, consumer, shown)
                 res[list_config["friendly_name"]] = Medias(medias)
 
         return {configured_kind: res}
 
+    @traced_coroutine
     async def fetch_stats(self):
         # Load data
-        data = await self.request("get", f"users/me/stats")
+        data = await self.request("get", STATS_URL)
 
         # Flatten data dictionary
         stats = {}
@@ -557,11 +660,12 @@ class TraktApi:
         return stats
 
     async def fetch_anticipated(self, path: str, limit: int, ignore_collected: bool):
-        return await self.request(
-            "get",
-            f"{path}/anticipated?limit={limit}&ignore_collected={ignore_collected}",
-        )
+        url = anticipated_url(path, limit, ignore_collected)
 
+        # Ignoring collected medias depends on the account
+        return await self.request("get", url, shared=not ignore_collected)
+
+    @traced_coroutine
     async def fetch_anticipated_medias(self, configured_kinds: list[TraktKind]):
         from ..models.kind import ANTICIPATED_KINDS
 
@@ -574,7 +678,7 @@ class TraktApi:
                     f"Anticipated doesn't support {kind}, you should remove it from the configuration."
                 )
 
-        configuration = Configuration(data=self.hass.data)
+        configuration = self.configuration
         language = configuration.get_language()
         data = await gather(
             *[
@@ -591,47 +695,42 @@ class TraktApi:
 
         for trakt_kind, raw_medias in zip(kinds, data):
             if raw_medias is not None:
-                medias = [
-                    trakt_kind.value.model.from_trakt(
-                        media[trakt_kind.value.identifier]
-                    )
-                    for media in raw_medias
-                ]
-                await gather(
-                    *[media.get_more_information(language) for media in medias]
+                medias = await self.build_medias(
+                    lambda media, kind=trakt_kind: kind.value.model.from_trakt(
+                        media[kind.value.identifier]
+                    ),
+                    raw_medias,
                 )
+                consumer = f"anticipated.{trakt_kind.value.identifier}"
+                await self.enrich(medias, language, consumer)
                 res[trakt_kind] = Medias(medias)
 
         return res
 
+    @traced_coroutine
     async def fetch_watchlist_movies(self):
-        configuration = Configuration(data=self.hass.data)
+        configuration = self.configuration
         language = configuration.get_language()
 
         identifier = "movie"
         sort_by = configuration.get_watchlist_sort_by(identifier)
         sort_order = configuration.get_watchlist_sort_order(identifier)
 
-        # The API does not support sorting by rating, so we handle it manually later
-        api_sort_by = sort_by if sort_by != "rating" else "released"
-
-        raw_medias = await self.request(
-            "get", f"users/me/watchlist/movies/{api_sort_by}?extended=full"
-        )
+        raw_medias = await self.request("get", watchlist_url("movies", sort_by))
 
         if raw_medias is None:
             return {}
 
-        medias = [
-            TraktKind.MOVIE.value.model.from_trakt(media["movie"])
-            for media in raw_medias
-        ]
+        medias = await self.build_medias(
+            lambda media: TraktKind.MOVIE.value.model.from_trakt(media["movie"]),
+            raw_medias,
+        )
 
         # Filtering for "only_unwatched"
         only_unwatched = configuration.is_watchlist_only_unwatched(identifier)
         if only_unwatched:
-            watched_movies = await self.request("get", "sync/watched/movies")
-            collected_movies = await self.request("get", "sync/collection/movies")
+            watched_movies = await self.request("get", WATCHED_MOVIES_URL)
+            collected_movies = await self.request("get", COLLECTED_MOVIES_URL)
 
             watched_ids = (
                 {movie["movie"]["ids"]["trakt"] for movie in watched_movies}
@@ -645,27 +744,18 @@ class TraktApi:
             )
 
             if watched_ids or collected_ids:
-                unwatched_medias = []
-                for media in medias:
-                    if (
-                        media.ids.trakt not in watched_ids
-                        and media.ids.trakt not in collected_ids
-                    ):
-                        unwatched_medias.append(media)
-                medias = unwatched_medias
+                medias = Medias(medias).excluding(watched_ids | collected_ids).items
 
         # Filtering for "only_released"
         only_released = configuration.is_watchlist_only_released(identifier)
         if only_released:
             timezone = ZoneInfo(configuration.get_timezone())
             now = datetime.now(timezone)
-            medias = [
-                media for media in medias if media.released and media.released <= now
-            ]
+            medias = Medias(medias).released_before(now).items
 
         # Manual sorting for "rating" or applying sort_order for API-sorted results
         if sort_by == "rating":
-            medias.sort(key=lambda m: m.rating or 0, reverse=(sort_order == "desc"))
+            medias = Medias(medias).sort("rating", sort_order, default=0)
         elif sort_order == "desc":
             medias.reverse()
 
@@ -673,39 +763,34 @@ class TraktApi:
         max_medias = configuration.get_watchlist_max_medias(identifier)
         medias = medias[:max_medias]
 
-        await gather(*[media.get_more_information(language) for media in medias])
+        await self.enrich(medias, language, "watchlist.movie")
 
         return {TraktKind.MOVIE: Medias(medias)}
 
+    @traced_coroutine
     async def fetch_watchlist_shows(self):
-        configuration = Configuration(data=self.hass.data)
+        configuration = self.configuration
         language = configuration.get_language()
 
         identifier = "show"
         sort_by = configuration.get_watchlist_sort_by(identifier)
         sort_order = configuration.get_watchlist_sort_order(identifier)
 
-        # The API does not support sorting by rating, so we handle it manually later
-        api_sort_by = sort_by if sort_by != "rating" else "released"
-
-        raw_medias = await self.request(
-            "get", f"users/me/watchlist/shows/{api_sort_by}?extended=full"
-        )
+        raw_medias = await self.request("get", watchlist_url("shows", sort_by))
 
         if raw_medias is None:
             return {}
 
-        medias = [
-            TraktKind.SHOW.value.model.from_trakt(media["show"]) for media in raw_medias
-        ]
+        medias = await self.build_medias(
+            lambda media: TraktKind.SHOW.value.model.from_trakt(media["show"]),
+            raw_medias,
+        )
 
         # Filtering for "only_unwatched"
         only_unwatched = configuration.is_watchlist_only_unwatched(identifier)
         if only_unwatched:
-            watched_shows = await self.request(
-                "get", "sync/watched/shows?extended=noseasons"
-            )
-            collected_shows = await self.request("get", "sync/collection/shows")
+            watched_shows = await self.request("get", WATCHED_SHOWS_URL)
+            collected_shows = await self.request("get", COLLECTED_SHOWS_URL)
 
             watched_ids = (
                 {show["show"]["ids"]["trakt"] for show in watched_shows}
@@ -719,27 +804,18 @@ class TraktApi:
             )
 
             if watched_ids or collected_ids:
-                unwatched_medias = []
-                for media in medias:
-                    if (
-                        media.ids.trakt not in watched_ids
-                        and media.ids.trakt not in collected_ids
-                    ):
-                        unwatched_medias.append(media)
-                medias = unwatched_medias
+                medias = Medias(medias).excluding(watched_ids | collected_ids).items
 
         # Filtering for "only_released"
         only_released = configuration.is_watchlist_only_released(identifier)
         if only_released:
             timezone = ZoneInfo(configuration.get_timezone())
             now = datetime.now(timezone)
-            medias = [
-                media for media in medias if media.released and media.released <= now
-            ]
+            medias = Medias(medias).released_before(now).items
 
         # Manual sorting for "rating" or applying sort_order for API-sorted results
         if sort_by == "rating":
-            medias.sort(key=lambda m: m.rating or 0, reverse=(sort_order == "desc"))
+            medias = Medias(medias).sort("rating", sort_order, default=0)
         elif sort_order == "desc":
             medias.reverse()
 
@@ -747,12 +823,13 @@ class TraktApi:
         max_medias = configuration.get_watchlist_max_medias(identifier)
         medias = medias[:max_medias]
 
-        await gather(*[media.get_more_information(language) for media in medias])
+        await self.enrich(medias, language, "watchlist.show")
 
         return {TraktKind.SHOW: Medias(medias)}
 
+    @traced_coroutine
     async def fetch_watchlist(self):
-        configuration = Configuration(data=self.hass.data)
+        configuration = self.configuration
         res = {}
 
         if configuration.watchlist_identifier_exists("movie"):
@@ -763,84 +840,140 @@ class TraktApi:
 
         return res
 
+    async def run_plan(self, plan: RefreshPlan):
+        """
+        Fetch the static nodes of the plan, the sources get the responses as soon as
+        they request them. Errors are left to the sources handling them.
+        """
+        await gather(
+            *[
+                self.request("get", node.url, shared=node.shared)
+                for node in plan.static_nodes()
+            ],
+            return_exceptions=True,
+        )
+
     async def retrieve_data(self):
         async with timeout(1800):
-            configuration = Configuration(data=self.hass.data)
-
-            sources = []
-            coroutine_sources_data = []
-
-            source_function = {
-                "upcoming": lambda kinds: self.fetch_upcomings(
-                    configured_kinds=kinds,
-                    all_medias=False,
-                ),
-                "all_upcoming": lambda kinds: self.fetch_upcomings(
-                    configured_kinds=kinds,
-                    all_medias=True,
-                ),
-                "recommendation": lambda kinds: self.fetch_recommendations(
-                    configured_kinds=kinds,
-                ),
-                "anticipated": lambda kinds: self.fetch_anticipated_medias(
-                    configured_kinds=kinds,
-                ),
-                "all": lambda: self.fetch_next_to_watch(
-                    configured_kind=TraktKind.NEXT_TO_WATCH_ALL,
-                ),
-                "only_aired": lambda: self.fetch_next_to_watch(
-                    configured_kind=TraktKind.NEXT_TO_WATCH_AIRED,
-                    only_aired=True,
-                ),
-                "only_upcoming": lambda: self.fetch_next_to_watch(
-                    configured_kind=TraktKind.NEXT_TO_WATCH_UPCOMING,
-                    only_upcoming=True,
-                ),
-                "lists": lambda: self.fetch_lists(
-                    configured_kind=TraktKind.LIST,
-                ),
-                "stats": lambda: self.fetch_stats(),
-            }
-
-            """First, let's configure which sensors we need depending on configuration"""
-            for source in [
-                "upcoming",
-                "all_upcoming",
-                "recommendation",
-                "anticipated",
-            ]:
-                if configuration.source_exists(source):
-                    sources.append(source)
-                    kinds = configuration.get_kinds(source)
-                    coroutine_sources_data.append(source_function.get(source)(kinds))
-
-            if configuration.source_exists("watchlist"):
-                sources.append("watchlist")
-                coroutine_sources_data.append(self.fetch_watchlist())
-
-            """Then, let's add the next to watch sensors if needed"""
-            for sub_source in [
-                "all",
-                "only_aired",
-                "only_upcoming",
-            ]:
-                if configuration.next_to_watch_identifier_exists(sub_source):
-                    sources.append(sub_source)
-                    coroutine_sources_data.append(source_function.get(sub_source)())
-
-            """Add the lists sensors"""
-            if configuration.source_exists("lists"):
-                sources.append("lists")
-                coroutine_sources_data.append(source_function.get("lists")())
-
-            """ Add user stats """
-            if configuration.source_exists("stats"):
-                sources.append("stats")
-                coroutine_sources_data.append(source_function.get("stats")())
-
-            sources_data = await gather(*coroutine_sources_data)
-
-            return {
-                source: source_data
-                for source, source_data in zip(sources, sources_data)
-            }
+            configuration = get_configuration(self.hass.data)
+
+            self.plan = compile_refresh_plan(
+                configuration, self.account().get("consumers")
+            )
+            LOGGER.debug("Refresh plan compiled: %s", self.plan.as_dict())
+            self.retry_budget.reset()
+            self.metrics.cycle_started()
+            self._cycle = {}
+            self._configuration = configuration
+
+            try:
+                return await traced(
+                    "refresh",
+                    self.retrieve_sources_data(configuration),
+                    self.tracer,
+                    entry_id=self.entry_id,
+                )
+            finally:
+                self.metrics.cycle_finished()
+                # The requests of a failed or cancelled refresh aren't awaited anymore
+                for fetch in self._cycle.values():
+                    if not fetch.done():
+                        fetch.cancel()
+                self._cycle = None
+                self._configuration = None
+                if isinstance(self.transport, CassetteRecorder):
+                    await self.transport.save()
+
+    async def timed(self, source: str, coroutine: Awaitable[Any]) -> Any:
+        """Await the data of a source and record how long its refresh took."""
+        start = time.monotonic()
+        try:
+            return await traced("source", coroutine, source=source)
+        finally:
+            self.metrics.source_refreshed(source, start)
+
+    async def retrieve_sources_data(self, configuration: Configuration):
+        sources = []
+        coroutine_sources_data = []
+
+        source_function = {
+            "upcoming": lambda kinds: self.fetch_upcomings(
+                configured_kinds=kinds,
+                all_medias=False,
+            ),
+            "all_upcoming": lambda kinds: self.fetch_upcomings(
+                configured_kinds=kinds,
+                all_medias=True,
+            ),
+            "recommendation": lambda kinds: self.fetch_recommendations(
+                configured_kinds=kinds,
+            ),
+            "anticipated": lambda kinds: self.fetch_anticipated_medias(
+                configured_kinds=kinds,
+            ),
+            "all": lambda: self.fetch_next_to_watch(
+                configured_kind=TraktKind.NEXT_TO_WATCH_ALL,
+            ),
+            "only_aired": lambda: self.fetch_next_to_watch(
+                configured_kind=TraktKind.NEXT_TO_WATCH_AIRED,
+                only_aired=True,
+            ),
+            "only_upcoming": lambda: self.fetch_next_to_watch(
+                configured_kind=TraktKind.NEXT_TO_WATCH_UPCOMING,
+                only_upcoming=True,
+            ),
+            "lists": lambda: self.fetch_lists(
+                configured_kind=TraktKind.LIST,
+            ),
+            "stats": lambda: self.fetch_stats(),
+        }
+
+        """First, let's configure which sensors we need depending on configuration"""
+        for source in [
+            "upcoming",
+            "all_upcoming",
+            "recommendation",
+            "anticipated",
+        ]:
+            if configuration.source_exists(source):
+                sources.append(source)
+                kinds = configuration.get_kinds(source)
+                coroutine_sources_data.append(source_function.get(source)(kinds))
+
+        if configuration.source_exists("watchlist"):
+            sources.append("watchlist")
+            coroutine_sources_data.append(self.fetch_watchlist())
+
+        """Then, let's add the next to watch sensors if needed"""
+        for sub_source in [
+            "all",
+            "only_aired",
+            "only_upcoming",
+        ]:
+            if configuration.next_to_watch_identifier_exists(sub_source):
+                sources.append(sub_source)
+                coroutine_sources_data.append(source_function.get(sub_source)())
+
+        """Add the lists sensors"""
+        if configuration.source_exists("lists"):
+            sources.append("lists")
+            coroutine_sources_data.append(source_function.get("lists")())
+
+        """ Add user stats """
+        if configuration.source_exists("stats"):
+            sources.append("stats")
+            coroutine_sources_data.append(source_function.get("stats")())
+
+        sources_data, _ = await gather(
+            gather(
+                *[
+                    self.timed(source, coroutine)
+                    for source, coroutine in zip(sources, coroutine_sources_data)
+                ]
+            ),
+            self.run_plan(self.plan),
+        )
+
+        return {
+            source: source_data for source, source_data in zip(sources, sources_data)
+        }
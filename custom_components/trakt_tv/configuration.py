@@ -1,57 +1,184 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields, replace
 from datetime import datetime
-from typing import Any, Dict
-
-from dateutil.tz import tzlocal
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping, Optional, Tuple
 
 from custom_components.trakt_tv.const import DOMAIN
+from custom_components.trakt_tv.models.cache import CACHE_POLICIES, CachePolicy
 from custom_components.trakt_tv.models.kind import TraktKind
 
 
-@dataclass
+@dataclass(frozen=True)
+class SensorSettings:
+    """The settings of a source for a kind, with the defaults of the missing ones."""
+
+    days_to_fetch: int = 30
+    max_medias: int = 3
+    sort_by: str = "released"
+    sort_order: str = "asc"
+    exclude: Tuple[str, ...] = ()
+    exclude_collected: bool = False
+    only_released: bool = True
+    only_unwatched: bool = True
+    # Tell if the sort comes from the configuration, the sensors sort by date if not
+    sort_configured: bool = False
+
+
+# The defaults of the sources differing from the common ones
+SOURCE_DEFAULTS = {
+    "watchlist": SensorSettings(max_medias=20),
+}
+
+SETTINGS_FIELDS = {setting.name for setting in fields(SensorSettings)}
+
+
+def freeze(value: Any) -> Any:
+    """
+    Convert the dictionaries and the lists of a configuration into read-only ones.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def compile_settings(source: str, values: Mapping[str, Any]) -> SensorSettings:
+    settings = {key: value for key, value in values.items() if key in SETTINGS_FIELDS}
+    if "exclude" in settings:
+        settings["exclude"] = tuple(settings["exclude"])
+    return replace(
+        SOURCE_DEFAULTS.get(source, SensorSettings()),
+        **settings,
+        sort_configured="sort_by" in values,
+    )
+
+
+@dataclass(frozen=True)
 class Configuration:
-    data: Dict[str, Any]
+    """
+    An immutable snapshot of the validated configuration.
 
-    @property
-    def conf(self) -> Dict[str, Any]:
-        return self.data[DOMAIN]["configuration"]
+    The configuration is compiled once at setup, each sensor settings is computed
+    ahead. The snapshot is shared by every layer through the domain data and is
+    replaced as a whole when the configuration is reloaded.
+    """
 
-    def get_language(self) -> str:
+    conf: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    language: str = "en"
+    timezone: Optional[str] = None
+    derived_show_calendars: bool = False
+    stream_families: FrozenSet[str] = frozenset()
+    policies: Mapping[str, CachePolicy] = field(
+        default_factory=lambda: MappingProxyType(dict(CACHE_POLICIES))
+    )
+    settings: Mapping[Tuple[str, str], SensorSettings] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    kinds: Mapping[str, Tuple[TraktKind, ...]] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    stats_keys: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def compile(cls, conf: Dict[str, Any]) -> "Configuration":
+        """
+        Compile a validated configuration into a snapshot.
+
+        :param conf: The configuration of the domain, validated by the schema
+        :return: The snapshot of the configuration
+        """
+        sensors = conf.get("sensors", {})
+
+        settings = {}
+        kinds = {}
+        for source, identifiers in sensors.items():
+            if not isinstance(identifiers, dict):
+                continue
+            for identifier, values in identifiers.items():
+                settings[(source, identifier)] = compile_settings(source, values)
+            try:
+                kinds[source] = tuple(
+                    TraktKind.from_string(identifier) for identifier in identifiers
+                )
+            except ValueError:
+                # The identifiers of the source aren't kinds, such as next to watch
+                pass
+
+        policies = {
+            family: CachePolicy(
+                **{**vars(default), **conf.get("cache", {}).get(family, {})}
+            )
+            for family, default in CACHE_POLICIES.items()
+        }
+
+        return cls(
+            conf=freeze(conf),
+            language=conf.get("language", "en"),
+            timezone=conf.get("timezone"),
+            derived_show_calendars=conf.get("derive_show_calendars", False),
+            stream_families=frozenset(conf.get("stream_families", ())),
+            policies=MappingProxyType(policies),
+            settings=MappingProxyType(settings),
+            kinds=MappingProxyType(kinds),
+            stats_keys=frozenset(sensors.get("stats", ())),
+        )
+
+    def sensor_settings(self, source: str, identifier: str) -> SensorSettings:
+        """
+        The settings of a source for a kind, the defaults if it isn't configured.
+        """
         try:
-            return self.conf["language"]
+            return self.settings[(source, identifier)]
         except KeyError:
-            return "en"
+            return SOURCE_DEFAULTS.get(source, SensorSettings())
+
+    def get_language(self) -> str:
+        return self.language
 
     def get_timezone(self) -> str:
-        try:
-            return self.conf["timezone"]
-        except KeyError:
-            return datetime.now(tzlocal()).tzname()
+        if self.timezone is not None:
+            return self.timezone
+
+        from dateutil.tz import tzlocal
+
+        return datetime.now(tzlocal()).tzname()
+
+    def derive_show_calendars(self) -> bool:
+        return self.derived_show_calendars
+
+    def get_stream_families(self) -> FrozenSet[str]:
+        return self.stream_families
+
+    def get_cache_policy(self, family: str) -> CachePolicy:
+        return self.policies.get(family, self.policies["default"])
+
+    def get_cache_policies(self) -> Dict[str, CachePolicy]:
+        return dict(self.policies)
+
+    def get_cassette(self) -> Optional[Mapping[str, Any]]:
+        return self.conf.get("cassette")
+
+    def get_tracing(self) -> Optional[Mapping[str, Any]]:
+        return self.conf.get("tracing")
 
     def identifier_exists(self, identifier: str, source: str) -> bool:
-        try:
-            self.conf["sensors"][source][identifier]
-            return True
-        except KeyError:
-            return False
+        return (source, identifier) in self.settings
 
     def get_days_to_fetch(self, identifier: str, source: str) -> int:
-        try:
-            return self.conf["sensors"][source][identifier]["days_to_fetch"]
-        except KeyError:
-            return 30
+        return self.sensor_settings(source, identifier).days_to_fetch
 
     def get_max_medias(self, identifier: str, source: str) -> int:
-        try:
-            return self.conf["sensors"][source][identifier]["max_medias"]
-        except KeyError:
-            return 3
+        return self.sensor_settings(source, identifier).max_medias
 
-    def get_exclude_shows(self, identifier: str) -> list:
-        try:
-            return self.conf["sensors"]["next_to_watch"][identifier]["exclude"]
-        except KeyError:
-            return []
+    def get_sort_by(self, identifier: str, source: str) -> str:
+        return self.sensor_settings(source, identifier).sort_by
+
+    def get_sort_order(self, identifier: str, source: str) -> str:
+        return self.sensor_settings(source, identifier).sort_order
+
+    def get_exclude_shows(self, identifier: str) -> Tuple[str, ...]:
+        return self.sensor_settings("next_to_watch", identifier).exclude
 
     def next_to_watch_identifier_exists(self, identifier: str) -> bool:
         return self.identifier_exists(identifier, "next_to_watch")
@@ -85,62 +212,69 @@ class Configuration:
         return self.get_max_medias(identifier, "anticipated")
 
     def anticipated_exclude_collected(self, identifier: str) -> bool:
-        try:
-            return self.conf["sensors"]["anticipated"][identifier]["exclude_collected"]
-        except KeyError:
-            return False
+        return self.sensor_settings("anticipated", identifier).exclude_collected
 
     def watchlist_identifier_exists(self, identifier: str) -> bool:
         return self.identifier_exists(identifier, "watchlist")
 
     def get_watchlist_max_medias(self, identifier: str) -> int:
-        try:
-            return self.conf["sensors"]["watchlist"][identifier]["max_medias"]
-        except KeyError:
-            return 20
+        return self.get_max_medias(identifier, "watchlist")
 
     def get_watchlist_sort_by(self, identifier: str) -> str:
-        try:
-            return self.conf["sensors"]["watchlist"][identifier]["sort_by"]
-        except KeyError:
-            return "released"
+        return self.get_sort_by(identifier, "watchlist")
 
     def get_watchlist_sort_order(self, identifier: str) -> str:
-        try:
-            return self.conf["sensors"]["watchlist"][identifier]["sort_order"]
-        except KeyError:
-            return "asc"
+        return self.get_sort_order(identifier, "watchlist")
 
     def is_watchlist_only_released(self, identifier: str) -> bool:
-        try:
-            return self.conf["sensors"]["watchlist"][identifier]["only_released"]
-        except KeyError:
-            return True
+        return self.sensor_settings("watchlist", identifier).only_released
 
     def is_watchlist_only_unwatched(self, identifier: str) -> bool:
-        try:
-            return self.conf["sensors"]["watchlist"][identifier]["only_unwatched"]
-        except KeyError:
-            return True
+        return self.sensor_settings("watchlist", identifier).only_unwatched
 
-    def get_sensor_config(self, identifier: str) -> list:
+    def get_sensor_config(self, identifier: str) -> Tuple[Mapping[str, Any], ...]:
         try:
             return self.conf["sensors"][identifier]
         except KeyError:
-            return []
+            return ()
 
     def stats_key_exists(self, key: str) -> bool:
-        return key in self.conf["sensors"]["stats"]
+        return key in self.stats_keys
 
     def source_exists(self, source: str) -> bool:
+        return source in self.conf.get("sensors", {})
+
+    def get_kinds(self, source: str) -> list[TraktKind]:
         try:
-            self.conf["sensors"][source]
-            return True
+            return list(self.kinds[source])
         except KeyError:
-            return False
+            return [
+                TraktKind.from_string(identifier)
+                for identifier in self.conf["sensors"][source].keys()
+            ]
 
-    def get_kinds(self, source: str) -> list[TraktKind]:
-        return [
-            TraktKind.from_string(identifier)
-            for identifier in self.conf["sensors"][source].keys()
-        ]
+
+def get_configuration(data: Dict[str, Any]) -> Configuration:
+    """
+    Find the configuration snapshot shared by the integration.
+
+    :param data: The data of Home Assistant
+    :return: The snapshot compiled at setup, an empty one if there is none
+    """
+    try:
+        return data[DOMAIN]["configuration"]
+    except KeyError:
+        return Configuration()
+
+
+def set_configuration(data: Dict[str, Any], conf: Dict[str, Any]) -> Configuration:
+    """
+    Compile a validated configuration and replace the shared snapshot with it.
+
+    :param data: The data of Home Assistant
+    :param conf: The configuration of the domain, validated by the schema
+    :return: The new snapshot
+    """
+    configuration = Configuration.compile(conf)
+    data.setdefault(DOMAIN, {})["configuration"] = configuration
+    return configuration
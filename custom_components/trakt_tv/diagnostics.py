@@ -0,0 +1,107 @@
+"""Diagnostics of the Trakt integration."""
+
+import json
+from collections.abc import Mapping
+from typing import Any, Dict
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_CLIENT_ID, CONF_CLIENT_SECRET
+from homeassistant.core import HomeAssistant
+
+from .configuration import get_configuration
+from .const import DOMAIN
+from .models.cache import NEGATIVE_ENTRY
+
+TO_REDACT = {
+    CONF_CLIENT_ID,
+    CONF_CLIENT_SECRET,
+    "access_token",
+    "refresh_token",
+}
+
+
+def thaw(value: Any) -> Any:
+    """Convert the read-only configuration into dictionaries and lists."""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def size_of(value: Any) -> int:
+    """The number of bytes of a value once serialized to JSON."""
+    return len(json.dumps(value, default=str).encode())
+
+
+def cache_sizes(cache: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """
+    Measure the entries of a cache layer by endpoint family.
+
+    :param cache: The cache entries, keyed by "family:key"
+    :return: The number of entries, missing resources and bytes of each family
+    """
+    sizes = {}
+    for key, value in cache.items():
+        if key.endswith("_time"):
+            continue
+        family = sizes.setdefault(
+            key.split(":", 1)[0], {"entries": 0, "negative": 0, "bytes": 0}
+        )
+        family["entries"] += 1
+        if value == NEGATIVE_ENTRY:
+            family["negative"] += 1
+        else:
+            family["bytes"] += size_of(value)
+    return sizes
+
+
+def sensor_sizes(attributes: Dict[str, Any]) -> Dict[str, int]:
+    """The number of bytes of the rendered attributes of each sensor."""
+    return {name: size_of(value) for name, value in attributes.items()}
+
+
+def measure(
+    layers: Dict[str, Dict[str, Any]], attributes: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Measure the snapshots of the caches and of the sensors attributes.
+
+    :param layers: The copies of the account and shared caches
+    :param attributes: The rendered attributes of each sensor
+    :return: The sizes of the caches by family, and of the attributes by sensor
+    """
+    return {
+        "cache": {name: cache_sizes(cache) for name, cache in layers.items()},
+        "sensors": sensor_sizes(attributes),
+    }
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> Dict[str, Any]:
+    """Return the diagnostics of a config entry."""
+    domain_data = hass.data[DOMAIN]
+    account = domain_data[entry.entry_id]
+    api = account["instances"]["api"]
+
+    # The caches are copied and the attributes rendered on the event loop, the
+    # refreshes change them, then the snapshots are measured aside
+    layers = {
+        "account": dict(account["cache"]),
+        "shared": dict(domain_data["shared"]["cache"]),
+    }
+    attributes = {
+        sensor.name: sensor.extra_state_attributes or {}
+        for sensor in account.get("sensors", [])
+    }
+    sizes = await hass.async_add_executor_job(measure, layers, attributes)
+
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "configuration": thaw(get_configuration(hass.data).conf),
+        "metrics": api.metrics.as_dict(),
+        "refresh_plan": api.plan.as_dict() if api.plan else None,
+        **sizes,
+    }
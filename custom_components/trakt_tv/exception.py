@@ -1,2 +1,10 @@
 class TraktException(Exception):
     """The trakt Exception class"""
+
+
+class TraktNotFoundException(TraktException):
+    """The requested resource doesn't exist"""
+
+
+class TraktCircuitOpenException(TraktException):
+    """The requests to the host are suspended after repeated failures"""
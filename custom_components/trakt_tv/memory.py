@@ -0,0 +1,349 @@
+"""Account for the memory held by the integration, to find its leaks and its bloat."""
+
+import os
+import sys
+import time
+import tracemalloc
+from copy import copy
+from datetime import datetime
+from enum import Enum
+from types import FunctionType, MethodType, ModuleType
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from homeassistant.core import HomeAssistant
+
+from .configuration import get_configuration
+from .const import DOMAIN
+from .models.cache import NEGATIVE_ENTRY, CachePolicy
+from .models.media import Medias
+
+# The objects shared with the rest of Home Assistant, never counted
+SHARED_TYPES = (type, ModuleType, FunctionType, MethodType, Enum)
+
+# The directory of the integration, the allocations are attributed to its modules
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# The modules building the reports, their allocations aren't reported
+REPORTING_MODULES = {"memory.py", "services.py"}
+
+# The allocations by line of the last snapshot, compared with the next one
+TRACEMALLOC_BASELINE = f"{DOMAIN}_tracemalloc"
+
+
+def deep_size(value: Any, seen: Optional[Set[int]] = None) -> int:
+    """
+    Approximate the bytes of a value with all the objects it references.
+
+    :param value: The value to measure
+    :param seen: The ids of the objects already counted, they aren't counted again
+    :return: The number of bytes
+    """
+    seen = seen if seen is not None else set()
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif not isinstance(item, (str, bytes, int, float, datetime)):
+            if hasattr(item, "__dict__"):
+                stack.append(vars(item))
+            for cls in type(item).__mro__:
+                slots = getattr(cls, "__slots__", ())
+                for slot in (slots,) if isinstance(slots, str) else slots:
+                    if hasattr(item, slot):
+                        stack.append(getattr(item, slot))
+    return size
+
+
+def cache_report(
+    cache: Dict[str, Any],
+    policies: Callable[[str], CachePolicy],
+    now: Optional[float] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Measure the entries of a cache layer by endpoint family.
+
+    The entries are only evicted when they are read, so the expired ones no longer
+    usable, even as a stale fallback, stay until the same request is made again.
+
+    :param cache: The cache entries, keyed by "family:key"
+    :param policies: Return the cache policy of an endpoint family
+    :param now: The current timestamp
+    :return: The entries, the missing resources, the expired entries and the bytes of
+             each family
+    """
+    now = now if now is not None else time.time()
+    seen: Set[int] = set()
+    report: Dict[str, Dict[str, int]] = {}
+
+    for key, value in cache.items():
+        if key.endswith("_time"):
+            continue
+        name = key.split(":", 1)[0]
+        family = report.setdefault(
+            name, {"entries": 0, "negative": 0, "expired": 0, "bytes": 0}
+        )
+        policy = policies(name)
+        lifetime = policy.negative if value == NEGATIVE_ENTRY else policy.ttl
+        if value == NEGATIVE_ENTRY:
+            family["negative"] += 1
+        else:
+            lifetime += policy.stale
+        if now - cache.get(f"{key}_time", now) > lifetime:
+            family["expired"] += 1
+        family["entries"] += 1
+        family["bytes"] += deep_size(key, seen) + deep_size(value, seen)
+    return report
+
+
+def medias_snapshot(medias: Medias) -> Dict[str, Any]:
+    """
+    Copy the containers of a media collection, the renderings and the sorts of the
+    sensors fill its indexes.
+    """
+    columns = medias._columns
+    return {
+        "items": list(medias.items),
+        "rendered": dict(medias.rendered),
+        "columns": dict(columns.columns) if columns is not None else None,
+    }
+
+
+def data_snapshot(data: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Copy the data of the coordinator, to measure it off the event loop.
+
+    :param data: The data of the last refresh, by source and kind
+    :return: The snapshots of the media collections of each source, or a copy of its
+             data if it has none
+    """
+    snapshot = {}
+    for source, source_data in (data or {}).items():
+        collections = []
+        for value in source_data.values() if isinstance(source_data, dict) else []:
+            if isinstance(value, Medias):
+                collections.append(value)
+            elif isinstance(value, dict):
+                collections.extend(
+                    item for item in value.values() if isinstance(item, Medias)
+                )
+        snapshot[source] = {
+            "collections": [medias_snapshot(medias) for medias in collections],
+            "data": None if collections else copy(source_data),
+        }
+    return snapshot
+
+
+def medias_report(medias: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Measure the snapshot of a media collection and the indexes built on it: the
+    rendered sensor attributes and the columns. The objects shared with the medias are
+    counted once.
+    """
+    seen: Set[int] = set()
+    return {
+        "medias": len(medias["items"]),
+        "bytes": deep_size(medias["items"], seen),
+        "rendered": deep_size(medias["rendered"], seen),
+        "columns": deep_size(medias["columns"], seen),
+    }
+
+
+def data_report(snapshot: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """
+    Measure the data of the coordinator by source.
+
+    :param snapshot: The snapshot of the data of the last refresh, see data_snapshot
+    :return: The size of the medias and of their indexes of each source
+    """
+    report = {}
+    for source, source_snapshot in snapshot.items():
+        total = {"medias": 0, "bytes": 0, "rendered": 0, "columns": 0}
+        for medias in source_snapshot["collections"]:
+            for key, size in medias_report(medias).items():
+                total[key] += size
+        if not source_snapshot["collections"]:
+            total["bytes"] = deep_size(source_snapshot["data"])
+        report[source] = total
+    return report
+
+
+def measure(
+    layers: Dict[str, Dict[str, Any]],
+    policies: Callable[[str], CachePolicy],
+    pending: Dict[str, int],
+    data: Dict[str, Dict[str, Any]],
+    state: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Measure the snapshots of the caches, the coordinator data and the state of an
+    account.
+    """
+    caches = {name: cache_report(cache, policies) for name, cache in layers.items()}
+    coordinator = data_report(data)
+    state = {name: deep_size(value) for name, value in state.items()}
+
+    total = (
+        sum(family["bytes"] for cache in caches.values() for family in cache.values())
+        + sum(
+            source["bytes"] + source["rendered"] + source["columns"]
+            for source in coordinator.values()
+        )
+        + sum(state.values())
+    )
+    return {
+        "caches": caches,
+        "pending": pending,
+        "coordinator": coordinator,
+        **state,
+        "total": total,
+    }
+
+
+def allocations_by_line(
+    snapshot: tracemalloc.Snapshot,
+) -> Dict[str, Tuple[int, int]]:
+    """
+    Attribute the traced allocations to the lines of the integration.
+
+    An allocation is attributed to the most recent frame of its traceback inside the
+    integration, the allocations out of the integration or made by the reports are
+    ignored.
+
+    :return: The bytes and the number of blocks of each "module:line"
+    """
+    lines: Dict[str, Tuple[int, int]] = {}
+    for trace in snapshot.traces:
+        for frame in reversed(trace.traceback):
+            if frame.filename.startswith(PACKAGE_DIRECTORY):
+                module = os.path.relpath(frame.filename, PACKAGE_DIRECTORY)
+                if module in REPORTING_MODULES:
+                    break
+                key = f"{module}:{frame.lineno}"
+                size, count = lines.get(key, (0, 0))
+                lines[key] = (size + trace.size, count + 1)
+                break
+    return lines
+
+
+def tracemalloc_report(
+    baseline: Optional[Dict[str, Tuple[int, int]]], path: str, top: int
+) -> Tuple[Dict[str, Tuple[int, int]], Dict[str, Any]]:
+    """
+    Take a snapshot of the traced allocations and compare it with the previous one.
+
+    :param baseline: The allocations by line of the previous snapshot
+    :param path: The path the snapshot is saved to
+    :param top: The number of lines reported
+    :return: The allocations by line, and the report of the largest and the growing
+             lines
+    """
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(True, f"{PACKAGE_DIRECTORY}{os.sep}*", all_frames=True)]
+    )
+    snapshot.dump(path)
+    lines = allocations_by_line(snapshot)
+
+    def ranked(sizes: Dict[str, Tuple[int, int]]) -> Dict[str, Dict[str, int]]:
+        largest = sorted(sizes.items(), key=lambda item: abs(item[1][0]), reverse=True)
+        return {
+            line: {"bytes": size, "blocks": count}
+            for line, (size, count) in largest[:top]
+            if size
+        }
+
+    growth = None
+    if baseline is not None:
+        changes = {}
+        for line in set(lines) | set(baseline):
+            size, count = lines.get(line, (0, 0))
+            previous_size, previous_count = baseline.get(line, (0, 0))
+            changes[line] = (size - previous_size, count - previous_count)
+        growth = ranked(changes)
+
+    return lines, {
+        "snapshot": path,
+        "bytes": sum(size for size, _ in lines.values()),
+        "largest": ranked(lines),
+        "growth": growth,
+    }
+
+
+async def async_memory_report(
+    hass: HomeAssistant,
+    entry_id: str,
+    trace: bool = False,
+    frames: int = 25,
+    top: int = 20,
+    stop_tracing: bool = False,
+) -> Dict[str, Any]:
+    """
+    Report the memory held by an account, and optionally the traced allocations.
+
+    The first traced report starts tracemalloc, the allocations are traced from then
+    on. The next ones take a snapshot and compare it with the previous one. Tracing
+    slows Home Assistant down until it is stopped.
+
+    :param entry_id: The config entry of the account
+    :param trace: True to trace the allocations with tracemalloc
+    :param frames: The number of frames kept by allocation when tracing starts
+    :param top: The number of lines reported by tracemalloc
+    :param stop_tracing: True to stop tracing after the report
+    :return: The sizes of the caches, coordinator data and indexes, and the traced
+             allocations
+    """
+    domain_data = hass.data[DOMAIN]
+    account = domain_data[entry_id]
+    instances = account["instances"]
+
+    # The containers are copied on the event loop, the refreshes and the sensors
+    # change them, only the snapshots are measured aside
+    layers = {
+        "account": dict(account["cache"]),
+        "shared": dict(domain_data["shared"]["cache"]),
+    }
+    pending = {
+        "account": len(account["pending"]),
+        "shared": len(domain_data["shared"]["pending"]),
+    }
+    api = instances["api"]
+    state = {
+        "refresh_plan": api.plan.as_dict() if api.plan else None,
+        "metrics": api.metrics.as_dict(),
+    }
+    report = await hass.async_add_executor_job(
+        measure,
+        layers,
+        get_configuration(hass.data).get_cache_policy,
+        pending,
+        data_snapshot(instances["coordinator"].data),
+        state,
+    )
+
+    if trace and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        hass.data[TRACEMALLOC_BASELINE] = {}
+        report["tracemalloc"] = {"started": True}
+    elif trace:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = hass.config.path(f"{DOMAIN}_memory_{stamp}.tracemalloc")
+        hass.data[TRACEMALLOC_BASELINE], report["tracemalloc"] = (
+            await hass.async_add_executor_job(
+                tracemalloc_report, hass.data.get(TRACEMALLOC_BASELINE), path, top
+            )
+        )
+
+    if stop_tracing and tracemalloc.is_tracing():
+        tracemalloc.stop()
+        hass.data.pop(TRACEMALLOC_BASELINE, None)
+
+    return report
@@ -0,0 +1,65 @@
+import re
+from dataclasses import dataclass
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    ttl: int
+    stale: int = 0
+    persist: bool = False
+    negative: int = 0
+
+
+# The value cached for a resource known to be missing, during the negative ttl
+NEGATIVE_ENTRY = {"not_found": True}
+
+
+# The policy of each endpoint family, the refresh happens every 8 minutes so a family
+# with a ttl lower than that is fetched on every refresh. The families changed by the
+# user activity, such as watching an episode or adding a media to the watchlist, are
+# fetched on every refresh.
+CACHE_POLICIES = {
+    "calendars": CachePolicy(ttl=1 * HOUR, stale=1 * DAY, persist=True),
+    "progress": CachePolicy(ttl=5 * MINUTE, stale=1 * DAY, persist=True),
+    "episode_info": CachePolicy(ttl=1 * DAY, stale=7 * DAY, persist=True),
+    "hidden": CachePolicy(ttl=1 * HOUR, stale=7 * DAY, persist=True),
+    "sync": CachePolicy(ttl=5 * MINUTE, stale=1 * HOUR),
+    "recommendations": CachePolicy(ttl=1 * HOUR, stale=1 * DAY),
+    "anticipated": CachePolicy(ttl=6 * HOUR, stale=1 * DAY, persist=True),
+    "watchlist": CachePolicy(ttl=5 * MINUTE, stale=1 * DAY, persist=True),
+    "lists": CachePolicy(ttl=30 * MINUTE, stale=1 * DAY, persist=True),
+    "stats": CachePolicy(ttl=1 * HOUR, stale=1 * DAY),
+    "tmdb": CachePolicy(ttl=7 * DAY, stale=30 * DAY, persist=True, negative=1 * DAY),
+    "tmdb_find": CachePolicy(ttl=30 * DAY, persist=True, negative=1 * DAY),
+    "default": CachePolicy(ttl=8 * MINUTE),
+}
+
+ENDPOINT_FAMILIES = [
+    ("calendars", re.compile(r"^calendars/")),
+    ("progress", re.compile(r"^shows/[^/]+/progress/")),
+    ("episode_info", re.compile(r"^shows/[^/]+/seasons/")),
+    ("hidden", re.compile(r"^users/hidden/")),
+    ("sync", re.compile(r"^sync/")),
+    ("recommendations", re.compile(r"^recommendations/")),
+    ("anticipated", re.compile(r"^(movies|shows)/anticipated")),
+    ("stats", re.compile(r"^users/[^/]+/stats")),
+    ("watchlist", re.compile(r"^users/[^/]+/watchlist\b")),
+    ("lists", re.compile(r"^(users/[^/]+/)?(lists|favorites)\b")),
+]
+
+
+def endpoint_family(url: str) -> str:
+    """
+    Find the family of a Trakt endpoint.
+
+    :param url: The url of the endpoint, relative to the API host
+    :return: The family, "default" if the endpoint doesn't belong to any family
+    """
+    for family, pattern in ENDPOINT_FAMILIES:
+        if pattern.match(url):
+            return family
+    return "default"
@@ -0,0 +1,167 @@
+"""Columnar representation of the sortable fields of large media collections."""
+
+import math
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    import numpy
+
+# The fields sorted and filtered on, stored as float columns with NaN when missing
+COLUMNS = (
+    "rank",
+    "rating",
+    "rating_trakt",
+    "runtime",
+    "released",
+    "listed_at",
+    "last_activity_date",
+)
+
+# Below this number of medias, the python passes are faster than building columns
+COLUMNAR_THRESHOLD = 1000
+
+
+@lru_cache(maxsize=None)
+def load_numpy():
+    """
+    Import NumPy on first use, it is optional and slow to import.
+
+    :return: The numpy module, None if it isn't installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def is_columnar(number_of_medias: int) -> bool:
+    """
+    Tell if a collection is large enough to be handled by columns.
+
+    :param number_of_medias: The size of the collection
+    :return: True if the collection reaches the threshold and NumPy is available
+    """
+    return number_of_medias >= COLUMNAR_THRESHOLD and load_numpy() is not None
+
+
+def to_number(value: Any) -> float:
+    """
+    Convert a sortable field into a float, the dates into timestamps.
+    """
+    if value is None:
+        return math.nan
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+class MediaColumns:
+    """
+    The sortable fields of medias stored as NumPy arrays, built on first use.
+
+    The medias must not change once the columns are built.
+    """
+
+    def __init__(self, items: Sequence[Any]):
+        self.items = items
+        self.columns: Dict[str, "numpy.ndarray"] = {}
+        self.numpy = load_numpy()
+
+    def column(self, name: str) -> "numpy.ndarray":
+        if name not in self.columns:
+            self.columns[name] = self.numpy.fromiter(
+                (to_number(getattr(media, name, None)) for media in self.items),
+                dtype=self.numpy.float64,
+                count=len(self.items),
+            )
+        return self.columns[name]
+
+    def trakt_ids(self) -> "numpy.ndarray":
+        if "trakt" not in self.columns:
+            self.columns["trakt"] = self.numpy.fromiter(
+                (
+                    -1 if media.ids.trakt is None else media.ids.trakt
+                    for media in self.items
+                ),
+                dtype=self.numpy.int64,
+                count=len(self.items),
+            )
+        return self.columns["trakt"]
+
+    def select(self, indices: "numpy.ndarray") -> List[Any]:
+        """Materialize the medias of the given rows, in their order."""
+        return [self.items[index] for index in indices.tolist()]
+
+    def take(self, mask: "numpy.ndarray") -> "MediaColumns":
+        """Keep the masked rows, the columns already built are sliced, not rebuilt."""
+        indices = self.numpy.flatnonzero(mask)
+        columns = MediaColumns(self.select(indices))
+        columns.columns = {
+            name: column[indices] for name, column in self.columns.items()
+        }
+        return columns
+
+    def has_missing(self, name: str) -> bool:
+        return bool(self.numpy.isnan(self.column(name)).any())
+
+    def released_mask(
+        self, date: datetime, before: bool, inclusive: bool
+    ) -> "numpy.ndarray":
+        """
+        Find the medias released before or after a date, never the unreleased ones.
+        """
+        # The comparisons with NaN are always false
+        released = self.column("released")
+        timestamp = to_number(date)
+        if before:
+            mask = released <= timestamp if inclusive else released < timestamp
+        else:
+            mask = released >= timestamp if inclusive else released > timestamp
+        return mask
+
+    def excluding_mask(self, trakt_ids) -> "numpy.ndarray":
+        ids = self.numpy.fromiter(
+            trakt_ids, dtype=self.numpy.int64, count=len(trakt_ids)
+        )
+        return ~self.numpy.isin(self.trakt_ids(), ids)
+
+    def order(
+        self,
+        name: str,
+        descending: bool = False,
+        count: Optional[int] = None,
+        default: Optional[float] = None,
+    ) -> Optional["numpy.ndarray"]:
+        """
+        Find the rows of the medias sorted by a field, like a stable python sort.
+
+        :param name: The field to sort by
+        :param descending: True to sort from the highest value
+        :param count: The number of rows to keep, only those are fully sorted
+        :param default: The value of the missing fields
+        :return: The sorted rows, None if some fields are missing without a default
+        """
+        values = self.column(name)
+        missing = self.numpy.isnan(values)
+        if missing.any():
+            if default is None:
+                return None
+            values = self.numpy.where(missing, default, values)
+        if descending:
+            values = -values
+
+        if count is None or count >= len(values):
+            return self.numpy.argsort(values, kind="stable")
+        if count <= 0:
+            return self.numpy.empty(0, dtype=self.numpy.intp)
+
+        # The ties of the last kept value are all candidates, to stay stable
+        kth = values[self.numpy.argpartition(values, count - 1)[count - 1]]
+        candidates = self.numpy.flatnonzero(values <= kth)
+        ordered = candidates[self.numpy.argsort(values[candidates], kind="stable")]
+        return ordered[:count]
@@ -60,3 +60,27 @@ ANTICIPATED_KINDS = [
     TraktKind.ANTICIPATED_MOVIE,
     TraktKind.ANTICIPATED_SHOW,
 ]
+
+
+def is_new_show(data) -> bool:
+    """Check if a shows calendar entry is a series premiere."""
+    episode = data.get("episode") or {}
+    if episode_type := episode.get("episode_type"):
+        return episode_type == "series_premiere"
+    return episode.get("season") == 1 and episode.get("number") == 1
+
+
+def is_premiere(data) -> bool:
+    """Check if a shows calendar entry is a series, season or mid season premiere."""
+    episode = data.get("episode") or {}
+    if episode_type := episode.get("episode_type"):
+        return episode_type.endswith("premiere")
+    return (episode.get("season") or 0) > 0 and episode.get("number") == 1
+
+
+# Kinds whose calendar is a subset of the shows calendar, with the filter to apply
+SHOW_CALENDAR_FILTERS = {
+    TraktKind.SHOW: lambda data: True,
+    TraktKind.NEW_SHOW: is_new_show,
+    TraktKind.PREMIERE: is_premiere,
+}
@@ -1,17 +1,28 @@
+import sys
 from abc import ABC, abstractmethod, abstractstaticmethod
-from asyncio import gather
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Type
-
-from custom_components.trakt_tv.apis.tmdb import (
-    get_movie_data,
-    get_movie_trailer,
-    get_show_data,
-    get_show_trailer,
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
 )
+
+from custom_components.trakt_tv.models.columns import COLUMNS, MediaColumns, is_columnar
 from custom_components.trakt_tv.utils import parse_utc_date
 
+# The HTTP clients are imported when the medias are completed, the models are loaded
+# at startup by the configuration and the schema
+if TYPE_CHECKING:
+    from custom_components.trakt_tv.apis.middlewares import Handler
+
 first_item = {
     "title_default": "$title",
     "line1_default": "$episode",
@@ -22,7 +33,44 @@ first_item = {
 }
 
 
-@dataclass
+TMDB_IMAGE_URL = "https://image.tmdb.org/t/p/w500"
+
+
+def intern_name(name: Optional[str]) -> Optional[str]:
+    """
+    Share the strings repeated between the medias, such as genres and studios.
+    """
+    return sys.intern(name) if name else name
+
+
+def genre_names(slugs: Optional[List[str]]) -> Tuple[str, ...]:
+    """
+    Convert the trakt genre slugs such as science-fiction into names.
+    """
+    return tuple(intern_name(slug.replace("-", " ").title()) for slug in slugs or [])
+
+
+def image_url(path: Optional[str]) -> Optional[str]:
+    """
+    Expand an image path, the medias only keep the path.
+
+    The TMDB paths are absolute, the trakt ones start with their host.
+    """
+    if not path:
+        return None
+    return f"{TMDB_IMAGE_URL}{path}" if path.startswith("/") else f"https://{path}"
+
+
+def trakt_image(data: Dict[str, Any], kind: str) -> Optional[str]:
+    """
+    Find the first image of a kind in the trakt images, requested with
+    extended=images.
+    """
+    images = (data.get("images") or {}).get(kind)
+    return images[0] if images else None
+
+
+@dataclass(slots=True)
 class Identifiers:
     trakt: Optional[int]
     slug: Optional[str]
@@ -45,12 +93,26 @@ class Identifiers:
             tmdb=int(ids["tmdb"]) if ids.get("tmdb") else None,
         )
 
+    def to_homeassistant(self) -> Dict[str, Any]:
+        return {
+            "trakt": self.trakt,
+            "slug": self.slug,
+            "tvdb": self.tvdb,
+            "imdb": self.imdb,
+            "tmdb": self.tmdb,
+        }
 
-@dataclass
+
+@dataclass(slots=True)
 class Media(ABC):
     name: str
     ids: Identifiers
 
+    # The fields TMDB can complete, the other ones only come from trakt
+    tmdb_fields: ClassVar[Tuple[str, ...]] = ()
+    # The fields trakt only provides in english
+    translated_fields: ClassVar[Tuple[str, ...]] = ("name", "summary", "genres")
+
     @abstractstaticmethod
     def from_trakt(data) -> "Media":
         """
@@ -74,9 +136,9 @@ class Media(ABC):
         """
         default = {
             "title": self.name,
-            "poster": self.poster,
-            "fanart": self.fanart,
-            "genres": self.genres,
+            "poster": image_url(self.poster),
+            "fanart": image_url(self.fanart),
+            "genres": list(self.genres),
             "rating": self.rating,
             "rating_trakt": self.rating_trakt,
             "studio": self.studio,
@@ -84,23 +146,55 @@ class Media(ABC):
 
         return {k: v for k, v in default.items() if v is not None}
 
-    async def get_more_information(self, language: str):
+    def missing_fields(self, language: str) -> Set[str]:
+        """
+        Find the fields TMDB should complete.
+
+        :param language: The favorite language of the user
+        :return: The fields missing from the trakt data, or in the wrong language
+        """
+        missing = {name for name in self.tmdb_fields if not getattr(self, name)}
+        if language != "en":
+            missing.update(self.translated_fields)
+        return missing
+
+    async def resolve_tmdb_id(
+        self, kind: str, http: Optional["Handler"] = None
+    ) -> Optional[int]:
+        """
+        Find the TMDB ID of the media if trakt doesn't provide it.
+
+        :param kind: The kind of media for TMDB, movie or tv
+        :param http: The middleware chain sending the TMDB requests
+        :return: The TMDB ID, None if it can't be found
+        """
+        if self.ids.tmdb is None and (self.ids.imdb or self.ids.tvdb):
+            from custom_components.trakt_tv.apis.tmdb import find_tmdb_id
+
+            self.ids.tmdb = await find_tmdb_id(kind, self.ids.imdb, self.ids.tvdb, http)
+        return self.ids.tmdb
+
+    async def get_more_information(
+        self, language: str, http: Optional["Handler"] = None
+    ):
         """
         Get information from other API calls to complete the trakt movie.
 
         :param language: The favorite language of the user
+        :param http: The middleware chain sending the TMDB requests
         """
 
 
-@dataclass
+@dataclass(slots=True)
 class Movie(Media):
     """
     An upcoming movie
     """
 
-    genres: List[str] = field(default_factory=list)
+    genres: Tuple[str, ...] = ()
     trailer: Optional[str] = None
     summary: Optional[str] = None
+    # The TMDB or trakt paths of the images, expanded when converted
     poster: Optional[str] = None
     fanart: Optional[str] = None
     rating: Optional[int] = None
@@ -111,6 +205,18 @@ class Movie(Media):
     listed_at: Optional[datetime] = None
     rating_trakt: Optional[int] = None
 
+    # The studios of a movie are not part of the extended trakt data
+    tmdb_fields: ClassVar[Tuple[str, ...]] = (
+        "trailer",
+        "summary",
+        "poster",
+        "fanart",
+        "genres",
+        "runtime",
+        "studio",
+        "released",
+    )
+
     @staticmethod
     def from_trakt(data) -> "Movie":
         """
@@ -120,48 +226,70 @@ class Movie(Media):
 
         return Movie(
             name=movie["title"],
-            released=parse_utc_date(data.get("released")),
+            released=parse_utc_date(data.get("released") or movie.get("released")),
             ids=Identifiers.from_trakt(movie),
+            genres=genre_names(movie.get("genres")),
+            trailer=movie.get("trailer"),
+            summary=movie.get("overview"),
+            poster=trakt_image(movie, "poster"),
+            fanart=trakt_image(movie, "fanart"),
+            rating=movie.get("rating"),
+            runtime=movie.get("runtime"),
             rank=data.get("rank"),
             listed_at=parse_utc_date(data.get("listed_at")),
             rating_trakt=movie.get("rating"),
         )
 
-    async def get_more_information(self, language: str):
+    async def get_more_information(
+        self, language: str, http: Optional["Handler"] = None
+    ):
         """
         Get information from other API calls to complete the trakt movie.
 
         :param language: The favorite language of the user
+        :param http: The middleware chain sending the TMDB requests
         """
-        data, trailer = await gather(
-            get_movie_data(self.ids.tmdb, language),
-            get_movie_trailer(self.ids.tmdb, language),
-        )
+        missing = self.missing_fields(language)
+
+        if missing and await self.resolve_tmdb_id("movie", http):
+            from custom_components.trakt_tv.apis.tmdb import get_movie_data
+
+            data = await get_movie_data(
+                self.ids.tmdb, language, http, with_trailer="trailer" in missing
+            )
+            self.complete(data, missing)
+
+        if not self.released:
+            self.released = datetime.min
+
+    def complete(self, data: Dict[str, Any], missing: Set[str]):
+        """
+        Complete the missing fields of the movie using TMDB data.
 
-        if title := data.get("title"):
+        :param data: The TMDB data of the movie
+        :param missing: The fields to complete
+        """
+        if "name" in missing and (title := data.get("title")):
             self.name = title
-        if trailer:
+        if "trailer" in missing and (trailer := data.get("trailer")):
             self.trailer = trailer
-        if summary := data.get("overview"):
+        if "summary" in missing and (summary := data.get("overview")):
             self.summary = summary
-        if poster := data.get("poster_path"):
-            self.poster = f"https://image.tmdb.org/t/p/w500{poster}"
-        if fanart := data.get("backdrop_path"):
-            self.fanart = f"https://image.tmdb.org/t/p/w500{fanart}"
-        if genres := data.get("genres"):
-            self.genres = [genre["name"] for genre in genres]
-        if vote_average := data.get("vote_average"):
-            if vote_average != 0:
-                self.rating = vote_average
-        if runtime := data.get("runtime"):
+        if "poster" in missing and (poster := data.get("poster_path")):
+            self.poster = poster
+        if "fanart" in missing and (fanart := data.get("backdrop_path")):
+            self.fanart = fanart
+        if "genres" in missing and (genres := data.get("genres")):
+            self.genres = tuple(intern_name(genre["name"]) for genre in genres)
+        # The rating comes from trakt, TMDB only completes the unrated medias
+        if not self.rating and (vote_average := data.get("vote_average")):
+            self.rating = vote_average
+        if "runtime" in missing and (runtime := data.get("runtime")):
             self.runtime = runtime
-        if production_companies := data.get("production_companies"):
-            self.studio = production_companies[0].get("name")
-        if not self.released:
-            if data.get("release_date"):
-                self.released = parse_utc_date(data.get("release_date"))
-            else:
-                self.released = datetime.min
+        if "studio" in missing and (companies := data.get("production_companies")):
+            self.studio = intern_name(companies[0].get("name"))
+        if "released" in missing and data.get("release_date"):
+            self.released = parse_utc_date(data.get("release_date"))
 
     def to_homeassistant(self) -> Dict[str, Any]:
         """
@@ -175,7 +303,7 @@ class Movie(Media):
             "runtime": self.runtime,
             "release": "$day, $date $time",
             "airdate": self.released.replace(tzinfo=None).isoformat() + "Z",
-            "ids": asdict(self.ids),
+            "ids": self.ids.to_homeassistant(),
         }
 
         if self.ids.slug is not None:
@@ -188,7 +316,7 @@ class Movie(Media):
         return default
 
 
-@dataclass
+@dataclass(slots=True)
 class Episode:
     number: int
     season: int
@@ -210,13 +338,14 @@ class Episode:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Show(Media):
     trailer: Optional[str] = None
     summary: Optional[str] = None
+    # The TMDB or trakt paths of the images, expanded when converted
     poster: Optional[str] = None
     fanart: Optional[str] = None
-    genres: List[str] = field(default_factory=list)
+    genres: Tuple[str, ...] = ()
     rating: Optional[int] = None
     studio: Optional[str] = None
     episode: Optional[Episode] = None
@@ -227,6 +356,16 @@ class Show(Media):
     rating_trakt: Optional[int] = None
     last_activity_date: Optional[datetime] = None
 
+    tmdb_fields: ClassVar[Tuple[str, ...]] = (
+        "trailer",
+        "summary",
+        "poster",
+        "fanart",
+        "genres",
+        "studio",
+        "released",
+    )
+
     @staticmethod
     def from_trakt(data) -> "Show":
         """
@@ -239,7 +378,14 @@ class Show(Media):
         return Show(
             name=show["title"],
             ids=Identifiers.from_trakt(show),
-            released=parse_utc_date(data.get("first_aired")),
+            released=parse_utc_date(data.get("first_aired") or show.get("first_aired")),
+            genres=genre_names(show.get("genres")),
+            trailer=show.get("trailer"),
+            summary=show.get("overview"),
+            poster=trakt_image(show, "poster"),
+            fanart=trakt_image(show, "fanart"),
+            rating=show.get("rating"),
+            studio=intern_name(show.get("network")),
             episode=episode,
             rank=data.get("rank"),
             listed_at=parse_utc_date(data.get("listed_at")),
@@ -248,40 +394,55 @@ class Show(Media):
             last_activity_date=parse_utc_date(data.get("last_watched_at")),
         )
 
-    async def get_more_information(self, language: str):
+    async def get_more_information(
+        self, language: str, http: Optional["Handler"] = None
+    ):
         """
         Get information from other API calls to complete the trakt movie.
 
         :param language: The favorite language of the user
+        :param http: The middleware chain sending the TMDB requests
         """
-        data, trailer = await gather(
-            get_show_data(self.ids.tmdb, language),
-            get_show_trailer(self.ids.tmdb, language),
-        )
+        missing = self.missing_fields(language)
+
+        if missing and await self.resolve_tmdb_id("tv", http):
+            from custom_components.trakt_tv.apis.tmdb import get_show_data
+
+            data = await get_show_data(
+                self.ids.tmdb, language, http, with_trailer="trailer" in missing
+            )
+            self.complete(data, missing)
 
-        if title := data.get("title"):
+        if not self.released:
+            # If we really can't find the release date, we set it to the minimum date
+            self.released = datetime.min
+
+    def complete(self, data: Dict[str, Any], missing: Set[str]):
+        """
+        Complete the missing fields of the show using TMDB data.
+
+        :param data: The TMDB data of the show
+        :param missing: The fields to complete
+        """
+        if "name" in missing and (title := data.get("title")):
             self.name = title
-        if trailer:
+        if "trailer" in missing and (trailer := data.get("trailer")):
             self.trailer = trailer
-        if summary := data.get("overview"):
+        if "summary" in missing and (summary := data.get("overview")):
             self.summary = summary
-        if poster := data.get("poster_path"):
-            self.poster = f"https://image.tmdb.org/t/p/w500{poster}"
-        if fanart := data.get("backdrop_path"):
-            self.fanart = f"https://image.tmdb.org/t/p/w500{fanart}"
-        if genres := data.get("genres"):
-            self.genres = [genre["name"] for genre in genres]
-        if vote_average := data.get("vote_average"):
-            if vote_average != 0:
-                self.rating = vote_average
-        if networks := data.get("networks"):
-            self.studio = networks[0].get("name")
-        if not self.released:
-            if data.get("first_air_date"):
-                self.released = datetime.fromisoformat(data["first_air_date"])
-            else:
-                # If we really can't find the release date, we set it to the minimum date
-                self.released = datetime.min
+        if "poster" in missing and (poster := data.get("poster_path")):
+            self.poster = poster
+        if "fanart" in missing and (fanart := data.get("backdrop_path")):
+            self.fanart = fanart
+        if "genres" in missing and (genres := data.get("genres")):
+            self.genres = tuple(intern_name(genre["name"]) for genre in genres)
+        # The rating comes from trakt, TMDB only completes the unrated medias
+        if not self.rating and (vote_average := data.get("vote_average")):
+            self.rating = vote_average
+        if "studio" in missing and (networks := data.get("networks")):
+            self.studio = intern_name(networks[0].get("name"))
+        if "released" in missing and data.get("first_air_date"):
+            self.released = datetime.fromisoformat(data["first_air_date"])
 
     def to_homeassistant(self) -> Dict[str, Any]:
         """
@@ -294,7 +455,7 @@ class Show(Media):
             **self.common_information(),
             "release": "$day, $date $time",
             "airdate": self.released.replace(tzinfo=None).isoformat() + "Z",
-            "ids": asdict(self.ids),
+            "ids": self.ids.to_homeassistant(),
         }
 
         if self.episode:
@@ -325,6 +486,25 @@ class Show(Media):
 @dataclass
 class Medias:
     items: List[Media]
+    # The conversions already computed by sort, the medias don't change once built
+    rendered: Dict[Tuple[str, str], List[Dict[str, Any]]] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+    _columns: Optional[MediaColumns] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @property
+    def columns(self) -> Optional[MediaColumns]:
+        """
+        The columnar representation of the medias, only for the large collections.
+
+        The columns are built on first use, once the medias are completed by TMDB a
+        new collection must be built for them.
+        """
+        if self._columns is None and is_columnar(len(self.items)):
+            self._columns = MediaColumns(self.items)
+        return self._columns
 
     def to_homeassistant(self, sort_by="released", sort_order="asc") -> Dict[str, Any]:
         """
@@ -333,13 +513,100 @@ class Medias:
         :return: The dictionary containing all necessary information for upcoming media
                  card
         """
-        medias = sorted(
-            self.items,
-            key=lambda media: getattr(media, sort_by),
-            reverse=sort_order == "desc",
+        key = (sort_by, sort_order)
+        if key not in self.rendered:
+            medias = self.sort(sort_by, sort_order)
+            medias = [media.to_homeassistant() for media in medias]
+            self.rendered[key] = [first_item] + medias
+        return self.rendered[key]
+
+    def sort(
+        self,
+        sort_by="released",
+        sort_order="asc",
+        count: Optional[int] = None,
+        default: Optional[Any] = None,
+    ) -> List[Media]:
+        """
+        Sort the medias, the first ones only are materialized for large collections.
+
+        :param count: The number of medias to keep, all of them if missing
+        :param default: The value of the missing fields, they can't be sorted without
+        :return: The sorted medias
+        """
+        columns = self.columns
+        if columns is not None and sort_by in COLUMNS:
+            order = columns.order(sort_by, sort_order == "desc", count, default)
+            if order is not None:
+                return columns.select(order)
+
+        def key(media):
+            value = getattr(media, sort_by)
+            return default if value is None and default is not None else value
+
+        medias = sorted(self.items, key=key, reverse=sort_order == "desc")
+        return medias if count is None else medias[:count]
+
+    def top(self, count: int, sort_by="released", sort_order="asc") -> List[Media]:
+        """
+        Find the medias a sensor displays, before they are completed by TMDB.
+
+        :return: The first medias once sorted, all of them if some can't be sorted yet
+        """
+        columns = self.columns
+        if columns is not None and sort_by in COLUMNS:
+            if columns.has_missing(sort_by):
+                return self.items
+        elif any(getattr(media, sort_by, None) is None for media in self.items):
+            return self.items
+
+        return self.sort(sort_by, sort_order, count)
+
+    def subset(self, mask: Callable[[Media], bool], column_mask) -> "Medias":
+        """
+        Keep the medias matching a filter, computed by columns if they are used.
+
+        :param mask: The filter of a media
+        :param column_mask: Compute the mask of the kept rows from the columns
+        :return: The kept medias, with their columns already built
+        """
+        if (columns := self.columns) is None:
+            return Medias([media for media in self.items if mask(media)])
+
+        kept = columns.take(column_mask(columns))
+        medias = Medias(kept.items)
+        medias._columns = kept
+        return medias
+
+    def released_before(self, date: datetime) -> "Medias":
+        """
+        Keep the medias released at the given date or before.
+        """
+        return self.subset(
+            lambda media: media.released and media.released <= date,
+            lambda columns: columns.released_mask(date, True, True),
+        )
+
+    def released_after(self, date: datetime, inclusive=False) -> "Medias":
+        """
+        Keep the medias released after the given date.
+
+        :param inclusive: True to keep the medias released at the given date
+        """
+        return self.subset(
+            lambda media: media.released
+            and (media.released >= date if inclusive else media.released > date),
+            lambda columns: columns.released_mask(date, False, inclusive),
+        )
+
+    def excluding(self, trakt_ids: Set[int]) -> "Medias":
+        """
+        Keep the medias whose trakt ID isn't one of the given ones.
+        """
+        return self.subset(
+            lambda media: media.ids.trakt not in trakt_ids,
+            lambda columns: columns.excluding_mask(trakt_ids),
         )
-        medias = [media.to_homeassistant() for media in medias]
-        return [first_item] + medias
 
     @staticmethod
     def trakt_to_class(
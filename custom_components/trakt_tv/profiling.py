@@ -0,0 +1,243 @@
+"""Profile a refresh of an account, to find where its time goes."""
+
+import cProfile
+import io
+import pstats
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Optional, Set, Tuple
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import DOMAIN
+
+PHASES = ("fetch", "decode", "model_build", "enrichment", "render")
+
+# The functions of each phase by module and name, all the functions of the module if
+# the name is None. The phase of the callees of these functions is the same, unless
+# they are part of another phase. The phases are matched in order: the coroutines are
+# resumed by the event loop, so they have to be listed to get a phase.
+PHASE_FUNCTIONS = {
+    "render": {
+        ("models/media.py", "to_homeassistant"),
+        ("sensor.py", "data"),
+        ("sensor.py", "extra_state_attributes"),
+    },
+    "enrichment": {
+        ("apis/tmdb.py", None),
+        ("apis/trakt.py", "enrich"),
+        ("models/media.py", "get_more_information"),
+        ("models/media.py", "resolve_tmdb_id"),
+    },
+    "model_build": {
+        ("apis/trakt.py", "build_medias"),
+        ("models/media.py", "from_trakt"),
+        ("models/columns.py", None),
+    },
+    "decode": {
+        ("apis/projection.py", None),
+        ("utils.py", "deserialize_json"),
+        ("utils.py", "feed"),
+        ("utils.py", "close"),
+    },
+    "fetch": {
+        ("apis/cassette.py", None),
+        ("apis/middlewares.py", None),
+        ("apis/trakt.py", None),
+    },
+}
+
+# A function of a profile: its file, line and name
+Function = Tuple[str, int, str]
+
+
+@lru_cache(maxsize=None)
+def load_yappi():
+    """
+    Import yappi on first use, it is optional.
+
+    :return: The yappi module, None if it isn't installed
+    """
+    try:
+        import yappi
+    except ImportError:
+        return None
+    return yappi
+
+
+@lru_cache(maxsize=4096)
+def function_phase(function: Function) -> Optional[str]:
+    """Return the phase of a function of the integration, None if it has none."""
+    filename = function[0].replace("\\", "/")
+    for phase, functions in PHASE_FUNCTIONS.items():
+        for module, name in functions:
+            if filename.endswith(f"{DOMAIN}/{module}") and name in (None, function[2]):
+                return phase
+    return None
+
+
+def phase_breakdown(stats: pstats.Stats) -> Dict[str, float]:
+    """
+    Split the time of a profile between the phases of a refresh.
+
+    The own time of a function goes to its phase. The functions out of any phase,
+    such as the builtins, share their time between the phases of their callers, in
+    proportion to the time spent for each of them. The time of the event loop itself
+    is counted as "other".
+
+    :param stats: The statistics of the profile
+    :return: The seconds spent in each phase
+    """
+    entries = stats.stats
+    shares: Dict[Function, Dict[str, float]] = {}
+
+    def share(function: Function, visiting: Set[Function]) -> Dict[str, float]:
+        if function in shares:
+            return shares[function]
+
+        phase = function_phase(function)
+        if phase is not None:
+            return {phase: 1.0}
+
+        callers = entries.get(function, (0, 0, 0, 0, {}))[4]
+        # The time spent for each caller, recursive calls are left aside
+        weights = {
+            caller: timing[3] if isinstance(timing, tuple) else timing
+            for caller, timing in callers.items()
+            if caller not in visiting
+        }
+        total = sum(weights.values())
+        if total <= 0:
+            return {"other": 1.0}
+
+        result: Dict[str, float] = {}
+        for caller, weight in weights.items():
+            for phase, part in share(caller, visiting | {function}).items():
+                result[phase] = result.get(phase, 0.0) + part * weight / total
+        shares[function] = result
+        return result
+
+    breakdown = {phase: 0.0 for phase in (*PHASES, "other")}
+    for function, (_, _, own_time, _, _) in entries.items():
+        for phase, part in share(function, set()).items():
+            breakdown[phase] += own_time * part
+    return {phase: round(seconds, 4) for phase, seconds in breakdown.items()}
+
+
+class Profiler:
+    """Profile the code run on the event loop with cProfile."""
+
+    name = "cprofile"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        try:
+            self.profile.enable()
+        except ValueError as e:
+            raise HomeAssistantError(f"Another profiler is running: {e}") from e
+
+    def stop(self) -> pstats.Stats:
+        self.profile.disable()
+        return pstats.Stats(self.profile)
+
+
+class YappiProfiler:
+    """
+    Profile the code run by all the threads with yappi, using the wall clock so the
+    time a coroutine waits is counted too.
+    """
+
+    name = "yappi"
+
+    def __init__(self):
+        self.yappi = load_yappi()
+        if self.yappi is None:
+            raise HomeAssistantError("yappi is not installed, use cprofile instead")
+
+    def start(self):
+        if self.yappi.is_running():
+            raise HomeAssistantError("yappi is already running")
+        self.yappi.clear_stats()
+        self.yappi.set_clock_type("wall")
+        self.yappi.start()
+
+    def stop(self) -> pstats.Stats:
+        self.yappi.stop()
+        stats = self.yappi.convert2pstats(self.yappi.get_func_stats())
+        self.yappi.clear_stats()
+        return stats
+
+
+def save_profile(
+    stats: pstats.Stats, path: str, top: int
+) -> Tuple[str, str, Dict[str, float]]:
+    """
+    Save a profile and the summary of its slowest functions.
+
+    :param stats: The statistics of the profile
+    :param path: The path of the files, without extension
+    :param top: The number of functions listed in the summary
+    :return: The path of the profile, the path of the summary and the phases
+    """
+    phases = phase_breakdown(stats)
+    stats.dump_stats(f"{path}.prof")
+
+    summary = io.StringIO()
+    summary.write("Phases (seconds):\n")
+    for phase, seconds in phases.items():
+        summary.write(f"  {phase:<12} {seconds:.4f}\n")
+    summary.write("\n")
+    stats.stream = summary
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
+    with open(f"{path}.txt", "w", encoding="utf-8") as file:
+        file.write(summary.getvalue())
+    return f"{path}.prof", f"{path}.txt", phases
+
+
+async def async_profile_refresh(
+    hass: HomeAssistant, entry_id: str, top: int = 30, profiler: str = "cprofile"
+) -> Dict[str, Any]:
+    """
+    Refresh an account and render its sensors under a profiler.
+
+    cProfile only sees the event loop, the work sent to the executor is seen as a
+    wait. yappi sees all the threads, with the time waited by the coroutines.
+
+    :param entry_id: The config entry of the account
+    :param top: The number of functions listed in the summary
+    :param profiler: The profiler to use, cprofile or yappi
+    :return: The paths of the profile and of its summary, and the phases
+    """
+    account = hass.data[DOMAIN][entry_id]
+    coordinator = account["instances"]["coordinator"]
+
+    runner = YappiProfiler() if profiler == "yappi" else Profiler()
+    start = time.monotonic()
+    runner.start()
+    try:
+        await coordinator.async_refresh()
+        for sensor in account.get("sensors", []):
+            sensor.extra_state_attributes
+    finally:
+        stats = runner.stop()
+    duration = time.monotonic() - start
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = hass.config.path(f"{DOMAIN}_profile_{stamp}")
+    profile_path, summary_path, phases = await hass.async_add_executor_job(
+        save_profile, stats, path, top
+    )
+
+    return {
+        "profile": profile_path,
+        "summary": summary_path,
+        "profiler": runner.name,
+        "success": coordinator.last_update_success,
+        "duration": round(duration, 3),
+        "phases": phases,
+    }
@@ -1,10 +1,10 @@
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, Dict, List
 from zoneinfo import ZoneInfo, available_timezones
 
-from dateutil.tz import tzlocal
 from homeassistant.helpers import config_validation as cv
-from voluptuous import ALLOW_EXTRA, PREVENT_EXTRA, In, Required, Schema
+from voluptuous import ALLOW_EXTRA, PREVENT_EXTRA, In, Optional, Required, Schema
 
 from .const import (
     DOMAIN,
@@ -13,6 +13,7 @@ from .const import (
     SORT_BY_OPTIONS,
     SORT_HOW_OPTIONS,
 )
+from .models.cache import CACHE_POLICIES
 from .models.kind import ANTICIPATED_KINDS, BASIC_KINDS, NEXT_TO_WATCH_KINDS, TraktKind
 
 
@@ -35,12 +36,46 @@ def domain_schema() -> Schema:
     return {
         DOMAIN: {
             "sensors": sensors_schema(),
-            Required("language", default="en"): In(LANGUAGE_CODES),
+            Required("language", default="en"): In(frozenset(LANGUAGE_CODES)),
             Required("timezone", default=timezone_default): In(available_timezones()),
+            Required("derive_show_calendars", default=False): cv.boolean,
+            Required("stream_families", default=[]): [In(frozenset(CACHE_POLICIES))],
+            "cache": cache_schema(),
+            "cassette": cassette_schema(),
+            "tracing": tracing_schema(),
         }
     }
 
 
+def cache_schema() -> Dict[str, Any]:
+    """Schema overriding the cache policy of endpoint families."""
+    subschema = {
+        Optional("ttl"): cv.positive_int,
+        Optional("stale"): cv.positive_int,
+        Optional("persist"): cv.boolean,
+        Optional("negative"): cv.positive_int,
+    }
+
+    return {family: subschema for family in CACHE_POLICIES}
+
+
+def cassette_schema() -> Dict[str, Any]:
+    """Schema recording the exchanges of the refreshes, or replaying them offline."""
+    return {
+        Required("mode"): In(["record", "replay"]),
+        Required("path", default="trakt_tv_cassette.json.gz"): cv.string,
+        Required("latency", default=False): cv.boolean,
+    }
+
+
+def tracing_schema() -> Dict[str, Any]:
+    """Schema tracing the refreshes, and logging the sections blocking the loop."""
+    return {
+        Optional("path"): cv.string,
+        Required("stall_threshold", default=100): cv.positive_int,
+    }
+
+
 def sensors_schema() -> Dict[str, Any]:
     return {
         "upcoming": upcoming_schema(),
@@ -159,4 +194,20 @@ def stats_schema() -> list[str]:
     ]
 
 
-configuration_schema = dictionary_to_schema(domain_schema(), extra=ALLOW_EXTRA)
+@lru_cache(maxsize=None)
+def domain_configuration_schema() -> Schema:
+    """
+    Build the schema of the integration configuration once, on first use.
+
+    The timezones are listed from the disk, it is too slow to be done at import time.
+    """
+    return dictionary_to_schema(domain_schema()[DOMAIN])
+
+
+def validate_domain_configuration(value: Dict[str, Any]) -> Dict[str, Any]:
+    return domain_configuration_schema()(value)
+
+
+configuration_schema = Schema(
+    {DOMAIN: validate_domain_configuration}, extra=ALLOW_EXTRA
+)
@@ -1,13 +1,24 @@
 """Platform for sensor integration."""
 
 import logging
-from datetime import timedelta
-
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.const import PERCENTAGE, EntityCategory, UnitOfTime
 from homeassistant.helpers.entity import Entity
 
-from .configuration import Configuration
+from .apis.metrics import Metrics
+from .configuration import SensorSettings, get_configuration
 from .const import DOMAIN
 from .models.kind import ANTICIPATED_KINDS, BASIC_KINDS, NEXT_TO_WATCH_KINDS, TraktKind
+from .tracing import Tracer, span
+from .utils import OFFLOAD_THRESHOLD_ITEMS
 
 LOGGER = logging.getLogger(__name__)
 
@@ -16,8 +27,8 @@ SCAN_INTERVAL = timedelta(minutes=8)
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Set up the sensor platform."""
-    coordinator = hass.data[DOMAIN]["instances"]["coordinator"]
-    configuration = Configuration(hass.data)
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]["instances"]["coordinator"]
+    configuration = get_configuration(hass.data)
 
     sensors = []
 
@@ -169,7 +180,20 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
             )
             sensors.append(sensor)
 
-    async_add_entities(sensors)
+    # The sensors are measured by the diagnostics
+    hass.data[DOMAIN][config_entry.entry_id]["sensors"] = sensors
+
+    # The sources are known once the first refresh is done
+    api = hass.data[DOMAIN][config_entry.entry_id]["instances"]["api"]
+    descriptions = DIAGNOSTIC_SENSORS + [
+        source_duration_sensor(source) for source in api.metrics.sources
+    ]
+    diagnostic_sensors = [
+        TraktDiagnosticSensor(config_entry, coordinator, api.metrics, description)
+        for description in descriptions
+    ]
+
+    async_add_entities(sensors + diagnostic_sensors)
 
 
 class TraktSensor(Entity):
@@ -200,6 +224,27 @@ class TraktSensor(Entity):
         self.sensor_data = sensor_data
         self._attr_unique_id = f"{self.config_entry.entry_id}_{self.source}_{self.trakt_kind.value.identifier}{f'_{sensor_identifier}' if sensor_identifier else ''}"
 
+    @property
+    def consumer(self) -> str:
+        """Return the name of the refresh plan consumer displayed by the sensor."""
+        identifier = self.trakt_kind.value.identifier
+        if self.trakt_kind == TraktKind.LIST:
+            return f"lists.{self.sensor_data['friendly_name']}"
+        if self.trakt_kind in NEXT_TO_WATCH_KINDS:
+            return f"next_to_watch.{identifier}"
+        return f"{self.source}.{identifier}"
+
+    @property
+    def consumers(self) -> set:
+        return self.hass.data[DOMAIN][self.config_entry.entry_id]["consumers"]
+
+    async def async_added_to_hass(self):
+        """Prioritize the requests of the sensor, disabled sensors are never added."""
+        self.consumers.add(self.consumer)
+
+    async def async_will_remove_from_hass(self):
+        self.consumers.discard(self.consumer)
+
     @property
     def name(self):
         """Return the name of the sensor."""
@@ -225,33 +270,46 @@ class TraktSensor(Entity):
             return None
 
     @property
-    def configuration(self):
+    def configuration(self) -> SensorSettings:
         identifier = self.trakt_kind.value.identifier
-        data = self.hass.data[DOMAIN]
         source = (
             "next_to_watch" if self.trakt_kind in NEXT_TO_WATCH_KINDS else self.source
         )
-        return data["configuration"]["sensors"][source][identifier]
-
-    @property
-    def data(self):
-        if not self.medias:
-            return []
+        return get_configuration(self.hass.data).sensor_settings(source, identifier)
 
-        sort_config = {}
+    def sort_arguments(self) -> Tuple[str, str, int]:
+        """Return how the medias are sorted and how many of them are displayed."""
         if self.trakt_kind == TraktKind.LIST:
             sort_config = self.sensor_data
-        elif "sort_by" in self.configuration:
-            sort_config = self.configuration
+            return (
+                sort_config["sort_by"],
+                sort_config["sort_order"],
+                sort_config["max_medias"],
+            )
 
-        if sort_config:
-            sort_by = sort_config["sort_by"]
-            sort_order = sort_config["sort_order"]
-            max_medias = sort_config["max_medias"]
-            return self.medias.to_homeassistant(sort_by, sort_order)[0 : max_medias + 1]
+        settings = self.configuration
+        if settings.sort_configured:
+            return settings.sort_by, settings.sort_order, settings.max_medias
 
-        max_medias = self.configuration["max_medias"]
-        return self.medias.to_homeassistant()[0 : max_medias + 1]
+        return "released", "asc", settings.max_medias
+
+    @property
+    def tracer(self) -> Optional[Tracer]:
+        account = self.hass.data[DOMAIN][self.config_entry.entry_id]
+        return account["instances"]["api"].tracer
+
+    @property
+    def data(self):
+        medias = self.medias
+        if not medias:
+            return []
+
+        sort_by, sort_order, max_medias = self.sort_arguments()
+        # Only the renderings not memoized yet are traced
+        tracer = self.tracer if (sort_by, sort_order) not in medias.rendered else None
+        with span("render", tracer, sensor=self.name, medias=len(medias.items)):
+            rendered = medias.to_homeassistant(sort_by, sort_order)
+        return rendered[0 : max_medias + 1]
 
     @property
     def state(self):
@@ -284,6 +342,14 @@ class TraktSensor(Entity):
         """Request coordinator to update data."""
         await self.coordinator.async_request_refresh()
 
+        # Sort large collections in the executor, the state is then written instantly
+        medias = self.medias
+        if medias and len(medias.items) >= OFFLOAD_THRESHOLD_ITEMS:
+            sort_by, sort_order, _ = self.sort_arguments()
+            await self.hass.async_add_executor_job(
+                medias.to_homeassistant, sort_by, sort_order
+            )
+
 
 class TraktStateSensor(Entity):
     """Trakt sensor to show data as state"""
@@ -335,3 +401,151 @@ class TraktStateSensor(Entity):
     async def async_update(self):
         """Request coordinator to update data."""
         await self.coordinator.async_request_refresh()
+
+
+@dataclass(frozen=True)
+class DiagnosticSensor:
+    """A live signal of the refreshes, read from the metrics of the account."""
+
+    key: str
+    name: str
+    icon: str
+    value: Callable[[Metrics], Any]
+    unit: Optional[str] = None
+    device_class: Optional[SensorDeviceClass] = None
+    state_class: Optional[SensorStateClass] = SensorStateClass.MEASUREMENT
+    attributes: Callable[[Metrics], Dict[str, Any]] = lambda metrics: {}
+
+
+def remaining_quota(metrics: Metrics) -> Optional[int]:
+    if metrics.rate_limit is None:
+        return None
+    return metrics.rate_limit.remaining_at(datetime.now(timezone.utc))
+
+
+def quota_attributes(metrics: Metrics) -> Dict[str, Any]:
+    rate_limit = metrics.rate_limit
+    if rate_limit is None:
+        return {}
+    return {
+        "name": rate_limit.name,
+        "limit": rate_limit.limit,
+        "until": rate_limit.until.isoformat() if rate_limit.until else None,
+    }
+
+
+def next_refresh(metrics: Metrics) -> Optional[datetime]:
+    """The sensors poll the coordinator every scan interval, starting a refresh."""
+    if metrics.last_cycle is None:
+        return None
+    return metrics.last_cycle.started + SCAN_INTERVAL
+
+
+def source_duration_sensor(source: str) -> DiagnosticSensor:
+    """Describe the sensor of the duration of the last refresh of a source."""
+    title = source.replace("_", " ").title()
+    if source in [kind.value.identifier for kind in NEXT_TO_WATCH_KINDS]:
+        title = f"Next To Watch {title}"
+
+    return DiagnosticSensor(
+        key=f"refresh_duration_{source}",
+        name=f"Trakt Refresh Duration {title}",
+        icon="mdi:timer-outline",
+        value=lambda metrics: (
+            round(metrics.sources[source], 2) if source in metrics.sources else None
+        ),
+        unit=UnitOfTime.SECONDS,
+        device_class=SensorDeviceClass.DURATION,
+    )
+
+
+DIAGNOSTIC_SENSORS = [
+    DiagnosticSensor(
+        key="api_quota",
+        name="Trakt API Quota",
+        icon="mdi:speedometer",
+        value=remaining_quota,
+        unit="requests",
+        attributes=quota_attributes,
+    ),
+    DiagnosticSensor(
+        key="refresh_duration",
+        name="Trakt Refresh Duration",
+        icon="mdi:timer-outline",
+        value=lambda metrics: (
+            round(metrics.last_cycle.duration, 2) if metrics.last_cycle else None
+        ),
+        unit=UnitOfTime.SECONDS,
+        device_class=SensorDeviceClass.DURATION,
+    ),
+    DiagnosticSensor(
+        key="refresh_requests",
+        name="Trakt Refresh Requests",
+        icon="mdi:swap-vertical",
+        value=lambda metrics: (
+            metrics.last_cycle.exchanges if metrics.last_cycle else None
+        ),
+        unit="requests",
+    ),
+    DiagnosticSensor(
+        key="cache_hit_ratio",
+        name="Trakt Cache Hit Ratio",
+        icon="mdi:database-check",
+        value=lambda metrics: (
+            round(metrics.last_cycle.hit_ratio * 100, 1) if metrics.last_cycle else None
+        ),
+        unit=PERCENTAGE,
+    ),
+    DiagnosticSensor(
+        key="next_refresh",
+        name="Trakt Next Refresh",
+        icon="mdi:update",
+        value=next_refresh,
+        device_class=SensorDeviceClass.TIMESTAMP,
+        state_class=None,
+    ),
+]
+
+
+class TraktDiagnosticSensor(SensorEntity):
+    """
+    Trakt sensor showing a live signal of the refreshes. It is updated after each
+    refresh, disabled until the user enables it.
+    """
+
+    # The names are complete, the sensors don't belong to a device
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(
+        self,
+        config_entry,
+        coordinator,
+        metrics: Metrics,
+        description: DiagnosticSensor,
+    ):
+        """Initialize the sensor."""
+        self.coordinator = coordinator
+        self.metrics = metrics
+        self.description = description
+        self._attr_unique_id = f"{config_entry.entry_id}_diagnostic_{description.key}"
+        self._attr_name = description.name
+        self._attr_icon = description.icon
+        self._attr_native_unit_of_measurement = description.unit
+        self._attr_device_class = description.device_class
+        self._attr_state_class = description.state_class
+
+    @property
+    def native_value(self):
+        return self.description.value(self.metrics)
+
+    @property
+    def extra_state_attributes(self):
+        return self.description.attributes(self.metrics)
+
+    async def async_added_to_hass(self):
+        """Write the state after each refresh, the sensor doesn't poll."""
+        self.async_on_remove(
+            self.coordinator.async_add_listener(self.async_write_ha_state)
+        )
@@ -0,0 +1,98 @@
+"""Services helping to understand the refreshes of the Trakt accounts."""
+
+from typing import Any, Dict, Optional
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
+from homeassistant.exceptions import ServiceValidationError
+from homeassistant.helpers import config_validation as cv
+
+from .const import DOMAIN
+from .memory import async_memory_report
+from .profiling import async_profile_refresh
+
+SERVICE_PROFILE_REFRESH = "profile_refresh"
+SERVICE_MEMORY_REPORT = "memory_report"
+
+PROFILE_REFRESH_SCHEMA = vol.Schema(
+    {
+        vol.Optional("entry_id"): cv.string,
+        vol.Required("top", default=30): cv.positive_int,
+        vol.Required("profiler", default="cprofile"): vol.In(["cprofile", "yappi"]),
+    }
+)
+
+MEMORY_REPORT_SCHEMA = vol.Schema(
+    {
+        vol.Optional("entry_id"): cv.string,
+        vol.Required("tracemalloc", default=False): cv.boolean,
+        vol.Required("frames", default=25): cv.positive_int,
+        vol.Required("top", default=20): cv.positive_int,
+        vol.Required("stop_tracing", default=False): cv.boolean,
+    }
+)
+
+
+def resolve_entry_id(hass: HomeAssistant, entry_id: Optional[str]) -> str:
+    """
+    Find the config entry of the account targeted by a service call.
+
+    :param entry_id: The requested config entry, optional if there is a single account
+    :raises ServiceValidationError: If the account can't be found
+    """
+    # The domain data also holds the configuration and the shared cache layer
+    loaded = [
+        key
+        for key, account in hass.data.get(DOMAIN, {}).items()
+        if isinstance(account, dict) and "instances" in account
+    ]
+
+    if entry_id is not None:
+        if entry_id not in loaded:
+            raise ServiceValidationError(f"No Trakt account is loaded for {entry_id}")
+        return entry_id
+
+    if len(loaded) != 1:
+        raise ServiceValidationError(
+            f"{len(loaded)} Trakt accounts are loaded, choose one with entry_id"
+        )
+    return loaded[0]
+
+
+def async_setup_services(hass: HomeAssistant):
+    """Register the services of the integration, shared by all the accounts."""
+
+    async def async_profile_refresh_service(call: ServiceCall) -> Dict[str, Any]:
+        """Profile a refresh, the profile is written in the configuration folder."""
+        entry_id = resolve_entry_id(hass, call.data.get("entry_id"))
+        return await async_profile_refresh(
+            hass, entry_id, call.data["top"], call.data["profiler"]
+        )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE_REFRESH,
+        async_profile_refresh_service,
+        schema=PROFILE_REFRESH_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_memory_report_service(call: ServiceCall) -> Dict[str, Any]:
+        """Report the memory held by an account, and its traced allocations."""
+        entry_id = resolve_entry_id(hass, call.data.get("entry_id"))
+        return await async_memory_report(
+            hass,
+            entry_id,
+            trace=call.data["tracemalloc"],
+            frames=call.data["frames"],
+            top=call.data["top"],
+            stop_tracing=call.data["stop_tracing"],
+        )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_MEMORY_REPORT,
+        async_memory_report_service,
+        schema=MEMORY_REPORT_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
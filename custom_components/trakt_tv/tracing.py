@@ -0,0 +1,306 @@
+"""Trace the refreshes as nested spans, and log the sections blocking the event loop."""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    TypeVar,
+)
+
+from .utils import Executor
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# The span of the section running, the spans opened in it are its children
+current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    f"{__name__}.current_span", default=None
+)
+
+# When the last blocking section was logged, so its enclosing spans don't log it again
+_last_stall = 0.0
+
+
+def on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@dataclass
+class Span:
+    """A section of a refresh, with its wall time and its CPU time."""
+
+    tracer: "Tracer"
+    name: str
+    trace_id: str
+    id: int
+    parent: Optional["Span"]
+    attributes: Dict[str, Any]
+    # The epoch the span started at, and the same instant for the durations
+    start: float = field(default_factory=time.time)
+    started: float = field(default_factory=time.perf_counter)
+    wall: float = 0.0
+    # The CPU time of the span on its thread: the synchronous steps of a coroutine,
+    # including the coroutines it awaits
+    cpu: float = 0.0
+    on_loop: bool = field(default_factory=on_event_loop)
+    error: Optional[str] = None
+    # The finished spans of the trace, filled on its root
+    spans: List["Span"] = field(default_factory=list, repr=False)
+
+    @property
+    def root(self) -> "Span":
+        span = self
+        while span.parent is not None:
+            span = span.parent
+        return span
+
+    @property
+    def path(self) -> str:
+        """The names of the span and of its ancestors, such as refresh > source."""
+        names = []
+        span: Optional[Span] = self
+        while span is not None:
+            names.append(span.name)
+            span = span.parent
+        return " > ".join(reversed(names))
+
+    def step(self, started: float, cpu_started: float):
+        """Count a synchronous step and log it if it blocked the event loop."""
+        self.cpu += time.thread_time() - cpu_started
+        self.tracer.check_stall(self, started)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "trace": self.trace_id,
+            "id": self.id,
+            "parent": self.parent.id if self.parent is not None else None,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "on_loop": self.on_loop,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """
+    Record the spans of the refreshes into a JSON lines file, one line per span
+    written once its trace is finished, and log the synchronous sections blocking
+    the event loop longer than the threshold.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        stall_threshold: float = 0.1,
+        executor: Optional[Executor] = None,
+    ):
+        """
+        :param path: The trace file, the spans aren't written if missing
+        :param stall_threshold: The seconds a section may block the event loop
+        :param executor: Run the blocking file operations
+        """
+        self.path = path
+        self.stall_threshold = stall_threshold
+        self.executor = executor
+        self.ids = itertools.count(1)
+
+    def open(self, name: str, attributes: Dict[str, Any]) -> Span:
+        """Open a span, child of the running one or root of a new trace."""
+        parent = current_span.get()
+        return Span(
+            tracer=self,
+            name=name,
+            trace_id=parent.trace_id if parent is not None else uuid.uuid4().hex,
+            id=next(self.ids),
+            parent=parent,
+            attributes=attributes,
+        )
+
+    def close(self, span: Span):
+        span.wall = time.perf_counter() - span.started
+        root = span.root
+        root.spans.append(span)
+        if span is root and self.path is not None:
+            lines = [json.dumps(item.as_dict(), default=str) for item in root.spans]
+            if self.executor is not None:
+                self.executor(self.write, lines)
+            else:
+                self.write(lines)
+
+    def write(self, lines: List[str]):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+    def check_stall(self, span: Span, started: float):
+        """Log a section of the span blocking the event loop, the innermost only."""
+        global _last_stall
+        blocked = time.perf_counter() - started
+        if span.on_loop and blocked > self.stall_threshold and _last_stall < started:
+            _last_stall = time.perf_counter()
+            LOGGER.warning(
+                "%s blocked the event loop for %.0fms%s",
+                span.path,
+                blocked * 1000,
+                f" ({span.attributes})" if span.attributes else "",
+            )
+
+
+def tracer_from_settings(
+    settings: Optional[Mapping[str, Any]],
+    resolve_path: Callable[[str], str],
+    executor: Optional[Executor] = None,
+) -> Optional[Tracer]:
+    """
+    Build the tracer of the configuration.
+
+    :param settings: The tracing configuration, nothing is traced if missing
+    :param resolve_path: Give the absolute path of the trace file from the configured one
+    :param executor: Run the blocking file operations
+    """
+    if settings is None:
+        return None
+
+    path = settings.get("path")
+    return Tracer(
+        resolve_path(path) if path else None,
+        settings["stall_threshold"] / 1000,
+        executor,
+    )
+
+
+@contextmanager
+def span(
+    name: str, tracer: Optional[Tracer] = None, **attributes: Any
+) -> Iterator[Optional[Span]]:
+    """
+    Trace a synchronous section, it is logged if it blocks the event loop.
+
+    :param name: The name of the section
+    :param tracer: The tracer of a new trace, the section is only traced inside a
+                   trace if missing
+    :param attributes: The attributes of the span, written with it
+    """
+    parent = current_span.get()
+    tracer = parent.tracer if parent is not None else tracer
+    if tracer is None:
+        yield None
+        return
+
+    opened = tracer.open(name, attributes)
+    token = current_span.set(opened)
+    cpu_started = time.thread_time()
+    try:
+        yield opened
+    except BaseException as e:
+        opened.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        opened.step(opened.started, cpu_started)
+        tracer.close(opened)
+
+
+class _TimedSteps:
+    """Await a coroutine, timing each of its synchronous steps on the span."""
+
+    def __init__(self, awaitable: Awaitable[T], opened: Span):
+        self.awaitable = awaitable
+        self.opened = opened
+
+    def __await__(self) -> Generator[Any, Any, T]:
+        iterator = self.awaitable.__await__()
+        send, value = iterator.send, None
+        while True:
+            started, cpu_started = time.perf_counter(), time.thread_time()
+            try:
+                yielded = send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.opened.step(started, cpu_started)
+
+            try:
+                value = yield yielded
+                send = iterator.send
+            except GeneratorExit:
+                iterator.close()
+                raise
+            except BaseException as e:
+                send, value = iterator.throw, e
+
+
+async def traced(
+    name: str, awaitable: Awaitable[T], tracer: Optional[Tracer] = None, **attributes
+) -> T:
+    """
+    Trace an asynchronous section, its steps blocking the event loop are logged.
+
+    :param name: The name of the section
+    :param awaitable: The coroutine of the section
+    :param tracer: The tracer of a new trace, the section is only traced inside a
+                   trace if missing
+    :param attributes: The attributes of the span, written with it
+    """
+    parent = current_span.get()
+    tracer = parent.tracer if parent is not None else tracer
+    if tracer is None:
+        return await awaitable
+
+    opened = tracer.open(name, attributes)
+    token = current_span.set(opened)
+    try:
+        return await _TimedSteps(awaitable, opened)
+    except BaseException as e:
+        opened.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        tracer.close(opened)
+
+
+def traced_coroutine(
+    function: Callable[..., Awaitable[T]]
+) -> Callable[..., Awaitable[T]]:
+    """Trace the calls of a coroutine function, named after the function."""
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs) -> T:
+        return await traced(function.__name__, function(*args, **kwargs))
+
+    return wrapper
+
+
+def with_context(executor: Executor) -> Executor:
+    """
+    Run the jobs of an executor in the context of their caller, so the sections they
+    trace are part of the caller span.
+    """
+
+    def run(function: Callable[..., Any], *args: Any) -> Awaitable[Any]:
+        return executor(contextvars.copy_context().run, function, *args)
+
+    return run
@@ -1,23 +1,43 @@
+import asyncio
+import codecs
 import json
+import logging
 import time
 from datetime import datetime, timedelta, timezone
 from math import ceil
-from typing import Any, Dict, List, Optional, Tuple
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-from dateutil import parser
+from .exception import TraktException, TraktNotFoundException
+from .models.cache import NEGATIVE_ENTRY, CachePolicy
 
-from .const import DOMAIN
-from .exception import TraktException
+try:
+    # Shipped with Home Assistant, the standard library is used if it is missing
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+LOGGER = logging.getLogger(__name__)
 
 CACHE_EXPIRATION = 480  # 8 minutes
 
+# Payloads and collections from which the work leaves the event loop
+OFFLOAD_THRESHOLD_BYTES = 256 * 1024
+OFFLOAD_THRESHOLD_ITEMS = 200
+# The number of items processed on the event loop before yielding
+LOOP_CHUNK_SIZE = 50
 
-def update_domain_data(hass, key, content):
-    if hass.data.get(DOMAIN) and hass.data[DOMAIN].get(key):
-        hass.data[DOMAIN][key].update(content)
-    else:
-        hass.data.setdefault(DOMAIN, {})
-        hass.data[DOMAIN][key] = content
+# Run a blocking function in a worker thread, such as hass.async_add_executor_job
+Executor = Callable[..., Awaitable[Any]]
 
 
 def split(number: int, by: int) -> List[int]:
@@ -49,19 +69,174 @@ def compute_calendar_args(
     return res
 
 
-def deserialize_json(document: str) -> Dict[str, Any]:
+def deserialize_json(document: Union[bytes, str]) -> Dict[str, Any]:
     """
     Deserialize a json returning a better error than JSONDecodeError.
 
+    The bytes are deserialized directly, without decoding them into a string first,
+    using orjson if it is available.
+
     :param document: The json document
     :return: The dictionary
     """
     try:
+        if orjson is not None:
+            return orjson.loads(document)
         return json.loads(document)
     except json.decoder.JSONDecodeError:
+        if isinstance(document, bytes):
+            document = document.decode("utf-8", errors="replace")
         raise TraktException(f"Can't deserialize the following json:\n{document}")
 
 
+class JsonArrayDecoder:
+    """
+    Deserialize a json document incrementally, as its chunks arrive.
+
+    The items of an array are decoded as soon as they are complete, so neither the
+    whole body nor its decoded string are kept in memory. Other documents are
+    deserialized at once when the decoder is closed.
+
+    The keys are shared between the items, as a single json.loads call would do.
+    """
+
+    def __init__(self):
+        keys: Dict[str, str] = {}
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder(
+            object_pairs_hook=lambda pairs: {keys.setdefault(k, k): v for k, v in pairs}
+        )
+        self.buffer = ""
+        self.items: List[Any] = []
+        self.is_array: Optional[bool] = None
+        # The next expected token, a value or a separator
+        self.expect_value = True
+        self.finished = False
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """
+        Add a chunk of the document.
+
+        :param chunk: The next bytes of the document
+        :return: The items of the array completed by the chunk
+        """
+        self.buffer += self.text_decoder.decode(chunk)
+
+        if self.is_array is None:
+            self.buffer = self.buffer.lstrip()
+            if not self.buffer:
+                return []
+            self.is_array = self.buffer[0] == "["
+            if self.is_array:
+                self.buffer = self.buffer[1:]
+
+        if not self.is_array or self.finished:
+            return []
+
+        items = []
+        position = 0
+        length = len(self.buffer)
+        while True:
+            while position < length and self.buffer[position] in " \t\n\r":
+                position += 1
+            if position == length:
+                break
+
+            char = self.buffer[position]
+            if char == "]" and not (self.expect_value and (self.items or items)):
+                self.finished = True
+                position += 1
+                break
+            if not self.expect_value:
+                if char != ",":
+                    raise TraktException(f"Unexpected {char!r} in the json array")
+                self.expect_value = True
+                position += 1
+                continue
+
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, position)
+            except json.decoder.JSONDecodeError:
+                # The item is not complete yet
+                break
+            if end == length:
+                # A number could still continue in the next chunk
+                break
+
+            items.append(item)
+            self.expect_value = False
+            position = end
+
+        self.buffer = self.buffer[position:]
+        self.items.extend(items)
+        return items
+
+    def close(self) -> Any:
+        """
+        End the document.
+
+        :return: The deserialized document, the list of the items for an array
+        """
+        self.buffer += self.text_decoder.decode(b"", final=True)
+
+        if not self.is_array:
+            return deserialize_json(self.buffer)
+
+        # The last item may be waiting for a following character
+        self.feed(b" ")
+        if not self.finished:
+            raise TraktException("The json array is not complete")
+        return self.items
+
+
+def map_items(function: Callable[[Any], Any], items: Sequence[Any]) -> List[Any]:
+    return [function(item) for item in items]
+
+
+async def map_chunked(
+    function: Callable[[Any], Any],
+    items: Sequence[Any],
+    chunk_size: int = LOOP_CHUNK_SIZE,
+) -> List[Any]:
+    """
+    Apply a function to items on the event loop, yielding to the loop between chunks.
+
+    :param function: The function to apply
+    :param items: The items
+    :param chunk_size: The number of items processed before yielding
+    :return: The results, in the order of the items
+    """
+    results = []
+    for start in range(0, len(items), chunk_size):
+        if start > 0:
+            await asyncio.sleep(0)
+        results.extend(map_items(function, items[start : start + chunk_size]))
+    return results
+
+
+async def map_offloaded(
+    function: Callable[[Any], Any],
+    items: Sequence[Any],
+    executor: Optional[Executor] = None,
+    threshold: int = OFFLOAD_THRESHOLD_ITEMS,
+) -> List[Any]:
+    """
+    Apply a CPU heavy function to items without blocking the event loop.
+
+    Large collections are processed by the executor, the other ones are processed on
+    the loop by chunks.
+
+    :param function: The function to apply, it must not use the event loop
+    :param items: The items
+    :param executor: Run a blocking function in a worker thread
+    :param threshold: The number of items from which the executor is used
+    :return: The results, in the order of the items
+    """
+    if executor is not None and len(items) >= threshold:
+        return await executor(map_items, function, items)
+    return await map_chunked(function, items)
+
+
 def cache_insert(cache: Dict[str, Any], key: str, value: Any) -> None:
     """
     Insert a value to a cache.
@@ -76,26 +251,118 @@ def cache_insert(cache: Dict[str, Any], key: str, value: Any) -> None:
     cache[key_time] = time.time()
 
 
-def cache_retrieve(cache: Dict[str, Any], key: str) -> Optional[Any]:
+def cache_retrieve(
+    cache: Dict[str, Any],
+    key: str,
+    expiration: int = CACHE_EXPIRATION,
+    grace: int = 0,
+) -> Optional[Any]:
     """
     Retrieve a value from a cache.
 
     :param cache: The cache representation
     :param key: The key of the cache
+    :param expiration: The number of seconds the value is fresh
+    :param grace: The number of seconds an expired value is kept as a fallback
     :return: The value if it exists and is not expired
     """
     key_time = f"{key}_time"
     if key in cache:
-        if time.time() - cache[key_time] <= CACHE_EXPIRATION:
+        age = time.time() - cache[key_time]
+        if age <= expiration:
             return cache[key]
-        else:
+        elif age > expiration + grace:
             cache.pop(key, None)
             cache.pop(key_time, None)
-            return None
+        return None
     else:
         return None
 
 
+async def cache_fetch(
+    cache: Dict[str, Any],
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    policy: Optional[CachePolicy] = None,
+    record: Optional[Callable[[str], None]] = None,
+) -> Any:
+    """
+    Retrieve a value from a cache or fetch and insert it if it is missing.
+
+    If the fetch fails, the expired value is returned as long as it is in the stale
+    grace period of the policy. If the value doesn't exist, a negative entry is kept
+    during the negative ttl of the policy to avoid fetching it again.
+
+    :param cache: The cache representation
+    :param key: The key of the cache
+    :param fetch: The coroutine function producing the value
+    :param policy: The cache policy, the default expiration without grace if missing
+    :param record: Called with the result of the lookup: "hit", "negative" or "miss",
+                   then "stale" if a stale value is used after a failed fetch
+    :return: The cached or fetched value
+    :raises TraktNotFoundException: If the value is known to be missing
+    """
+    policy = policy or CachePolicy(ttl=CACHE_EXPIRATION)
+    record = record or (lambda _: None)
+
+    if cache.get(key) == NEGATIVE_ENTRY:
+        if cache_retrieve(cache, key, policy.negative) is not None:
+            record("negative")
+            raise TraktNotFoundException(f"{key} is cached as not found")
+
+    maybe_answer = cache_retrieve(cache, key, policy.ttl, policy.stale)
+    if maybe_answer is not None:
+        record("hit")
+        return maybe_answer
+
+    record("miss")
+
+    try:
+        value = await fetch()
+    except TraktNotFoundException:
+        if policy.negative > 0:
+            cache_insert(cache, key, NEGATIVE_ENTRY)
+        raise
+    except Exception as e:
+        stale = cache.get(key)
+        if stale is None or stale == NEGATIVE_ENTRY:
+            raise
+        LOGGER.warning(f"Using stale cache for {key} because: {e}")
+        record("stale")
+        return stale
+    if value is not None:
+        cache_insert(cache, key, value)
+    return value
+
+
+def cache_snapshot(
+    cache: Dict[str, Any], policies: Dict[str, CachePolicy]
+) -> Dict[str, Any]:
+    """
+    Extract the entries of a cache to persist.
+
+    The keys of the cache are prefixed by their family, "family:key", only the
+    families persisted by their policy and the entries still usable are kept.
+
+    :param cache: The cache representation
+    :param policies: The cache policy of each family
+    :return: The entries to persist
+    """
+    now = time.time()
+    snapshot = {}
+    for key_time, inserted_at in list(cache.items()):
+        if not key_time.endswith("_time"):
+            continue
+        key = key_time[: -len("_time")]
+        policy = policies.get(key.split(":", 1)[0])
+        if key not in cache or policy is None or not policy.persist:
+            continue
+        if now - inserted_at <= policy.ttl + policy.stale:
+            snapshot[key] = cache[key]
+            snapshot[key_time] = inserted_at
+    return snapshot
+
+
 def extract_value_from(data: Dict[str, Any], path: List[str]) -> Any:
     """
     Extract a value from a dictionary following a path. or throw an exception if the path is not valid.
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+This a script to measure the startup cost of the integration: the time needed to
+import it once Home Assistant is loaded, and the time needed to validate the
+configuration for the first time.
+
+Each run happens in a fresh interpreter, the median of the runs is reported with the
+modules of the integration taking the most time to import.
+
+Usage: python scripts/benchmark_import_time.py [number of runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# The modules already imported by Home Assistant when the integration is loaded
+PRELOADED = [
+    "aiohttp",
+    "voluptuous",
+    "homeassistant.config_entries",
+    "homeassistant.helpers.aiohttp_client",
+    "homeassistant.helpers.config_entry_oauth2_flow",
+    "homeassistant.helpers.config_validation",
+    "homeassistant.helpers.entity",
+    "homeassistant.helpers.storage",
+    "homeassistant.helpers.update_coordinator",
+]
+
+RUN = f"""
+import time
+{"; ".join(f"import {module}" for module in PRELOADED)}
+
+start = time.perf_counter()
+import custom_components.trakt_tv
+import custom_components.trakt_tv.sensor
+imported = time.perf_counter() - start
+
+start = time.perf_counter()
+custom_components.trakt_tv.CONFIG_SCHEMA({{"trakt_tv": {{}}}})
+validated = time.perf_counter() - start
+
+print(imported, validated)
+"""
+
+
+def run():
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUN],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported, validated = map(float, process.stdout.split())
+
+    # The lines of -X importtime are "import time: self | cumulative | module"
+    modules = {}
+    for line in process.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and "custom_components.trakt_tv" in parts[2]:
+            modules[parts[2].strip()] = int(parts[0].split(":")[1]) / 1000
+
+    return imported, validated, modules
+
+
+if __name__ == "__main__":
+    number_of_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    runs = [run() for _ in range(number_of_runs)]
+
+    imported = statistics.median(run[0] for run in runs) * 1000
+    validated = statistics.median(run[1] for run in runs) * 1000
+    print(f"{number_of_runs} runs")
+    print(f"{'import':<32} {imported:>8.1f} ms")
+    print(f"{'first validation':<32} {validated:>8.1f} ms")
+
+    print("slowest modules (self time)")
+    modules = runs[-1][2]
+    for module in sorted(modules, key=modules.get, reverse=True)[:10]:
+        print(f"  {module:<46} {modules[module]:>6.1f} ms")
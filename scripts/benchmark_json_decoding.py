@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""
+This a script to measure the time and the peak memory needed to deserialize a large
+Trakt response, such as sync/watched/shows for a library of 20000 shows.
+
+It compares decoding the body into a string before deserializing it, deserializing
+the bytes directly (orjson if available) and deserializing the body as it arrives.
+
+Usage: python scripts/benchmark_json_decoding.py [number of shows]
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.trakt_tv.utils import JsonArrayDecoder, deserialize_json
+
+CHUNK_SIZE = 64 * 1024
+
+
+def watched_show(index):
+    return {
+        "plays": index % 300,
+        "last_watched_at": "2023-01-01T00:00:00.000Z",
+        "last_updated_at": "2023-01-01T00:00:00.000Z",
+        "reset_at": None,
+        "show": {
+            "title": f"Show {index}",
+            "year": 2010,
+            "ids": {
+                "trakt": index,
+                "slug": f"show-{index}",
+                "tvdb": index,
+                "imdb": f"tt{index}",
+                "tmdb": index,
+                "tvrage": None,
+            },
+        },
+    }
+
+
+def chunks(body):
+    for start in range(0, len(body), CHUNK_SIZE):
+        yield body[start : start + CHUNK_SIZE]
+
+
+def from_string(body):
+    # The body is received entirely, then decoded into a string
+    body = b"".join(chunks(body))
+    return json.loads(body.decode("utf-8"))
+
+
+def from_bytes(body):
+    # The body is received entirely, then deserialized directly
+    body = b"".join(chunks(body))
+    return deserialize_json(body)
+
+
+def streamed(body):
+    # The body is deserialized while it is received
+    decoder = JsonArrayDecoder()
+    for chunk in chunks(body):
+        decoder.feed(chunk)
+    return decoder.close()
+
+
+def measure(name, decode, body):
+    tracemalloc.start()
+    decode(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The duration without tracemalloc slowing down the allocations
+    start = time.perf_counter()
+    decode(body)
+    duration = time.perf_counter() - start
+
+    print(f"{name:<12} {duration * 1000:>8.1f} ms {peak / 2**20:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    number_of_shows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    body = json.dumps([watched_show(index) for index in range(number_of_shows)])
+    body = body.encode("utf-8")
+
+    print(f"{number_of_shows} shows, {len(body) / 2**20:.1f} MiB")
+    print(f"{'strategy':<12} {'time':>11} {'peak':>12}")
+    measure("string", from_string, body)
+    measure("bytes", from_bytes, body)
+    measure("streamed", streamed, body)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+This a script to measure the memory used by each media kept in the coordinator data,
+once built from Trakt and completed by TMDB.
+
+Usage: python scripts/benchmark_media_memory.py [number of medias]
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.trakt_tv.models.media import Movie, Show
+
+GENRES = ["Drama", "Science Fiction", "Comedy", "Action", "Adventure"]
+STUDIOS = ["HBO", "Netflix", "AMC", "BBC One"]
+
+
+def raw_media(index):
+    return {
+        "title": f"Media {index}",
+        "year": 2010,
+        "first_aired": "2010-01-01T00:00:00.000Z",
+        "released": "2010-01-01",
+        "overview": f"The overview of the media {index}.",
+        "runtime": 45,
+        "rating": 8.1,
+        "ids": {
+            "trakt": index,
+            "slug": f"media-{index}",
+            "tvdb": index,
+            "imdb": f"tt{index}",
+            "tmdb": index,
+        },
+    }
+
+
+def tmdb_data(index):
+    return {
+        "title": f"Media {index}",
+        # The genres and studios are decoded separately for each response
+        "genres": [{"name": "".join(genre)} for genre in GENRES[index % 3 :]],
+        "networks": [{"name": "".join(STUDIOS[index % 4])}],
+        "production_companies": [{"name": "".join(STUDIOS[index % 4])}],
+        "poster_path": f"/poster{index}.jpg",
+        "backdrop_path": f"/backdrop{index}.jpg",
+        "vote_average": 7.5,
+    }
+
+
+def build(model, number_of_medias):
+    medias = []
+    for index in range(number_of_medias):
+        media = model.from_trakt(raw_media(index))
+        media.complete(tmdb_data(index), media.missing_fields("fr"))
+        medias.append(media)
+    return medias
+
+
+def measure(model, number_of_medias):
+    tracemalloc.start()
+    medias = build(model, number_of_medias)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_media = size / len(medias)
+    print(f"{model.__name__:<6} {per_media:>8.0f} bytes per media")
+
+
+if __name__ == "__main__":
+    number_of_medias = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    print(f"{number_of_medias} medias")
+    measure(Movie, number_of_medias)
+    measure(Show, number_of_medias)
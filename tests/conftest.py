@@ -31,4 +31,4 @@ def yaml():
 
 @fixture
 def configuration(yaml):
-    return Configuration(data=yaml)
+    return Configuration.compile(yaml[DOMAIN]["configuration"])
@@ -0,0 +1,208 @@
+"""
+The number of Trakt and TMDB requests of a refresh, as a function of the size of the
+library. The bounds fail on complexity regressions, such as a request per media
+where a single one is expected.
+"""
+
+import asyncio
+import logging
+from math import ceil
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from benchmarks.fake_server import FakeServer, Library, RecordingTransport
+from benchmarks.refresh import build_api
+from custom_components.trakt_tv.apis.plan import HIDDEN_SECTIONS
+from custom_components.trakt_tv.models.kind import TraktKind
+
+SIZES = [10, 100, 1000]
+
+LIST = {
+    "list_id": "123",
+    "friendly_name": "Budget",
+    "max_medias": 10,
+    "private_list": False,
+    "media_type": "",
+    "sort_by": "rank",
+    "sort_order": "asc",
+}
+
+
+def calendar_requests(*days_to_fetch: int) -> int:
+    """The calendars are fetched by periods of 33 days at most."""
+    return sum(ceil(days / 33) for days in days_to_fetch)
+
+
+# The sensors of each case, with the bounds of the requests of a cold refresh as a
+# function of the library
+CASES = {
+    "next_to_watch": (
+        {"next_to_watch": {"all": {}, "only_aired": {}, "only_upcoming": {}}},
+        # The hidden shows and the watched shows, then the progress and the next
+        # episode of each show, the next to watch sensors share them
+        lambda library: len(HIDDEN_SECTIONS) + 1 + 2 * library.shows,
+        lambda library: library.shows,
+    ),
+    "watchlist": (
+        {"watchlist": {"movie": {"sort_by": "rating"}, "show": {}}},
+        # The watchlists, then the watched and collected medias, whatever the size
+        lambda library: 6,
+        # The extended shows are complete, only the movies miss their studio
+        lambda library: library.watchlist,
+    ),
+    "lists": (
+        {"lists": [LIST]},
+        lambda library: 1,
+        # The list alternates movies and shows
+        lambda library: ceil(library.list_items / 2),
+    ),
+    "upcoming": (
+        {
+            "upcoming": {"show": {"days_to_fetch": 90}, "movie": {}},
+            "all_upcoming": {"premiere": {"days_to_fetch": 30}},
+        },
+        lambda library: calendar_requests(90, 30, 30),
+        # Only the movies of the 30 days of their calendar
+        lambda library: 30 * library.calendar_per_day,
+    ),
+    "discover": (
+        {
+            "recommendation": {"movie": {"max_medias": 10}, "show": {}},
+            "anticipated": {"movie": {}, "show": {"max_medias": 10}},
+            "stats": ["all"],
+        },
+        # The recommendations and the anticipated medias are fetched with a limit
+        lambda library: 5,
+        lambda library: 2 * 10,
+    ),
+}
+
+
+def refresh(sensors, library, refreshes=2):
+    """
+    Refresh an account several times, return the requests of each refresh.
+    """
+    transport = RecordingTransport(FakeServer(library))
+    counts = []
+
+    async def run():
+        hass = HomeAssistant("/tmp")
+        api = build_api(hass, transport, {"language": "en", "sensors": sensors})
+        for _ in range(refreshes):
+            transport.reset()
+            await api.retrieve_data()
+            counts.append((transport.count("trakt"), transport.count("tmdb")))
+        await hass.async_stop(force=True)
+
+    asyncio.run(run())
+    return counts
+
+
+def upcoming_shows(derive_show_calendars):
+    """
+    Refresh the shows, new shows and premieres upcoming sensors, return the calendar
+    urls requested and the titles of each sensor.
+    """
+    transport = RecordingTransport(FakeServer(Library()))
+    days = {"days_to_fetch": 30, "max_medias": 100}
+    sensors = {"upcoming": {"show": days, "new_show": days, "premiere": days}}
+    configuration = {
+        "language": "en",
+        "derive_show_calendars": derive_show_calendars,
+        "sensors": sensors,
+    }
+
+    async def run():
+        hass = HomeAssistant("/tmp")
+        api = build_api(hass, transport, configuration)
+        data = await api.retrieve_data()
+        await hass.async_stop(force=True)
+        return data
+
+    data = asyncio.run(run())
+    urls = [url for _, url in transport.requests if url.startswith("calendars")]
+    titles = {
+        kind: [
+            (media.name, media.episode.season, media.episode.number)
+            for media in medias.items
+        ]
+        for kind, medias in data["upcoming"].items()
+    }
+    return urls, titles
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    """The finished shows of the fake library are logged as warnings."""
+    logging.disable(logging.WARNING)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+class TestBudget:
+    @pytest.mark.parametrize("size", SIZES)
+    @pytest.mark.parametrize("case", CASES)
+    def test_cold_refresh(self, case, size):
+        sensors, trakt_budget, tmdb_budget = CASES[case]
+        library = Library(shows=size, movies=size, list_items=size, watchlist=size)
+
+        (trakt, tmdb), _ = refresh(sensors, library)
+
+        assert trakt <= trakt_budget(library)
+        assert tmdb <= tmdb_budget(library)
+
+    @pytest.mark.parametrize("case", CASES)
+    def test_warm_refresh(self, case):
+        sensors, _, _ = CASES[case]
+
+        _, (trakt, tmdb) = refresh(sensors, Library())
+
+        assert trakt == 0
+        assert tmdb == 0
+
+    def test_large_list(self):
+        library = Library(list_items=5000)
+
+        (trakt, tmdb), _ = refresh({"lists": [LIST]}, library)
+
+        assert trakt == 1
+        assert tmdb <= library.list_items
+
+    def test_shows_sharing_the_sources(self):
+        """The next to watch and the watchlist sensors fetch the watched shows once."""
+        library = Library(shows=100)
+        sensors = {
+            **CASES["next_to_watch"][0],
+            "watchlist": {"show": {"only_unwatched": True}},
+        }
+
+        (trakt, _), _ = refresh(sensors, library)
+
+        assert trakt <= len(HIDDEN_SECTIONS) + 1 + 2 * library.shows + 2
+
+    def test_derived_show_calendars(self):
+        """The new shows and the premieres are extracted from the shows calendar."""
+        fetched_urls, fetched = upcoming_shows(False)
+        derived_urls, derived = upcoming_shows(True)
+
+        assert len(fetched_urls) == 3
+        assert len(derived_urls) == 1
+        assert derived_urls[0].startswith("calendars/my/shows/")
+        assert derived == fetched
+        assert 0 < len(derived[TraktKind.NEW_SHOW]) < len(derived[TraktKind.PREMIERE])
+        assert len(derived[TraktKind.PREMIERE]) < len(derived[TraktKind.SHOW])
+
+    def test_extended_shows_skip_tmdb(self):
+        """The extended Trakt shows have every field, TMDB is not requested."""
+        library = Library(list_items=100)
+        sensors = {
+            "lists": [{**LIST, "media_type": "show", "max_medias": 100}],
+            "upcoming": {"show": {"days_to_fetch": 30, "max_medias": 100}},
+            "anticipated": {"show": {}},
+        }
+
+        (trakt, tmdb), _ = refresh(sensors, library)
+
+        assert trakt > 0
+        assert tmdb == 0
@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+from aiohttp import ClientConnectionError, ClientError
+
+from custom_components.trakt_tv.apis.cassette import (
+    CassettePlayer,
+    CassetteRecorder,
+    anonymize,
+    cassette_transport,
+    load_cassette,
+)
+from custom_components.trakt_tv.apis.middlewares import (
+    HttpRequest,
+    HttpResponse,
+    SessionTransport,
+)
+from custom_components.trakt_tv.schema import domain_configuration_schema
+
+
+def get(url="sync/watched/movies"):
+    return HttpRequest(
+        method="get",
+        host="https://api.trakt.tv",
+        url=url,
+        headers={"Authorization": "Bearer secret", "trakt-api-version": "2"},
+    )
+
+
+def record(path, *responses, max_bytes=1000):
+    """Record a request answered by each of the given responses."""
+    answers = list(responses)
+
+    async def transport(request):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    recorder = CassetteRecorder(transport, str(path), max_bytes)
+
+    async def run():
+        for _ in responses:
+            try:
+                await recorder(get())
+            except ClientError:
+                pass
+
+    asyncio.run(run())
+    asyncio.run(recorder.save())
+    return recorder
+
+
+class TestCassette:
+    def test_record(self, tmp_path):
+        path = tmp_path / "cassette.json.gz"
+        headers = {"Retry-After": "1", "Set-Cookie": "session"}
+        record(path, HttpResponse(429, headers, b"{}"), HttpResponse(200, {}, b"[1]"))
+
+        first, second = load_cassette(str(path))
+
+        assert first.status == 429
+        assert first.headers == {"Retry-After": "1"}
+        assert first.request_headers == {"trakt-api-version": "2"}
+        assert second.body == [1]
+
+    def test_record_until_full(self, tmp_path):
+        path = tmp_path / "cassette.json.gz"
+        ok = HttpResponse(200, {}, b"[1, 2]")
+
+        recorder = record(path, ok, ok, ok, max_bytes=10)
+
+        assert len(load_cassette(str(path))) == 2
+        assert recorder.size == 12
+        assert not recorder.unsaved
+
+    def test_record_decodes_when_saved(self, tmp_path):
+        path = tmp_path / "cassette.json.gz"
+        body = b'[{"rank": 1, "user": {"username": "john"}}]'
+
+        async def transport(request):
+            return HttpResponse(200, {}, body)
+
+        saved = []
+
+        async def executor(function, *args):
+            saved.append(function)
+            return function(*args)
+
+        recorder = CassetteRecorder(transport, str(path), executor=executor)
+
+        async def run():
+            await recorder(get())
+            # The body is kept as received until the cassette is saved
+            assert recorder.exchanges[0][1] is body
+            await recorder.save()
+
+        asyncio.run(run())
+
+        (exchange,) = load_cassette(str(path))
+        assert len(saved) == 1
+        assert exchange.body[0]["user"]["username"] == "anonymous"
+
+    def test_record_during_save(self, tmp_path):
+        path = tmp_path / "cassette.json.gz"
+
+        async def transport(request):
+            return HttpResponse(200, {}, b"[]")
+
+        async def executor(function, *args):
+            # A request is recorded while the cassette is written
+            await recorder(get())
+            return function(*args)
+
+        recorder = CassetteRecorder(transport, str(path), executor=executor)
+
+        async def run():
+            await recorder(get())
+            await recorder.save()
+            saved = len(load_cassette(str(path)))
+            unsaved = recorder.unsaved
+            await recorder.save()
+            return saved, unsaved
+
+        assert asyncio.run(run()) == (1, True)
+        assert len(load_cassette(str(path))) == 2
+        assert len(recorder.exchanges) == 3
+
+    def test_record_streamed_response(self, tmp_path):
+        path = tmp_path / "cassette.json.gz"
+        record(path, HttpResponse(200, {}, b"", data=[1, 2], decoded=True))
+
+        (exchange,) = load_cassette(str(path))
+
+        assert exchange.body == [1, 2]
+
+    def test_anonymize(self):
+        data = [{"rank": 1, "user": {"username": "john", "ids": {"slug": "john"}}}]
+
+        assert anonymize(data)[0]["user"]["username"] == "anonymous"
+        assert anonymize(data)[0]["rank"] == 1
+
+    def test_replay(self, tmp_path):
+        path = tmp_path / "cassette.json.gz"
+        record(
+            path,
+            HttpResponse(503, {}, b"unavailable"),
+            HttpResponse(200, {}, b'{"name": "Trakt"}'),
+        )
+        player = CassettePlayer(str(path))
+
+        async def run():
+            return [await player(get()) for _ in range(3)]
+
+        responses = asyncio.run(run())
+
+        assert [response.status for response in responses] == [503, 200, 200]
+        assert responses[0].text == "unavailable"
+        assert responses[2].text == '{"name": "Trakt"}'
+
+    def test_replay_error(self, tmp_path):
+        path = tmp_path / "cassette.json.gz"
+        record(path, ClientConnectionError("reset"), HttpResponse(200, {}, b"[]"))
+        player = CassettePlayer(str(path))
+
+        with pytest.raises(ClientError):
+            asyncio.run(player(get()))
+
+    def test_replay_missing_request(self, tmp_path):
+        path = tmp_path / "cassette.json.gz"
+        record(path, HttpResponse(200, {}, b"[]"))
+        player = CassettePlayer(str(path))
+
+        response = asyncio.run(player(get("users/me/stats")))
+
+        assert response.status == 404
+
+    def test_cassette_transport(self):
+        transport = SessionTransport()
+        settings = domain_configuration_schema()({"cassette": {"mode": "replay"}})
+
+        assert cassette_transport(None, transport, str, "entry") is transport
+        player = cassette_transport(settings["cassette"], transport, str, "entry")
+        assert isinstance(player, CassettePlayer)
+        assert player.path == "trakt_tv_cassette_entry.json.gz"
+        assert not player.latency
+
+    def test_cassette_per_account(self, tmp_path):
+        transport = SessionTransport()
+        settings = domain_configuration_schema()({"cassette": {"mode": "record"}})
+        resolve_path = lambda path: str(tmp_path / path)
+
+        first = cassette_transport(settings["cassette"], transport, resolve_path, "1")
+        second = cassette_transport(settings["cassette"], transport, resolve_path, "2")
+
+        assert isinstance(first, CassetteRecorder)
+        assert first.path == str(tmp_path / "trakt_tv_cassette_1.json.gz")
+        assert second.path == str(tmp_path / "trakt_tv_cassette_2.json.gz")
@@ -1,4 +1,14 @@
-from custom_components.trakt_tv.configuration import Configuration
+import dataclasses
+
+import pytest
+
+from custom_components.trakt_tv.configuration import (
+    Configuration,
+    get_configuration,
+    set_configuration,
+)
+from custom_components.trakt_tv.const import DOMAIN
+from custom_components.trakt_tv.models.cache import CACHE_POLICIES
 
 
 class TestConfiguration:
@@ -21,7 +31,7 @@ class TestConfiguration:
         assert configuration.get_language() == "fr"
 
     def test_get_language_default(self):
-        configuration = Configuration(data={})
+        configuration = get_configuration({})
         assert configuration.get_language() == "en"
 
     def test_watchlist_identifier_exists(self, configuration):
@@ -42,3 +52,47 @@ class TestConfiguration:
 
     def test_is_watchlist_only_unwatched_default(self, configuration):
         assert configuration.is_watchlist_only_unwatched("movie") is True
+
+    def test_derive_show_calendars_default(self, configuration):
+        assert configuration.derive_show_calendars() is False
+
+    def test_get_stream_families_default(self, configuration):
+        assert configuration.get_stream_families() == frozenset()
+
+    def test_get_stream_families(self, yaml):
+        conf = {**yaml[DOMAIN]["configuration"], "stream_families": ["sync"]}
+        assert Configuration.compile(conf).get_stream_families() == {"sync"}
+
+    def test_get_cache_policy_default(self, configuration):
+        policy = configuration.get_cache_policy("calendars")
+        assert policy == CACHE_POLICIES["calendars"]
+
+    def test_get_cache_policy_override(self, yaml):
+        conf = {**yaml[DOMAIN]["configuration"], "cache": {"progress": {"ttl": 60}}}
+        policy = Configuration.compile(conf).get_cache_policy("progress")
+        assert policy.ttl == 60
+        assert policy.stale == CACHE_POLICIES["progress"].stale
+
+    def test_sensor_settings_defaults(self, configuration):
+        settings = configuration.sensor_settings("upcoming", "movie")
+        assert settings.days_to_fetch == 60
+        assert settings.max_medias == 3
+        assert settings.sort_configured is False
+        assert configuration.sensor_settings(
+            "next_to_watch", "only_aired"
+        ).sort_configured
+
+    def test_snapshot_is_immutable(self, configuration):
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            configuration.language = "en"
+        with pytest.raises(TypeError):
+            configuration.conf["sensors"]["upcoming"]["movie"]["days_to_fetch"] = 1
+
+    def test_set_configuration_replaces_the_snapshot(self, yaml):
+        data = {}
+        first = set_configuration(data, yaml[DOMAIN]["configuration"])
+        second = set_configuration(data, {"language": "de"})
+
+        assert get_configuration(data) is second
+        assert first.get_language() == "fr"
+        assert second.get_language() == "de"
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from benchmarks.fake_server import FakeServer, Library, RecordingTransport
+from benchmarks.refresh import ENTRY_ID, build_api
+from custom_components.trakt_tv.const import DOMAIN
+from custom_components.trakt_tv.diagnostics import (
+    async_get_config_entry_diagnostics,
+    cache_sizes,
+    thaw,
+)
+from custom_components.trakt_tv.models.cache import NEGATIVE_ENTRY
+
+ENTRY = ConfigEntry(
+    version=1,
+    minor_version=1,
+    domain=DOMAIN,
+    title="Trakt",
+    data={
+        "client_id": "id",
+        "client_secret": "secret",
+        "token": {"access_token": "access", "refresh_token": "refresh"},
+    },
+    source="user",
+    entry_id=ENTRY_ID,
+)
+
+
+class Sensor:
+    """A sensor recording the threads its attributes are rendered from."""
+
+    name = "Trakt Sensor"
+
+    def __init__(self):
+        self.threads = []
+
+    @property
+    def extra_state_attributes(self):
+        self.threads.append(threading.current_thread())
+        return {"data": [{"title": "Dune"}]}
+
+
+def diagnostics(sensors, entities=()):
+    async def run():
+        hass = HomeAssistant("/tmp")
+        transport = RecordingTransport(FakeServer(Library(shows=5)))
+        api = build_api(hass, transport, {"language": "en", "sensors": sensors})
+        hass.data[DOMAIN][ENTRY_ID]["instances"] = {"api": api}
+        hass.data[DOMAIN][ENTRY_ID]["sensors"] = list(entities)
+
+        await api.retrieve_data()
+        await api.retrieve_data()
+        result = await async_get_config_entry_diagnostics(hass, ENTRY)
+
+        await hass.async_stop(force=True)
+        return result
+
+    return asyncio.run(run())
+
+
+class TestDiagnostics:
+    def test_diagnostics(self):
+        sensors = {"next_to_watch": {"all": {}}, "stats": ["all"]}
+
+        result = diagnostics(sensors)
+
+        assert result["entry"]["data"]["client_secret"] == "**REDACTED**"
+        assert result["entry"]["data"]["token"]["access_token"] == "**REDACTED**"
+        assert result["configuration"]["sensors"]["stats"] == ["all"]
+        assert set(result["metrics"]["sources"]) == {"all", "stats"}
+        assert result["refresh_plan"]
+
+        progress = result["metrics"]["families"]["progress"]
+        assert progress["requests"] == 5
+        assert progress["exchanges"] == 5
+        assert progress["statuses"] == {"200": 5}
+        assert progress["bytes"] > 0
+        assert progress["cache"] == {"hit": 5, "negative": 0, "miss": 5, "stale": 0}
+        assert progress["cache_hit_ratio"] == 0.5
+        assert result["cache"]["account"]["progress"]["entries"] == 5
+
+    def test_sensors_rendered_on_the_loop(self):
+        sensor = Sensor()
+
+        result = diagnostics({"stats": ["all"]}, [sensor])
+
+        assert result["sensors"] == {
+            "Trakt Sensor": len('{"data": [{"title": "Dune"}]}')
+        }
+        assert sensor.threads == [threading.main_thread()]
+
+    def test_cache_sizes(self):
+        cache = {
+            "tmdb:3/movie/1": {"title": "Dune"},
+            "tmdb:3/movie/1_time": 0,
+            "tmdb:3/movie/2": NEGATIVE_ENTRY,
+            "tmdb:3/movie/2_time": 0,
+        }
+
+        assert cache_sizes(cache) == {
+            "tmdb": {"entries": 2, "negative": 1, "bytes": len('{"title": "Dune"}')}
+        }
+
+    def test_thaw(self, configuration):
+        assert thaw(configuration.conf)["sensors"]["upcoming"] == {
+            "movie": {"days_to_fetch": 60}
+        }
@@ -0,0 +1,38 @@
+from custom_components.trakt_tv.models.kind import is_new_show, is_premiere
+
+
+def entry(season, number, episode_type=None):
+    episode = {"season": season, "number": number}
+    if episode_type is not None:
+        episode["episode_type"] = episode_type
+    return {"first_aired": "2022-03-14T01:00:00.000Z", "episode": episode}
+
+
+class TestShowCalendarFilters:
+    def test_is_new_show(self):
+        assert is_new_show(entry(1, 1, "series_premiere"))
+        assert not is_new_show(entry(2, 1, "season_premiere"))
+        assert not is_new_show(entry(1, 1, "mid_season_premiere"))
+        assert not is_new_show(entry(1, 2, "standard"))
+
+    def test_is_new_show_without_episode_type(self):
+        assert is_new_show(entry(1, 1))
+        assert not is_new_show(entry(2, 1))
+        assert not is_new_show(entry(0, 1))
+        assert not is_new_show(entry(None, 1))
+        assert not is_new_show({"episode": None})
+
+    def test_is_premiere(self):
+        assert is_premiere(entry(1, 1, "series_premiere"))
+        assert is_premiere(entry(3, 1, "season_premiere"))
+        assert is_premiere(entry(3, 9, "mid_season_premiere"))
+        assert not is_premiere(entry(3, 8, "mid_season_finale"))
+        assert not is_premiere(entry(3, 2, "standard"))
+
+    def test_is_premiere_without_episode_type(self):
+        assert is_premiere(entry(1, 1))
+        assert is_premiere(entry(4, 1))
+        # The specials are not premieres
+        assert not is_premiere(entry(0, 1))
+        assert not is_premiere(entry(None, 1))
+        assert not is_premiere({"episode": {"number": 1}})
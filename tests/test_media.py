@@ -0,0 +1,226 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from custom_components.trakt_tv.models import columns
+from custom_components.trakt_tv.models.media import Identifiers, Medias, Movie, Show
+
+MOVIE = {
+    "listed_at": "2022-03-12T10:00:00.000Z",
+    "movie": {
+        "title": "Dune",
+        "ids": {"trakt": 1, "slug": "dune", "tmdb": 438631},
+        "overview": "Paul Atreides travels to Arrakis.",
+        "released": "2021-10-22",
+        "runtime": 155,
+        "trailer": "https://youtube.com/watch?v=n9xhJrPXop4",
+        "genres": ["science-fiction", "adventure"],
+        "rating": 7.9,
+    },
+}
+
+SHOW = {
+    "title": "Dark",
+    "ids": {"trakt": 2, "slug": "dark", "tmdb": 70523},
+    "overview": "A family saga with a supernatural twist.",
+    "first_aired": "2017-12-01T09:00:00.000Z",
+    "runtime": 60,
+    "network": "Netflix",
+    "trailer": "https://youtube.com/watch?v=rrwycJ08PSA",
+    "genres": ["drama", "mystery"],
+    "rating": 8.4,
+    "images": {
+        "poster": ["media.trakt.tv/images/shows/dark/posters/medium/1.jpg.webp"],
+        "fanart": ["media.trakt.tv/images/shows/dark/fanarts/medium/1.jpg.webp"],
+    },
+}
+
+
+def http_of(data):
+    """Return a fake middleware chain answering the given data."""
+    requests = []
+
+    async def http(request):
+        requests.append(request)
+        return data
+
+    return http, requests
+
+
+class TestMedia:
+    def test_from_trakt_extended(self):
+        movie = Movie.from_trakt(MOVIE)
+
+        assert movie.summary == "Paul Atreides travels to Arrakis."
+        assert movie.runtime == 155
+        assert movie.genres == ("Science Fiction", "Adventure")
+        assert movie.released.year == 2021
+
+    def test_missing_fields(self):
+        movie = Movie.from_trakt(MOVIE)
+
+        assert movie.missing_fields("en") == {"poster", "fanart", "studio"}
+        assert {"name", "summary", "genres"} <= movie.missing_fields("fr")
+
+    def test_get_more_information_keeps_trakt_fields(self):
+        movie = Movie.from_trakt(MOVIE)
+        http, requests = http_of(
+            {"overview": "Other", "poster_path": "/poster.jpg", "vote_average": 8}
+        )
+
+        asyncio.run(movie.get_more_information("en", http))
+
+        assert len(requests) == 1
+        assert "append_to_response" not in requests[0].url
+        assert movie.summary == "Paul Atreides travels to Arrakis."
+        assert movie.poster == "/poster.jpg"
+        assert movie.rating == 7.9
+
+    def test_extended_show_skips_tmdb(self):
+        show = Show.from_trakt(SHOW)
+        http, requests = http_of({"title": "Dark (TMDB)", "vote_average": 8})
+
+        asyncio.run(show.get_more_information("en", http))
+
+        assert requests == []
+        assert show.name == "Dark"
+        assert show.rating == 8.4
+        assert show.to_homeassistant()["poster"] == (
+            "https://media.trakt.tv/images/shows/dark/posters/medium/1.jpg.webp"
+        )
+
+    def test_extended_movie_only_asks_tmdb_for_the_studio(self):
+        images = {
+            "poster": ["media.trakt.tv/p.jpg"],
+            "fanart": ["media.trakt.tv/f.jpg"],
+        }
+        movie = Movie.from_trakt(
+            {**MOVIE, "movie": {**MOVIE["movie"], "images": images}}
+        )
+        http, requests = http_of(
+            {
+                "poster_path": "/poster.jpg",
+                "production_companies": [{"name": "Legendary"}],
+            }
+        )
+
+        assert movie.missing_fields("en") == {"studio"}
+        asyncio.run(movie.get_more_information("en", http))
+
+        assert len(requests) == 1
+        assert movie.studio == "Legendary"
+        assert movie.poster == "media.trakt.tv/p.jpg"
+
+    def test_to_homeassistant(self):
+        movie = Movie.from_trakt(MOVIE)
+        movie.poster = "/poster.jpg"
+
+        data = movie.to_homeassistant()
+
+        assert data["poster"] == "https://image.tmdb.org/t/p/w500/poster.jpg"
+        assert data["genres"] == ["Science Fiction", "Adventure"]
+        assert data["ids"] == {
+            "trakt": 1,
+            "slug": "dune",
+            "tvdb": None,
+            "imdb": None,
+            "tmdb": 438631,
+        }
+        assert not hasattr(movie, "__dict__")
+
+    def test_get_more_information_skipped(self):
+        show = Show.from_trakt({"title": "Dark", "ids": {"tmdb": 70523}})
+        show.released = show.summary = show.trailer = show.studio = "known"
+        show.poster = show.fanart = show.rating = "known"
+        show.genres = ("Drama",)
+        http, requests = http_of({})
+
+        asyncio.run(show.get_more_information("en", http))
+
+        assert requests == []
+
+    def test_get_more_information_resolves_tmdb_id(self):
+        movie = Movie.from_trakt({"title": "Dune", "ids": {"imdb": "tt1160419"}})
+        http, requests = http_of({"movie_results": [{"id": 438631}]})
+
+        asyncio.run(movie.get_more_information("en", http))
+
+        assert movie.ids.tmdb == 438631
+        assert requests[0].url == "3/find/tt1160419?external_source=imdb_id"
+        assert requests[1].url.startswith("3/movie/438631?")
+
+    def test_get_more_information_without_ids(self):
+        movie = Movie.from_trakt({"title": "Dune", "ids": {"trakt": 1}})
+        http, requests = http_of({})
+
+        asyncio.run(movie.get_more_information("en", http))
+
+        assert requests == []
+        assert movie.released == datetime.min
+
+
+def movies(number):
+    """Return movies with ties and missing fields, in a shuffled order."""
+    return [
+        Movie(
+            name=f"Movie {index}",
+            ids=Identifiers(trakt=index, slug=None, tvdb=None, imdb=None, tmdb=None),
+            released=datetime(2000 + index % 7, 1, 1, tzinfo=timezone.utc),
+            rank=(index * 7) % number,
+            rating=None if index % 5 == 0 else index % 3,
+        )
+        for index in range(number)
+    ]
+
+
+class TestMedias:
+    @pytest.fixture(params=[False, True], ids=["python", "columnar"])
+    def columnar(self, request, monkeypatch):
+        if request.param:
+            pytest.importorskip("numpy")
+            monkeypatch.setattr(columns, "COLUMNAR_THRESHOLD", 1)
+        else:
+            monkeypatch.setattr(columns, "COLUMNAR_THRESHOLD", 10**9)
+        return request.param
+
+    def test_backend(self, columnar):
+        assert (Medias(movies(10)).columns is not None) == columnar
+
+    def test_sort(self, columnar):
+        medias = Medias(movies(50))
+
+        assert [m.name for m in medias.sort("released", "desc")] == [
+            m.name for m in sorted(medias.items, key=lambda m: m.released, reverse=True)
+        ]
+        assert [m.name for m in medias.sort("rating", "asc", 12, default=0)] == [
+            m.name for m in sorted(medias.items, key=lambda m: m.rating or 0)[:12]
+        ]
+
+    def test_top(self, columnar):
+        medias = Medias(movies(50))
+
+        assert [m.rank for m in medias.top(3, "rank", "desc")] == [49, 48, 47]
+        assert medias.top(3, "rating") == medias.items
+
+    def test_filters(self, columnar):
+        medias = Medias(movies(50))
+        date = datetime(2003, 1, 1, tzinfo=timezone.utc)
+
+        assert all(m.released <= date for m in medias.released_before(date).items)
+        assert len(medias.released_before(date).items) == 29
+        assert len(medias.released_after(date).items) == 21
+        assert len(medias.released_after(date, inclusive=True).items) == 28
+        assert [m.ids.trakt for m in medias.excluding(set(range(1, 50))).items] == [0]
+
+    def test_filters_keep_the_columns(self, columnar):
+        medias = Medias(movies(50))
+        date = datetime(2003, 1, 1, tzinfo=timezone.utc)
+
+        kept = medias.released_after(date)
+
+        assert [m.name for m in kept.top(5, "released")] == [
+            m.name for m in sorted(kept.items, key=lambda m: m.released)[:5]
+        ]
+        if columnar:
+            assert "released" in kept.columns.columns
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import sys
+import tracemalloc
+from pathlib import Path
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from benchmarks import payloads
+from benchmarks.fake_server import FakeServer, Library, RecordingTransport
+from benchmarks.refresh import ENTRY_ID, build_api
+from custom_components.trakt_tv.const import DOMAIN
+from custom_components.trakt_tv.memory import (
+    cache_report,
+    data_report,
+    data_snapshot,
+    deep_size,
+)
+from custom_components.trakt_tv.models.cache import CACHE_POLICIES, NEGATIVE_ENTRY
+from custom_components.trakt_tv.models.kind import TraktKind
+from custom_components.trakt_tv.models.media import Medias, Movie
+from custom_components.trakt_tv.services import async_setup_services
+
+LOGGER = logging.getLogger(__name__)
+
+
+def memory_reports(config_dir, *calls, jobs=None):
+    """Refresh an account, then call the memory report service with each data."""
+
+    async def run():
+        hass = HomeAssistant(str(config_dir))
+        if jobs is not None:
+            add_executor_job = hass.async_add_executor_job
+
+            def record_job(target, *args):
+                jobs.append(args)
+                return add_executor_job(target, *args)
+
+            hass.async_add_executor_job = record_job
+        transport = RecordingTransport(FakeServer(Library(shows=5)))
+        sensors = {"next_to_watch": {"all": {}}}
+        api = build_api(hass, transport, {"language": "en", "sensors": sensors})
+        coordinator = DataUpdateCoordinator(
+            hass, LOGGER, name="trakt", update_method=api.retrieve_data
+        )
+        hass.data[DOMAIN][ENTRY_ID]["instances"] = {
+            "api": api,
+            "coordinator": coordinator,
+        }
+        await coordinator.async_refresh()
+
+        async_setup_services(hass)
+        reports = [
+            await hass.services.async_call(
+                DOMAIN, "memory_report", data, blocking=True, return_response=True
+            )
+            for data in calls
+        ]
+
+        await hass.async_stop(force=True)
+        return reports
+
+    return asyncio.run(run())
+
+
+class TestMemory:
+    def test_deep_size(self):
+        title = "".join(["Dune"] * 10)
+        titles = [title, title]
+
+        assert deep_size(titles) == sys.getsizeof(titles) + sys.getsizeof(title)
+        assert deep_size(TraktKind.MOVIE) == 0
+        assert deep_size(Movie.from_trakt(payloads.movie(0))) > 0
+
+    def test_cache_report(self):
+        cache = {
+            "tmdb:3/movie/1": {"title": "Dune"},
+            "tmdb:3/movie/1_time": 0,
+            "tmdb:3/movie/2": NEGATIVE_ENTRY,
+            "tmdb:3/movie/2_time": 1000,
+            "sync:sync/watched/movies": [],
+            "sync:sync/watched/movies_time": 1000,
+        }
+
+        report = cache_report(cache, CACHE_POLICIES.get, now=1000 + 2 * 86400)
+
+        assert report["tmdb"]["entries"] == 2
+        assert report["tmdb"]["negative"] == 1
+        assert report["tmdb"]["expired"] == 1
+        assert report["sync"]["expired"] == 1
+        assert report["sync"]["bytes"] > 0
+
+    def test_data_report(self):
+        medias = Medias(
+            [Movie.from_trakt(data) for data in payloads.many(payloads.movie, 10)]
+        )
+        data = {
+            "upcoming": {TraktKind.MOVIE: medias},
+            "lists": {TraktKind.LIST: {"Favorites": medias}},
+            "stats": {"movies_watched": 10},
+        }
+
+        before = data_report(data_snapshot(data))["upcoming"]
+        medias.to_homeassistant()
+        after = data_report(data_snapshot(data))
+
+        assert before["medias"] == 10
+        assert before["rendered"] < after["upcoming"]["rendered"]
+        assert after["upcoming"] == after["lists"]
+        assert after["stats"]["medias"] == 0
+
+    def test_data_snapshot(self):
+        medias = Medias(
+            [Movie.from_trakt(data) for data in payloads.many(payloads.movie, 10)]
+        )
+        snapshot = data_snapshot({"upcoming": {TraktKind.MOVIE: medias}})
+        before = data_report(snapshot)
+
+        # The sensors render the medias while the snapshot is measured
+        medias.to_homeassistant()
+
+        assert data_report(snapshot) == before
+
+    def test_memory_report(self, tmp_path):
+        started, traced, stopped = memory_reports(
+            tmp_path,
+            {"tracemalloc": True},
+            {"tracemalloc": True},
+            {"stop_tracing": True},
+        )
+
+        assert started["tracemalloc"] == {"started": True}
+        assert started["caches"]["account"]["progress"]["entries"] == 5
+        assert started["coordinator"]["all"]["medias"] > 0
+        assert started["total"] > 0
+        assert Path(traced["tracemalloc"]["snapshot"]).exists()
+        assert traced["tracemalloc"]["growth"] is not None
+        assert "tracemalloc" not in stopped
+        assert not tracemalloc.is_tracing()
+
+    def test_memory_report_measures_snapshots(self, tmp_path):
+        jobs = []
+
+        memory_reports(tmp_path, {}, jobs=jobs)
+
+        (arguments,) = jobs
+        plain = (dict, list, tuple, str, int, float, type(None))
+        assert all(isinstance(value, plain) or callable(value) for value in arguments)
+        _, _, _, data, state = arguments
+        assert data["all"]["collections"]
+        assert set(state) == {"refresh_plan", "metrics"}
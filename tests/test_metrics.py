@@ -0,0 +1,111 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from custom_components.trakt_tv.apis.metrics import Metrics, parse_rate_limit
+from custom_components.trakt_tv.apis.middlewares import (
+    ExchangeMetricsMiddleware,
+    HttpRequest,
+    HttpResponse,
+    build_chain,
+)
+from custom_components.trakt_tv.sensor import (
+    DIAGNOSTIC_SENSORS,
+    SCAN_INTERVAL,
+    TraktDiagnosticSensor,
+    source_duration_sensor,
+)
+
+RATE_LIMIT = {
+    "name": "AUTHED_API_GET_LIMIT",
+    "period": 300,
+    "limit": 1000,
+    "remaining": 0,
+    "until": "2020-10-10T00:24:00Z",
+}
+
+
+def sensor(key):
+    return next(sensor for sensor in DIAGNOSTIC_SENSORS if sensor.key == key)
+
+
+class TestMetrics:
+    def test_parse_rate_limit(self):
+        rate_limit = parse_rate_limit({"X-Ratelimit": json.dumps(RATE_LIMIT)})
+        until = datetime(2020, 10, 10, 0, 24, tzinfo=timezone.utc)
+
+        assert rate_limit.limit == 1000
+        assert rate_limit.until == until
+        assert rate_limit.remaining_at(until - timedelta(seconds=1)) == 0
+        assert rate_limit.remaining_at(until) == 1000
+
+    def test_parse_rate_limit_missing(self):
+        assert parse_rate_limit({"Retry-After": "1"}) is None
+        assert parse_rate_limit({"x-ratelimit": "1000"}) is None
+
+    def test_exchange_metrics_rate_limit(self):
+        metrics = Metrics()
+        headers = {"x-ratelimit": json.dumps(RATE_LIMIT)}
+
+        async def transport(request):
+            return HttpResponse(429, headers, b"{}")
+
+        chain = build_chain([ExchangeMetricsMiddleware(metrics)], transport)
+        request = HttpRequest(
+            method="get", host="https://api.trakt.tv", url="sync/watched/movies"
+        )
+        asyncio.run(chain(request))
+
+        assert metrics.rate_limit.remaining == 0
+        assert metrics.family(request.family).rate_limited == 1
+
+    def test_cycle(self):
+        metrics = Metrics()
+        metrics.family("sync").observe("200", 0.1)
+        metrics.cache_lookup("sync", "miss")
+
+        metrics.cycle_started()
+        metrics.family("sync").observe("200", 0.1)
+        metrics.family("sync").observe("429", 0.1)
+        metrics.cache_lookup("sync", "hit")
+        metrics.cache_lookup("tmdb", "negative")
+        metrics.cache_lookup("tmdb", "miss")
+        metrics.cache_lookup("tmdb", "stale")
+        metrics.cycle_finished()
+
+        assert metrics.last_cycle.exchanges == 2
+        assert metrics.last_cycle.lookups == 3
+        assert metrics.last_cycle.hit_ratio == 2 / 3
+        assert metrics.as_dict()["last_cycle"]["cache_hit_ratio"] == 0.667
+
+    def test_diagnostic_sensors(self):
+        metrics = Metrics()
+        metrics.sources["only_aired"] = 1.234
+
+        assert sensor("api_quota").value(metrics) is None
+        assert sensor("next_refresh").value(metrics) is None
+
+        metrics.cycle_started()
+        metrics.cycle_finished()
+        metrics.observe_rate_limit({"X-Ratelimit": json.dumps(RATE_LIMIT)})
+
+        assert sensor("api_quota").value(metrics) == 1000
+        assert sensor("api_quota").attributes(metrics)["limit"] == 1000
+        assert sensor("refresh_requests").value(metrics) == 0
+        assert sensor("next_refresh").value(metrics) == (
+            metrics.last_cycle.started + SCAN_INTERVAL
+        )
+
+        duration = source_duration_sensor("only_aired")
+        assert duration.name == "Trakt Refresh Duration Next To Watch Only Aired"
+        assert duration.value(metrics) == 1.23
+
+    def test_diagnostic_sensor_name(self):
+        entry = SimpleNamespace(entry_id="entry")
+
+        entity = TraktDiagnosticSensor(entry, None, Metrics(), sensor("api_quota"))
+
+        assert not entity.has_entity_name
+        assert entity.name == "Trakt API Quota"
+        assert entity.unique_id == "entry_diagnostic_api_quota"
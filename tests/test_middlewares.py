@@ -0,0 +1,315 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.fake_server import FakeServer, Library
+from custom_components.trakt_tv.apis.middlewares import (
+    CacheMiddleware,
+    CircuitBreakerMiddleware,
+    HttpRequest,
+    HttpResponse,
+    JsonMiddleware,
+    Priority,
+    PriorityMiddleware,
+    ProjectionMiddleware,
+    RetryBudget,
+    RetryMiddleware,
+    SessionTransport,
+    SingleFlightMiddleware,
+    build_chain,
+)
+from custom_components.trakt_tv.exception import (
+    TraktCircuitOpenException,
+    TraktException,
+    TraktNotFoundException,
+)
+from custom_components.trakt_tv.models.cache import CachePolicy
+
+
+def transport_of(*responses):
+    """Return a transport answering the given responses in order."""
+    requests = []
+
+    async def transport(request):
+        requests.append(request)
+        return responses[min(len(requests), len(responses)) - 1]
+
+    return transport, requests
+
+
+def get(url="sync/watched/movies"):
+    return HttpRequest(method="get", host="https://api.trakt.tv", url=url)
+
+
+class TestMiddlewares:
+    def test_build_chain_order(self):
+        calls = []
+
+        def middleware(name):
+            async def call(request, call_next):
+                calls.append(name)
+                return await call_next(request)
+
+            return call
+
+        transport, _ = transport_of(HttpResponse(200, {}, b"{}"))
+        chain = build_chain([middleware("first"), middleware("second")], transport)
+
+        asyncio.run(chain(get()))
+
+        assert calls == ["first", "second"]
+
+    def test_json_middleware_error(self):
+        transport, _ = transport_of(HttpResponse(500, {}, b"oops"))
+        chain = build_chain([JsonMiddleware()], transport)
+
+        with pytest.raises(TraktException):
+            asyncio.run(chain(get()))
+
+    def test_json_middleware_offloads_large_bodies(self):
+        jobs = []
+
+        async def executor(function, *args):
+            jobs.append(function)
+            return function(*args)
+
+        transport, _ = transport_of(HttpResponse(200, {}, b"[1, 2, 3]"))
+        chain = build_chain([JsonMiddleware(executor, threshold=5)], transport)
+
+        assert asyncio.run(chain(get())) == [1, 2, 3]
+        assert len(jobs) == 1
+
+    def test_json_middleware_not_found(self):
+        transport, _ = transport_of(HttpResponse(200, {}, b'{"movie_results": []}'))
+        chain = build_chain([JsonMiddleware()], transport)
+        request = get("3/find/tt0000001?external_source=imdb_id")
+        request.not_found = lambda data: not data.get("movie_results")
+
+        with pytest.raises(TraktNotFoundException):
+            asyncio.run(chain(request))
+
+    def test_session_transport_streams_off_the_loop(self):
+        jobs = []
+
+        async def executor(function, *args):
+            jobs.append(function.__name__)
+            return await asyncio.get_running_loop().run_in_executor(
+                None, function, *args
+            )
+
+        async def run():
+            async with FakeServer(Library(shows=500)) as server:
+                transport = SessionTransport(executor=executor)
+                request = HttpRequest(
+                    method="get", host=f"{server.url}/trakt", url="sync/watched/shows"
+                )
+                whole = await transport(request)
+                request.stream = True
+                streamed = await transport(request)
+            return whole, streamed
+
+        whole, streamed = asyncio.run(run())
+
+        assert not whole.decoded
+        assert streamed.decoded
+        assert streamed.data == json.loads(whole.body)
+        assert streamed.size == whole.size == len(whole.body)
+        assert jobs.count("feed") > 1
+        assert jobs[-1] == "close"
+
+    def test_retry_middleware(self):
+        transport, requests = transport_of(
+            HttpResponse(429, {"Retry-After": "0"}, b""),
+            HttpResponse(200, {}, b'{"name": "Trakt"}'),
+        )
+        chain = build_chain(
+            [JsonMiddleware(), RetryMiddleware(extra_wait_time=0)], transport
+        )
+
+        assert asyncio.run(chain(get())) == {"name": "Trakt"}
+        assert len(requests) == 2
+
+    def test_retry_middleware_budget(self):
+        transport, requests = transport_of(HttpResponse(503, {}, b""))
+        retry = RetryMiddleware(base_wait_time=0, budget=RetryBudget(retries=2))
+        chain = build_chain([JsonMiddleware(), retry], transport)
+
+        with pytest.raises(TraktException, match="budget"):
+            asyncio.run(chain(get()))
+        assert len(requests) == 3
+
+    def test_circuit_breaker_middleware(self):
+        transport, requests = transport_of(
+            HttpResponse(500, {}, b""), HttpResponse(200, {}, b"[1]")
+        )
+        breaker = CircuitBreakerMiddleware(failure_threshold=1, reset_timeout=60)
+        chain = build_chain([JsonMiddleware(), breaker], transport)
+
+        with pytest.raises(TraktException):
+            asyncio.run(chain(get()))
+        with pytest.raises(TraktCircuitOpenException):
+            asyncio.run(chain(get()))
+        assert len(requests) == 1
+
+        # The probe is sent once the reset timeout is over and closes the circuit
+        breaker.breaker(get().host).reset_timeout = 0
+        assert asyncio.run(chain(get())) == [1]
+        assert breaker.breaker(get().host).state == "closed"
+
+    def test_circuit_breaker_cancelled_probe(self):
+        breaker = CircuitBreakerMiddleware(failure_threshold=1, reset_timeout=0)
+        breaker.breaker(get().host).record_failure()
+        requests = []
+
+        async def transport(request):
+            requests.append(request)
+            if len(requests) == 1:
+                await asyncio.sleep(60)
+            return HttpResponse(200, {}, b"[1]")
+
+        chain = build_chain([JsonMiddleware(), breaker], transport)
+
+        async def run():
+            probe = asyncio.ensure_future(chain(get()))
+            await asyncio.sleep(0)
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+            return await chain(get())
+
+        assert asyncio.run(run()) == [1]
+        assert len(requests) == 2
+        assert breaker.breaker(get().host).state == "closed"
+
+    def test_priority_middleware(self):
+        order = []
+
+        async def transport(request):
+            order.append(request.url)
+            await asyncio.sleep(0)
+            return HttpResponse(200, {}, b"[]")
+
+        chain = build_chain([PriorityMiddleware(limit=1)], transport)
+
+        async def run():
+            priorities = {
+                "stats": Priority.BACKGROUND,
+                "lists": Priority.NORMAL,
+                "next_to_watch": Priority.CRITICAL,
+            }
+            requests = [get(url) for url in priorities]
+            for request in requests:
+                request.priority = priorities[request.url]
+            await asyncio.gather(*[chain(request) for request in requests])
+
+        asyncio.run(run())
+
+        # The first request takes the free slot, the other ones wait by priority
+        assert order == ["stats", "next_to_watch", "lists"]
+
+    def test_priority_middleware_defers_background(self):
+        transport, requests = transport_of(HttpResponse(200, {}, b"[]"))
+        scheduler = PriorityMiddleware()
+        scheduler.pressure_until = float("inf")
+        chain = build_chain([scheduler], transport)
+        background = get("users/me/stats")
+        background.priority = Priority.BACKGROUND
+
+        async def run():
+            task = asyncio.ensure_future(chain(background))
+            await chain(get())
+            await asyncio.sleep(0)
+            assert not task.done()
+            task.cancel()
+
+        asyncio.run(run())
+        assert [request.url for request in requests] == ["sync/watched/movies"]
+
+    def test_cache_middleware(self):
+        layer = {"cache": {}, "pending": {}}
+        transport, requests = transport_of(HttpResponse(200, {}, b"[1]"))
+        chain = build_chain(
+            [
+                CacheMiddleware(lambda _: layer, lambda _: CachePolicy(ttl=60)),
+                JsonMiddleware(),
+            ],
+            transport,
+        )
+
+        async def run():
+            return [await chain(get()), await chain(get())]
+
+        assert asyncio.run(run()) == [[1], [1]]
+        assert len(requests) == 1
+
+    def test_single_flight_middleware(self):
+        layer = {"cache": {}, "pending": {}}
+        requests = []
+
+        async def transport(request):
+            requests.append(request)
+            await asyncio.sleep(0)
+            return HttpResponse(200, {}, b"[1]")
+
+        chain = build_chain(
+            [SingleFlightMiddleware(lambda _: layer), JsonMiddleware()], transport
+        )
+
+        async def run():
+            return await asyncio.gather(*[chain(get()) for _ in range(3)])
+
+        assert asyncio.run(run()) == [[1], [1], [1]]
+        assert len(requests) == 1
+        assert layer["pending"] == {}
+
+    def test_single_flight_cancelled_waiters(self):
+        layer = {"cache": {}, "pending": {}}
+        cancelled = []
+
+        async def transport(request):
+            try:
+                await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                cancelled.append(request)
+                raise
+            return HttpResponse(200, {}, b"[1]")
+
+        chain = build_chain(
+            [SingleFlightMiddleware(lambda _: layer), JsonMiddleware()], transport
+        )
+
+        async def run():
+            # The request goes on for the callers still waiting for it
+            first, second = [asyncio.ensure_future(chain(get())) for _ in range(2)]
+            await asyncio.sleep(0)
+            first.cancel()
+            assert await second == [1]
+
+            # It is cancelled once nobody waits for it
+            third = asyncio.ensure_future(chain(get()))
+            await asyncio.sleep(0)
+            third.cancel()
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        assert len(cancelled) == 1
+        assert layer["pending"] == {}
+
+    def test_cache_stores_projected_responses(self):
+        layer = {"cache": {}, "pending": {}}
+        body = b'{"aired": 2, "completed": 1, "seasons": [{"number": 1}]}'
+        transport, _ = transport_of(HttpResponse(200, {}, body))
+        chain = build_chain(
+            [
+                CacheMiddleware(lambda _: layer, lambda _: CachePolicy(ttl=60)),
+                ProjectionMiddleware(),
+                JsonMiddleware(),
+            ],
+            transport,
+        )
+        request = get("shows/1/progress/watched")
+        request.family = "progress"
+
+        assert asyncio.run(chain(request)) == {"aired": 2, "completed": 1}
+        assert layer["cache"][request.cache_key] == {"aired": 2, "completed": 1}
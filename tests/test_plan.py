@@ -0,0 +1,154 @@
+import asyncio
+
+from freezegun import freeze_time
+from homeassistant.core import HomeAssistant
+
+from benchmarks.fake_server import FakeServer, Library, RecordingTransport
+from benchmarks.refresh import build_api
+from custom_components.trakt_tv.apis.middlewares import Priority
+from custom_components.trakt_tv.apis.plan import (
+    EPISODE_URL,
+    SHOW_PROGRESS_URL,
+    WATCHED_SHOWS_URL,
+    compile_refresh_plan,
+    derived_show_kinds,
+)
+from custom_components.trakt_tv.configuration import Configuration
+from custom_components.trakt_tv.const import DOMAIN
+from custom_components.trakt_tv.models.kind import UPCOMING_KINDS, TraktKind
+
+
+class TestPlan:
+    @freeze_time("2022-03-13")
+    def test_compile_refresh_plan(self, configuration):
+        plan = compile_refresh_plan(configuration)
+
+        assert "calendars/my/movies/2022-03-12/33?extended=full,images" in plan.nodes
+        assert "calendars/my/movies/2022-04-14/27?extended=full,images" in plan.nodes
+        assert "users/me/watchlist/movies/rating" not in plan.nodes
+        assert "users/me/watchlist/movies/released?extended=full,images" in plan.nodes
+        assert plan.nodes[SHOW_PROGRESS_URL].dynamic is True
+        assert plan.nodes[EPISODE_URL].depends_on == [SHOW_PROGRESS_URL]
+
+    def test_compile_refresh_plan_deduplicates_endpoints(self, yaml):
+        conf = yaml[DOMAIN]["configuration"]
+        conf["sensors"]["watchlist"]["show"] = {"only_unwatched": True}
+        conf["sensors"]["next_to_watch"]["all"] = {}
+
+        plan = compile_refresh_plan(Configuration.compile(conf))
+
+        assert plan.nodes[WATCHED_SHOWS_URL].consumers == [
+            "watchlist.show",
+            "next_to_watch.all",
+            "next_to_watch.only_aired",
+        ]
+        assert len([url for url in plan.nodes if url.startswith("users/hidden")]) == 5
+
+    def test_record_run(self, configuration):
+        plan = compile_refresh_plan(configuration)
+
+        plan.record_run("shows/1/progress/watched")
+        plan.record_run("shows/2/progress/watched")
+
+        assert plan.nodes[SHOW_PROGRESS_URL].runs == 2
+
+    @freeze_time("2022-03-13")
+    def test_priority(self, configuration):
+        plan = compile_refresh_plan(configuration, {"upcoming.movie"})
+
+        assert plan.priority(WATCHED_SHOWS_URL) == Priority.BACKGROUND
+        assert plan.priority("shows/1/progress/watched") == Priority.BACKGROUND
+        assert (
+            plan.priority("calendars/my/movies/2022-03-12/33?extended=full,images")
+            == Priority.HIGH
+        )
+        assert (
+            plan.priority("calendars/my/movies/2022-04-14/27?extended=full,images")
+            == Priority.BACKGROUND
+        )
+
+    def test_derived_show_kinds(self):
+        def derived(source, identifiers):
+            sensors = {source: {identifier: {} for identifier in identifiers}}
+            configuration = Configuration.compile(
+                {"derive_show_calendars": True, "sensors": sensors}
+            )
+            kinds, _ = derived_show_kinds(
+                configuration, UPCOMING_KINDS, source == "all_upcoming"
+            )
+            return kinds
+
+        # The shows calendar only replaces a smaller one if it is fetched anyway
+        assert derived("all_upcoming", ["premiere"]) == []
+        assert derived("upcoming", ["show", "premiere"]) == [
+            TraktKind.SHOW,
+            TraktKind.PREMIERE,
+        ]
+        assert derived("all_upcoming", ["new_show", "premiere"]) == [
+            TraktKind.NEW_SHOW,
+            TraktKind.PREMIERE,
+        ]
+
+    @freeze_time("2022-06-10 12:00:00")
+    def test_derive_show_calendar_timezone(self):
+        def aired(first_aired):
+            return {
+                "first_aired": first_aired,
+                "episode": {"season": 2, "number": 1},
+            }
+
+        # The evening of the last day in New York, then the next day
+        calendar = [
+            aired("2022-06-11T02:00:00.000Z"),
+            aired("2022-06-11T05:00:00.000Z"),
+        ]
+        configuration = {"timezone": "America/New_York", "sensors": {}}
+
+        async def run():
+            hass = HomeAssistant("/tmp")
+            api = build_api(hass, RecordingTransport(), configuration)
+            derived = api.derive_show_calendar(TraktKind.PREMIERE, calendar, 2)
+            await hass.async_stop(force=True)
+            return derived
+
+        assert asyncio.run(run()) == calendar[:1]
+
+    def test_cancelled_refresh(self):
+        """The requests in flight are cancelled with the refresh."""
+        server = RecordingTransport(FakeServer(Library(shows=5)))
+        started, cancelled = [], []
+
+        async def transport(request):
+            started.append(request.url)
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(request.url)
+                raise
+            return await server(request)
+
+        sensors = {"next_to_watch": {"all": {}}, "watchlist": {"movie": {}}}
+
+        async def run():
+            hass = HomeAssistant("/tmp")
+            api = build_api(hass, transport, {"language": "en", "sensors": sensors})
+            refresh = asyncio.ensure_future(api.retrieve_data())
+            while not started:
+                await asyncio.sleep(0)
+            refresh.cancel()
+            try:
+                await refresh
+            except asyncio.CancelledError:
+                pass
+            for _ in range(3):
+                await asyncio.sleep(0)
+            # The tasks left are only cancelled once the loop is closed
+            in_flight = sorted(set(started) - set(cancelled))
+            await hass.async_stop(force=True)
+            return api, in_flight
+
+        api, in_flight = asyncio.run(run())
+
+        assert api._cycle is None
+        assert len(started) > 1
+        assert in_flight == []
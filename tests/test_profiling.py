@@ -0,0 +1,90 @@
+import asyncio
+import cProfile
+import logging
+import pstats
+from pathlib import Path
+
+import pytest
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from benchmarks import payloads
+from benchmarks.fake_server import FakeServer, Library, RecordingTransport
+from benchmarks.refresh import ENTRY_ID, build_api
+from custom_components.trakt_tv.const import DOMAIN
+from custom_components.trakt_tv.models.media import Medias, Movie
+from custom_components.trakt_tv.profiling import (
+    YappiProfiler,
+    function_phase,
+    load_yappi,
+    phase_breakdown,
+)
+from custom_components.trakt_tv.services import async_setup_services
+
+LOGGER = logging.getLogger(__name__)
+
+
+def profile_refresh(config_dir):
+    async def run():
+        hass = HomeAssistant(str(config_dir))
+        transport = RecordingTransport(FakeServer(Library(shows=5)))
+        sensors = {"next_to_watch": {"all": {}}}
+        api = build_api(hass, transport, {"language": "en", "sensors": sensors})
+        coordinator = DataUpdateCoordinator(
+            hass, LOGGER, name="trakt", update_method=api.retrieve_data
+        )
+        hass.data[DOMAIN][ENTRY_ID]["instances"] = {
+            "api": api,
+            "coordinator": coordinator,
+        }
+
+        async_setup_services(hass)
+        result = await hass.services.async_call(
+            DOMAIN, "profile_refresh", {"top": 5}, blocking=True, return_response=True
+        )
+
+        await hass.async_stop(force=True)
+        return result
+
+    return asyncio.run(run())
+
+
+class TestProfiling:
+    def test_function_phase(self):
+        module = "/config/custom_components/trakt_tv/models/media.py"
+
+        assert function_phase((module, 1, "to_homeassistant")) == "render"
+        assert function_phase((module, 1, "from_trakt")) == "model_build"
+        assert function_phase((module, 1, "intern_name")) is None
+        assert function_phase(("~", 0, "<built-in method builtins.sorted>")) is None
+
+    def test_phase_breakdown(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        medias = Medias(
+            [Movie.from_trakt(data) for data in payloads.many(payloads.movie, 200)]
+        )
+        medias.to_homeassistant()
+        profile.disable()
+
+        phases = phase_breakdown(pstats.Stats(profile))
+
+        assert phases["model_build"] > 0
+        assert phases["render"] > 0
+        assert phases["fetch"] == 0
+
+    def test_profile_refresh(self, tmp_path):
+        result = profile_refresh(tmp_path)
+
+        assert result["success"]
+        assert result["profiler"] == "cprofile"
+        assert Path(result["profile"]).parent == tmp_path
+        assert "Phases (seconds)" in Path(result["summary"]).read_text()
+        assert result["phases"]["fetch"] > 0
+        assert result["phases"]["model_build"] > 0
+
+    @pytest.mark.skipif(load_yappi() is not None, reason="yappi is installed")
+    def test_yappi_missing(self):
+        with pytest.raises(HomeAssistantError):
+            YappiProfiler()
@@ -0,0 +1,117 @@
+from custom_components.trakt_tv.apis.projection import project, project_entries
+from custom_components.trakt_tv.models.cache import NEGATIVE_ENTRY
+from custom_components.trakt_tv.models.media import Show
+
+PROGRESS = {
+    "aired": 10,
+    "completed": 8,
+    "last_watched_at": "2023-01-01T00:00:00.000Z",
+    "seasons": [{"number": 1, "episodes": [{"number": 1, "completed": True}]}],
+    "next_episode": {
+        "season": 1,
+        "number": 9,
+        "title": "Episode 9",
+        "ids": {"trakt": 9},
+        "number_abs": None,
+        "overview": "A long overview.",
+    },
+}
+
+CALENDAR = [
+    {
+        "first_aired": "2023-01-01T00:00:00.000Z",
+        "episode": {
+            "season": 2,
+            "number": 1,
+            "title": "Premiere",
+            "ids": {"trakt": 20},
+            "episode_type": "season_premiere",
+            "overview": "A long overview.",
+            "comment_count": 3,
+        },
+        "show": {
+            "title": "Dark",
+            "year": 2017,
+            "ids": {"trakt": 2, "slug": "dark", "tmdb": 70523},
+            "overview": "A family saga.",
+            "network": "Netflix",
+            "aired_episodes": 26,
+            "available_translations": ["de", "en"],
+            "images": {
+                "poster": ["media.trakt.tv/images/dark-1.jpg", "media.trakt.tv/2.jpg"],
+                "fanart": [],
+                "logo": ["media.trakt.tv/images/dark-logo.png"],
+            },
+        },
+    }
+]
+
+
+class TestProjection:
+    def test_progress(self):
+        assert project("progress", PROGRESS) == {
+            "aired": 10,
+            "completed": 8,
+            "next_episode": {
+                "season": 1,
+                "number": 9,
+                "title": "Episode 9",
+                "ids": {"trakt": 9},
+            },
+        }
+
+    def test_calendar_keeps_the_fields_of_the_models(self):
+        projected = project("calendars", CALENDAR)
+
+        assert "available_translations" not in projected[0]["show"]
+        assert "comment_count" not in projected[0]["episode"]
+        assert projected[0]["episode"]["episode_type"] == "season_premiere"
+        assert projected[0]["show"]["images"] == {
+            "poster": ["media.trakt.tv/images/dark-1.jpg"]
+        }
+        assert Show.from_trakt(projected[0]) == Show.from_trakt(CALENDAR[0])
+
+    def test_projection_is_idempotent(self):
+        projected = project("calendars", CALENDAR)
+
+        assert project("calendars", projected) == projected
+        assert project("progress", project("progress", PROGRESS)) == project(
+            "progress", PROGRESS
+        )
+
+    def test_tmdb_keeps_the_trailers(self):
+        data = {
+            "title": "Dune",
+            "genres": [{"id": 878, "name": "Science Fiction"}],
+            "credits": {"cast": [{"name": "Timothée Chalamet"}]},
+            "videos": {
+                "results": [
+                    {"site": "YouTube", "type": "Teaser", "key": "a"},
+                    {"site": "YouTube", "type": "Trailer", "key": "b", "size": 1080},
+                ]
+            },
+        }
+
+        assert project("tmdb", data) == {
+            "title": "Dune",
+            "genres": [{"name": "Science Fiction"}],
+            "videos": {"results": [{"site": "YouTube", "type": "Trailer", "key": "b"}]},
+        }
+
+    def test_unknown_family_is_kept(self):
+        stats = {"movies": {"plays": 1}}
+
+        assert project("stats", stats) is stats
+
+    def test_persisted_entries(self):
+        entries = {
+            "progress:shows/1/progress/watched": PROGRESS,
+            "progress:shows/1/progress/watched_time": 1.0,
+            "progress:shows/2/progress/watched": NEGATIVE_ENTRY,
+        }
+
+        projected = project_entries(entries)
+
+        assert "seasons" not in projected["progress:shows/1/progress/watched"]
+        assert projected["progress:shows/1/progress/watched_time"] == 1.0
+        assert projected["progress:shows/2/progress/watched"] == NEGATIVE_ENTRY
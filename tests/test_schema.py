@@ -1,3 +1,7 @@
+import subprocess
+import sys
+
+from custom_components.trakt_tv.const import DOMAIN
 from custom_components.trakt_tv.schema import configuration_schema, dictionary_to_schema
 
 
@@ -6,5 +10,19 @@ class TestSchema:
         schema = dictionary_to_schema({"name": str})
         schema({"name": "john"})
 
-    def test_configuration_schema(self, configuration):
-        configuration_schema(configuration.conf)
+    def test_configuration_schema(self, yaml):
+        configuration_schema(yaml[DOMAIN]["configuration"])
+
+    def test_import_defers_heavy_work(self):
+        # A fresh interpreter, the other tests already built the schema
+        code = (
+            "import sys, custom_components.trakt_tv;"
+            "from custom_components.trakt_tv.schema import domain_configuration_schema;"
+            "print(domain_configuration_schema.cache_info().currsize,"
+            " 'numpy' in sys.modules, 'dateutil' in sys.modules)"
+        )
+        process = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+
+        assert process.stdout.split() == ["0", "False", "False"]
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from homeassistant.core import HomeAssistant
+
+from benchmarks.fake_server import FakeServer, Library, RecordingTransport
+from benchmarks.refresh import build_api
+from custom_components.trakt_tv.tracing import (
+    Tracer,
+    current_span,
+    span,
+    traced,
+    with_context,
+)
+
+
+def read_spans(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+class TestTracing:
+    def test_nested_spans(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        tracer = Tracer(str(path))
+
+        async def fetch():
+            with span("decode", bytes=10):
+                pass
+            return "watched"
+
+        async def run():
+            return await traced("refresh", traced("fetch", fetch()), tracer)
+
+        assert asyncio.run(run()) == "watched"
+
+        decode, fetch, refresh = read_spans(path)
+        assert refresh["parent"] is None
+        assert fetch["parent"] == refresh["id"]
+        assert decode["parent"] == fetch["id"]
+        assert decode["attributes"] == {"bytes": 10}
+        assert {decode["trace"], fetch["trace"]} == {refresh["trace"]}
+        assert refresh["wall"] >= fetch["wall"] >= decode["wall"]
+
+    def test_untraced_section(self):
+        with span("render") as opened:
+            assert opened is None
+        assert current_span.get() is None
+
+    def test_error(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        tracer = Tracer(str(path))
+
+        async def fail():
+            raise ValueError("unreachable")
+
+        async def run():
+            try:
+                await traced("refresh", fail(), tracer)
+            except ValueError:
+                pass
+
+        asyncio.run(run())
+
+        (refresh,) = read_spans(path)
+        assert "unreachable" in refresh["error"]
+
+    def test_stall(self, caplog):
+        tracer = Tracer(stall_threshold=0.01)
+
+        async def block():
+            await asyncio.sleep(0)
+            with span("render", sensor="watchlist"):
+                # Home Assistant forbids time.sleep on the event loop
+                blocked_until = time.perf_counter() + 0.02
+                while time.perf_counter() < blocked_until:
+                    pass
+
+        async def run():
+            await traced("refresh", block(), tracer)
+
+        with caplog.at_level(logging.WARNING):
+            asyncio.run(run())
+
+        stalls = [r.getMessage() for r in caplog.records if "blocked" in r.message]
+        assert len(stalls) == 1
+        assert stalls[0].startswith("refresh > render blocked the event loop for")
+        assert "watchlist" in stalls[0]
+
+    def test_executor_context(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        tracer = Tracer(str(path))
+
+        def decode():
+            with span("decode"):
+                time.sleep(0.01)
+
+        async def run():
+            with ThreadPoolExecutor(1) as pool:
+                loop = asyncio.get_running_loop()
+                executor = with_context(
+                    lambda function, *args: loop.run_in_executor(pool, function, *args)
+                )
+
+                async def refresh():
+                    await executor(decode)
+
+                await traced("refresh", refresh(), tracer)
+
+        asyncio.run(run())
+
+        decode_span, refresh = read_spans(path)
+        assert decode_span["parent"] == refresh["id"]
+        assert decode_span["on_loop"] is False
+        assert refresh["on_loop"] is True
+
+    def test_refresh_trace(self, tmp_path):
+        async def run():
+            hass = HomeAssistant(str(tmp_path))
+            transport = RecordingTransport(FakeServer(Library(shows=3)))
+            tracing = {"path": "traces.jsonl", "stall_threshold": 100}
+            sensors = {"next_to_watch": {"all": {}}}
+            api = build_api(
+                hass,
+                transport,
+                {"language": "en", "tracing": tracing, "sensors": sensors},
+            )
+            await api.retrieve_data()
+            await hass.async_block_till_done()
+            await hass.async_stop(force=True)
+
+        asyncio.run(run())
+
+        spans = read_spans(tmp_path / "traces.jsonl")
+        by_id = {item["id"]: item for item in spans}
+        names = {item["name"] for item in spans}
+        (root,) = [item for item in spans if item["parent"] is None]
+
+        assert root["name"] == "refresh"
+        assert {"source", "fetch_next_to_watch", "http", "decode"} <= names
+        assert {"from_trakt", "get_more_information"} <= names
+        assert len({item["trace"] for item in spans}) == 1
+        assert all(item["parent"] in by_id for item in spans if item is not root)
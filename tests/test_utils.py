@@ -1,12 +1,25 @@
+import asyncio
+import json
+
 import pytest
 from freezegun import freeze_time
 
-from custom_components.trakt_tv.exception import TraktException
+from custom_components.trakt_tv.exception import TraktException, TraktNotFoundException
+from custom_components.trakt_tv.models.cache import (
+    CACHE_POLICIES,
+    CachePolicy,
+    endpoint_family,
+)
+from custom_components.trakt_tv.sensor import SCAN_INTERVAL
 from custom_components.trakt_tv.utils import (
+    JsonArrayDecoder,
+    cache_fetch,
     cache_insert,
     cache_retrieve,
+    cache_snapshot,
     compute_calendar_args,
     deserialize_json,
+    map_offloaded,
     split,
 )
 
@@ -34,6 +47,27 @@ class TestUtils:
         dictionary = deserialize_json(json)
         assert dictionary["name"] == "Trakt"
 
+    def test_deserialize_json_bytes(self):
+        assert deserialize_json(b'{"name":"Trakt"}') == {"name": "Trakt"}
+
+    def test_json_array_decoder(self):
+        document = '[{"title": "Dune", "genres": ["é"]}, 2, [3], 1234]'.encode()
+        decoder = JsonArrayDecoder()
+
+        items = []
+        for start in range(0, len(document), 3):
+            items += decoder.feed(document[start : start + 3])
+
+        assert decoder.close() == json.loads(document)
+        assert items[:3] == [{"title": "Dune", "genres": ["é"]}, 2, [3]]
+
+    def test_json_array_decoder_object(self):
+        decoder = JsonArrayDecoder()
+        decoder.feed(b'{"name": ')
+        decoder.feed(b'"Trakt"}')
+
+        assert decoder.close() == {"name": "Trakt"}
+
     def test_deserialize_json_error(self):
         json = '{"name":"}'
         with pytest.raises(TraktException):
@@ -71,3 +105,94 @@ class TestUtils:
         value = cache_retrieve(cache, "key")
 
         assert value == None
+
+    @freeze_time("2022-03-13 00:10:00")
+    def test_cache_retrieve_expired_in_grace(self):
+        cache = {"key": 10, "key_time": 1647129600.0}
+
+        value = cache_retrieve(cache, "key", expiration=60, grace=3600)
+
+        assert value == None
+        assert cache == {"key": 10, "key_time": 1647129600.0}
+
+    def test_cache_fetch_stale_on_error(self):
+        cache = {"key": 10, "key_time": 0.0}
+
+        async def fetch():
+            raise TraktException("Trakt is down")
+
+        policy = CachePolicy(ttl=0, stale=10**10)
+        value = asyncio.run(cache_fetch(cache, "key", fetch, policy=policy))
+
+        assert value == 10
+
+    def test_cache_fetch_negative_entry(self):
+        cache = {}
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            raise TraktNotFoundException("HTTP 404")
+
+        policy = CachePolicy(ttl=60, negative=60)
+        for _ in range(2):
+            with pytest.raises(TraktNotFoundException):
+                asyncio.run(cache_fetch(cache, "key", fetch, policy=policy))
+
+        assert len(calls) == 1
+
+    def test_map_offloaded(self):
+        jobs = []
+
+        async def executor(function, *args):
+            jobs.append(function)
+            return function(*args)
+
+        small = asyncio.run(map_offloaded(str, [1, 2], executor, threshold=3))
+        large = asyncio.run(map_offloaded(str, [1, 2, 3], executor, threshold=3))
+
+        assert small == ["1", "2"]
+        assert large == ["1", "2", "3"]
+        assert len(jobs) == 1
+
+    @freeze_time("2022-03-13")
+    def test_cache_snapshot(self):
+        cache = {
+            "tmdb:movie/1": 1,
+            "tmdb:movie/1_time": 1647129600.0,
+            "sync:sync/watched/movies": 2,
+            "sync:sync/watched/movies_time": 1647129600.0,
+        }
+        policies = {
+            "tmdb": CachePolicy(ttl=60, persist=True),
+            "sync": CachePolicy(ttl=60),
+        }
+
+        assert cache_snapshot(cache, policies) == {
+            "tmdb:movie/1": 1,
+            "tmdb:movie/1_time": 1647129600.0,
+        }
+
+    def test_user_activity_is_fresh_on_next_refresh(self):
+        # Watching an episode or adding a media to the watchlist shows on the next
+        # refresh of the sensors
+        urls = [
+            "sync/watched/shows",
+            "shows/1/progress/watched",
+            "users/me/watchlist/movies/rank",
+        ]
+        for url in urls:
+            policy = CACHE_POLICIES[endpoint_family(url)]
+            assert policy.ttl < SCAN_INTERVAL.total_seconds()
+
+    def test_endpoint_family(self):
+        assert endpoint_family("calendars/my/shows/2022-03-12/33") == "calendars"
+        assert endpoint_family("shows/1/progress/watched") == "progress"
+        assert endpoint_family("shows/1/seasons/1/episodes/2") == "episode_info"
+        assert endpoint_family("users/hidden/dropped?type=show") == "hidden"
+        assert endpoint_family("sync/watched/shows") == "sync"
+        assert endpoint_family("movies/anticipated?limit=3") == "anticipated"
+        assert endpoint_family("users/me/watchlist/movies/rank") == "watchlist"
+        assert endpoint_family("lists/123/items?extended=full") == "lists"
+        assert endpoint_family("users/me/stats") == "stats"
+        assert endpoint_family("users/settings") == "default"